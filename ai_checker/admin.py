@@ -3,25 +3,23 @@ from .models import Question, Answer, QuestionReaction, AnswerReaction
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'created_at', 'get_answers_count', 'get_reactions_count']
+    list_display = ['title', 'author', 'created_at', 'answers_count', 'reactions_count']
     list_filter = ['created_at', 'author']
     search_fields = ['title', 'content', 'author__username']
-    readonly_fields = ['created_at', 'updated_at']
-    
-    def get_answers_count(self, obj):
-        return obj.get_answers_count()
-    get_answers_count.short_description = 'Answers'
-    
-    def get_reactions_count(self, obj):
-        return obj.get_reactions_count()
-    get_reactions_count.short_description = 'Reactions'
+    readonly_fields = [
+        'created_at', 'updated_at', 'answers_count', 'reactions_count',
+        'like_count', 'love_count', 'helpful_count', 'confused_count',
+    ]
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
-    list_display = ['question', 'author', 'created_at', 'content_preview']
+    list_display = ['question', 'author', 'created_at', 'content_preview', 'reactions_count']
     list_filter = ['created_at', 'author']
     search_fields = ['content', 'author__username', 'question__title']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = [
+        'created_at', 'updated_at', 'reactions_count',
+        'like_count', 'helpful_count', 'disagree_count',
+    ]
     
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
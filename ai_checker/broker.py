@@ -0,0 +1,179 @@
+"""
+Publish/subscribe of notification events for the live notification stream.
+
+Subscribers are SSE connections (see views.notification_stream), each with
+an asyncio queue on its own event loop. publish() may be called from any
+thread: it hands the event to this process's subscribers with
+call_soon_threadsafe and appends it to a file channel shared by every worker
+on the host. A background thread in each worker tails the file and delivers
+events published by the other workers, so no extra service is needed.
+Without a channel path only subscribers in the publishing process are
+reached.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+
+class FileChannel:
+    """Append-only JSON-lines file that several processes write to and tail"""
+
+    def __init__(self, path, max_bytes=1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = None
+        self._inode = None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def append(self, message):
+        # One write() of a short line to an O_APPEND file lands whole
+        line = (json.dumps(message) + '\n').encode()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            # Readers notice the new inode and start on the fresh file
+            try:
+                os.replace(self.path, self.path + '.old')
+            except FileNotFoundError:
+                pass
+
+    def read_new(self):
+        """Messages appended since the last call; the first call skips the backlog"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            if self._inode is None:
+                # Nothing to skip: whatever gets written from now on is new
+                self._inode = 0
+            return []
+        messages = []
+        if inode != self._inode:
+            first_open = self._inode is None
+            if self._file is not None:
+                # Rotated: finish the old file before moving on
+                messages += self._read_lines()
+                self._file.close()
+            self._file = open(self.path, 'rb')
+            self._inode = inode
+            if first_open:
+                self._file.seek(0, os.SEEK_END)
+        return messages + self._read_lines()
+
+    def _read_lines(self):
+        messages = []
+        while True:
+            position = self._file.tell()
+            line = self._file.readline()
+            if not line.endswith(b'\n'):
+                # Partial line still being written: read it next time
+                self._file.seek(position)
+                break
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                continue
+        return messages
+
+
+class NotificationBroker:
+    def __init__(self, channel_path=None, poll_interval=0.5, queue_size=100):
+        self.channel = FileChannel(channel_path) if channel_path else None
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._tailer = None
+
+    def publish(self, user_id, event, data):
+        """Send an event to every stream the user has open, in any worker"""
+        self._deliver(user_id, event, data)
+        if self.channel is not None:
+            try:
+                self.channel.append({'origin': self._origin, 'user_id': user_id, 'event': event, 'data': data})
+            except OSError as e:
+                print(f"Notification channel write failed: {e}")
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        """Queue of (event, data) for the user's events, registered while the block runs"""
+        queue = asyncio.Queue(self.queue_size)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        self._start_tailer()
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def _deliver(self, user_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, (event, data))
+            except RuntimeError:
+                # That subscriber's loop has closed
+                pass
+
+    def _start_tailer(self):
+        if self.channel is None:
+            return
+        with self._lock:
+            if self._tailer is None:
+                self._tailer = threading.Thread(target=self._tail, name='notification-channel', daemon=True)
+                self._tailer.start()
+
+    def _tail(self):
+        self.channel.read_new()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                messages = self.channel.read_new()
+            except OSError as e:
+                print(f"Notification channel read failed: {e}")
+                continue
+            for message in messages:
+                if message.get('origin') != self._origin:
+                    self._deliver(message['user_id'], message['event'], message['data'])
+
+
+def _offer(queue, item):
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        # A stalled client misses events; the next one carries the current count
+        pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The broker for this process, built from settings on first use"""
+    global _broker
+    if _broker is None:
+        from django.conf import settings
+
+        with _broker_lock:
+            if _broker is None:
+                _broker = NotificationBroker(getattr(settings, 'NOTIFICATION_CHANNEL_PATH', None) or None)
+    return _broker
@@ -1,4 +1,8 @@
 from django import forms
+from django.conf import settings
+from PIL import Image
+
+from . import images
 from .models import Question, Answer
 
 class QuestionForm(forms.ModelForm):
@@ -26,6 +30,22 @@ class QuestionForm(forms.ModelForm):
             'content': 'Question Details',
             'image': 'Upload Image (Optional)'
         }
+    
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        max_mb = getattr(settings, 'QA_IMAGE_MAX_UPLOAD_MB', 10)
+        if image and image.size > max_mb * 1024 * 1024:
+            raise forms.ValidationError(f'Images must be smaller than {max_mb} MB.')
+        # A new upload carries the Pillow image the field opened to validate it
+        opened = getattr(image, 'image', None)
+        if opened is not None:
+            try:
+                images.check_pixels(opened)
+            except Image.DecompressionBombError:
+                raise forms.ValidationError(
+                    f'Images must be at most {images.max_pixels():,} pixels (width × height).'
+                )
+        return image
 
 class AnswerForm(forms.ModelForm):
     class Meta:
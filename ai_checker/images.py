@@ -0,0 +1,228 @@
+"""
+Processing of images attached to Q&A questions.
+
+After a question with a new image is committed, a small thread pool:
+
+- applies the EXIF orientation, scales the original down to
+  QA_IMAGE_MAX_DIMENSION and re-encodes it without any metadata;
+- writes a resized copy at each of QA_IMAGE_WIDTHS narrower than the image,
+  as JPEG (PNG when it has transparency) and as WebP;
+- records them in Question.image_variants, which the templates turn into
+  srcset attributes.
+
+The request that uploaded the image never waits for any of this; until it
+finishes the original is served as before.
+
+Images over max_pixels() are refused by the upload form and by process().
+When a question's image is cleared or replaced, the earlier upload and all
+of its variants are deleted once the save commits.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def max_dimension():
+    return getattr(settings, 'QA_IMAGE_MAX_DIMENSION', 2048)
+
+
+def widths():
+    return getattr(settings, 'QA_IMAGE_WIDTHS', (320, 640, 1080))
+
+
+def max_pixels():
+    """Largest width x height accepted, or None for no limit"""
+    return getattr(settings, 'QA_IMAGE_MAX_PIXELS', Image.MAX_IMAGE_PIXELS)
+
+
+def check_pixels(image):
+    """Raise Image.DecompressionBombError if the opened image is over max_pixels()"""
+    limit = max_pixels()
+    if limit and image.width * image.height > limit:
+        raise Image.DecompressionBombError(
+            f'Image size ({image.width * image.height} pixels) exceeds limit of {limit} pixels'
+        )
+
+
+def needs_processing(question):
+    return bool(question.image) and question.image.name != question.image_variants.get('source')
+
+
+def schedule(question_id):
+    """Process the question's image in the background once the transaction commits"""
+    transaction.on_commit(lambda: _get_executor().submit(_process_in_background, question_id))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'QA_IMAGE_WORKERS', 2),
+                thread_name_prefix='qa-images',
+            )
+        return _executor
+
+
+def _process_in_background(question_id):
+    from django.db import connection
+
+    try:
+        process(question_id)
+    except Exception as e:
+        print(f"Image processing failed for question {question_id}: {e}")
+    finally:
+        connection.close()
+
+
+def process(question_id):
+    """Rewrite the original and build its variants; returns the new image_variants"""
+    from .models import Question
+
+    question = Question.objects.only('image', 'image_variants').get(pk=question_id)
+    if not question.image:
+        return {}
+    storage = question.image.storage
+    old_name = question.image.name
+    old_files = _variant_files(question.image_variants)
+
+    with storage.open(old_name, 'rb') as f:
+        image = Image.open(f)
+        # Only the header has been read so far
+        check_pixels(image)
+        image.load()
+    # Rotate pixels to match EXIF before the EXIF is dropped
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    image.thumbnail((max_dimension(), max_dimension()), Image.LANCZOS)
+    stem = os.path.splitext(old_name)[0]
+    # Saving the original afresh writes no EXIF, ICC profile or comments
+    source = storage.save(f'{stem}.{_extension(fallback)}', ContentFile(_encode(image, fallback)))
+
+    variants = []
+    source_stem = os.path.splitext(source)[0]
+    for width in sorted(widths()):
+        if width >= image.width:
+            break
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        name = f'{source_stem}-{width}'
+        variants.append({
+            'width': width,
+            fallback: storage.save(f'{name}.{_extension(fallback)}', ContentFile(_encode(resized, fallback))),
+            'webp': storage.save(f'{name}.webp', ContentFile(_encode(resized, 'webp'))),
+        })
+    variants.append({
+        'width': image.width,
+        fallback: source,
+        'webp': storage.save(f'{source_stem}.webp', ContentFile(_encode(image, 'webp'))),
+    })
+
+    image_variants = {
+        'source': source,
+        'width': image.width,
+        'height': image.height,
+        'format': fallback,
+        'variants': variants,
+    }
+    # update() rather than save(): nothing else about the question changed
+    updated = Question.objects.filter(pk=question_id, image=old_name).update(
+        image=source, image_variants=image_variants,
+    )
+    if not updated:
+        # The image was replaced meanwhile; that upload schedules its own run
+        for name in _variant_files(image_variants) | {source}:
+            storage.delete(name)
+        return {}
+
+    for name in (old_files | {old_name}) - _variant_files(image_variants) - {source}:
+        storage.delete(name)
+    return image_variants
+
+
+def discard_previous(question, previous_name):
+    """
+    Before a question whose image was previous_name is saved with another
+    image (or none), drop its variants and delete the earlier files once the
+    save commits. The row is re-read because a background run may have
+    replaced the upload with its processed copy since the question was loaded.
+    """
+    row = type(question).objects.filter(pk=question.pk).values('image', 'image_variants').first() or {}
+    stale = (
+        {previous_name, row.get('image') or ''}
+        | _variant_files(question.image_variants)
+        | _variant_files(row.get('image_variants') or {})
+    ) - {question.image.name or '', ''}
+    # Written here because the save's update_fields are already fixed
+    question.image_variants = {}
+    type(question).objects.filter(pk=question.pk).update(image_variants={})
+    if not stale:
+        return
+    storage = question.image.storage
+
+    def delete_files():
+        for name in stale:
+            storage.delete(name)
+
+    transaction.on_commit(delete_files)
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _extension(fmt):
+    return 'jpg' if fmt == 'jpeg' else fmt
+
+
+def _variant_files(image_variants):
+    return {
+        name for variant in image_variants.get('variants', [])
+        for key, name in variant.items() if key != 'width'
+    }
+
+
+def sources(question, display_width=640):
+    """URLs for showing the question's image: src, srcset, webp_srcset, width, height"""
+    if not question.image:
+        return None
+    image_variants = question.image_variants
+    if question.image.name != image_variants.get('source'):
+        # Not processed yet: the original is all there is
+        return {'src': question.image.url, 'srcset': '', 'webp_srcset': '', 'width': None, 'height': None}
+
+    storage = question.image.storage
+    fmt = image_variants['format']
+    variants = image_variants['variants']
+    # Browsers without srcset get the first variant wide enough for the feed
+    fallback = next((v for v in variants if v['width'] >= display_width), variants[-1])
+    return {
+        'src': storage.url(fallback[fmt]),
+        'srcset': ', '.join(f"{storage.url(v[fmt])} {v['width']}w" for v in variants),
+        'webp_srcset': ', '.join(f"{storage.url(v['webp'])} {v['width']}w" for v in variants),
+        'width': image_variants['width'],
+        'height': image_variants['height'],
+    }
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from ai_checker import images
+from ai_checker.models import Question
+
+class Command(BaseCommand):
+    help = (
+        'Downscales and strips question images and writes their resized and WebP '
+        'variants. Only images without up-to-date variants are processed unless --force.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Reprocess every image')
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(image='').exclude(image__isnull=True).only('image', 'image_variants')
+        processed = failed = 0
+        for question in questions.iterator():
+            if not (options['force'] or images.needs_processing(question)):
+                continue
+            try:
+                image_variants = images.process(question.pk)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                failed += 1
+                self.stderr.write(f'Question {question.pk}: {e}')
+                continue
+            processed += 1
+            self.stdout.write(f"Question {question.pk}: {len(image_variants.get('variants', []))} sizes")
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images, {failed} failed'))
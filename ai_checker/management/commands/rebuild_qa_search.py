@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ai_checker import search
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Q&A full-text search table from every question and answer.'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING(
+                'This database has no full-text search table; search uses icontains instead'
+            ))
+            return
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} questions and answers'))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from ai_checker.models import Question, Answer, QuestionReaction, AnswerReaction
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the answer and reaction counters stored on Question and Answer '
+        'from the Answer and reaction rows, fixing any drift.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        question_counts = {
+            'answers_count': Count('answers', distinct=True),
+            'reactions_count': Count('reactions', distinct=True),
+        }
+        for key, _ in QuestionReaction.REACTION_CHOICES:
+            question_counts[f'{key}_count'] = Count(
+                'reactions', filter=Q(reactions__reaction_type=key), distinct=True
+            )
+        answer_counts = {'reactions_count': Count('reactions')}
+        for key, _ in AnswerReaction.REACTION_CHOICES:
+            answer_counts[f'{key}_count'] = Count('reactions', filter=Q(reactions__reaction_type=key))
+
+        fixed_questions = self.repair(Question, question_counts, options)
+        fixed_answers = self.repair(Answer, answer_counts, options)
+
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {fixed_questions} questions, {fixed_answers} answers'
+        ))
+
+    def repair(self, model, counts, options):
+        """Compare stored counters with recounted ones, one pk-ordered chunk at a time"""
+        fields = list(counts)
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', flat=True)[:options['chunk_size']]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            # Stored values and recounts side by side, one query per chunk
+            rows = model.objects.filter(pk__in=pks).order_by().values('pk', *fields).annotate(
+                **{f'actual_{field}': count for field, count in counts.items()}
+            )
+            changed = []
+            for row in rows:
+                drift = {
+                    field: row[f'actual_{field}'] for field in fields
+                    if row[field] != row[f'actual_{field}']
+                }
+                if drift:
+                    self.stdout.write(f'{model.__name__} {row["pk"]}: {drift}')
+                    changed.append(model(pk=row['pk'], **{field: row[f'actual_{field}'] for field in fields}))
+
+            fixed += len(changed)
+            if changed and not options['dry_run']:
+                with transaction.atomic():
+                    model.objects.bulk_update(changed, fields)
+        return fixed
@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk, **filters):
+    counts = (
+        model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by().values(fk).annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    Question = apps.get_model('ai_checker', 'Question')
+    Answer = apps.get_model('ai_checker', 'Answer')
+    QuestionReaction = apps.get_model('ai_checker', 'QuestionReaction')
+    AnswerReaction = apps.get_model('ai_checker', 'AnswerReaction')
+
+    Question.objects.update(
+        answers_count=count_of(Answer, 'question'),
+        reactions_count=count_of(QuestionReaction, 'question'),
+        **{
+            f'{key}_count': count_of(QuestionReaction, 'question', reaction_type=key)
+            for key in ('like', 'love', 'helpful', 'confused')
+        },
+    )
+    Answer.objects.update(
+        reactions_count=count_of(AnswerReaction, 'answer'),
+        **{
+            f'{key}_count': count_of(AnswerReaction, 'answer', reaction_type=key)
+            for key in ('like', 'helpful', 'disagree')
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0003_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='disagree_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='helpful_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='reactions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='answers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='confused_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='helpful_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='love_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='reactions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0004_qa_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-created_at', '-id'], name='question_feed_idx'),
+        ),
+    ]
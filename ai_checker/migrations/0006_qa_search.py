@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:57
+
+from django.db import migrations
+
+SQLITE_TABLE = """
+CREATE VIRTUAL TABLE ai_checker_qa_search USING fts5(
+    kind UNINDEXED, object_id UNINDEXED, question_id UNINDEXED, title, content,
+    tokenize = 'porter unicode61'
+)
+"""
+
+POSTGRESQL_TABLE = [
+    """
+    CREATE TABLE ai_checker_qa_search (
+        id bigserial PRIMARY KEY,
+        kind varchar(10) NOT NULL,
+        object_id bigint NOT NULL,
+        question_id bigint NOT NULL,
+        title text NOT NULL,
+        content text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A') ||
+            setweight(to_tsvector('english', content), 'B')
+        ) STORED,
+        UNIQUE (kind, object_id)
+    )
+    """,
+    "CREATE INDEX ai_checker_qa_search_document ON ai_checker_qa_search USING GIN (document)",
+]
+
+BACKFILL = [
+    """
+    INSERT INTO ai_checker_qa_search (kind, object_id, question_id, title, content)
+    SELECT 'question', id, id, title, content FROM ai_checker_question
+    """,
+    """
+    INSERT INTO ai_checker_qa_search (kind, object_id, question_id, title, content)
+    SELECT 'answer', id, question_id, '', content FROM ai_checker_answer
+    """,
+]
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = [SQLITE_TABLE]
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_TABLE
+    else:
+        # No full-text table; ai_checker.search falls back to icontains
+        return
+    for statement in statements + BACKFILL:
+        schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS ai_checker_qa_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0005_question_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0006_qa_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
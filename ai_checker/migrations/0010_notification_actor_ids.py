@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+def backfill_actor_ids(apps, schema_editor):
+    # Older rows only remember their last few actors; an earlier actor who
+    # reacts again may be counted twice, as before
+    Notification = apps.get_model('ai_checker', 'Notification')
+    for notification in Notification.objects.exclude(recent_actors=[]).only('recent_actors').iterator():
+        notification.actor_ids = [actor['id'] for actor in notification.recent_actors]
+        notification.save(update_fields=['actor_ids'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0009_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_actor_ids, migrations.RunPython.noop),
+    ]
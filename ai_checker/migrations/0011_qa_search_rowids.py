@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:12
+
+from django.db import migrations
+
+# Reindex with the rowids ai_checker.search.row_id() gives each post, so a
+# post's row is deleted by rowid instead of a scan of the UNINDEXED columns
+REINDEX = [
+    'DELETE FROM ai_checker_qa_search',
+    """
+    INSERT INTO ai_checker_qa_search (rowid, kind, object_id, question_id, title, content)
+    SELECT id * 2, 'question', id, id, title, content FROM ai_checker_question
+    """,
+    """
+    INSERT INTO ai_checker_qa_search (rowid, kind, object_id, question_id, title, content)
+    SELECT id * 2 + 1, 'answer', id, question_id, '', content FROM ai_checker_answer
+    """,
+]
+
+
+def reindex_with_rowids(apps, schema_editor):
+    # PostgreSQL finds rows by its (kind, object_id) unique index already
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in REINDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0010_notification_actor_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_with_rowids, migrations.RunPython.noop),
+    ]
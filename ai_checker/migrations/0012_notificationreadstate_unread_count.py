@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_checker', '0011_qa_search_rowids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationreadstate',
+            name='unread_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,39 +1,76 @@
 from django.db import models
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-class Question(models.Model):
+from core.mixins import DirtyFieldsMixin
+
+from . import images, search, unread
+
+# Saves write only changed fields, so a stale instance can't overwrite the counters
+class Question(DirtyFieldsMixin, models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='questions')
     title = models.CharField(max_length=200)
     content = models.TextField()
     image = models.ImageField(upload_to='question_images/', blank=True, null=True)
+    # Resized and WebP copies of image, written by images.process
+    image_variants = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized counters, kept in step by the signals below
+    answers_count = models.PositiveIntegerField(default=0)
+    reactions_count = models.PositiveIntegerField(default=0)
+    like_count = models.PositiveIntegerField(default=0)
+    love_count = models.PositiveIntegerField(default=0)
+    helpful_count = models.PositiveIntegerField(default=0)
+    confused_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the feed (see pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='question_feed_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
     def get_answers_count(self):
-        return self.answers.count()
+        return self.answers_count
     
     def get_reactions_count(self):
-        return self.reactions.count()
+        return self.reactions_count
+    
+    def get_reaction_counts(self):
+        """Reactions per type, e.g. {'like': 3, 'love': 0, ...}"""
+        return {key: getattr(self, f'{key}_count') for key, _ in QuestionReaction.REACTION_CHOICES}
 
-class Answer(models.Model):
+class Answer(DirtyFieldsMixin, models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answers')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='answers')
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized counters, kept in step by the signals below
+    reactions_count = models.PositiveIntegerField(default=0)
+    like_count = models.PositiveIntegerField(default=0)
+    helpful_count = models.PositiveIntegerField(default=0)
+    disagree_count = models.PositiveIntegerField(default=0)
+    
     class Meta:
         ordering = ['created_at']
     
     def __str__(self):
         return f"Answer by {self.author.username} on {self.question.title}"
+    
+    def get_reaction_counts(self):
+        """Reactions per type, e.g. {'like': 3, 'helpful': 1, ...}"""
+        return {key: getattr(self, f'{key}_count') for key, _ in AnswerReaction.REACTION_CHOICES}
 
 class QuestionReaction(models.Model):
     REACTION_CHOICES = [
@@ -87,25 +124,223 @@ class Notification(models.Model):
     reaction_type = models.CharField(max_length=10, blank=True, null=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
+    # Reactions to the same post fold into one unread notification: sender is
+    # the latest actor, recent_actors the last few ({'id', 'name'}, newest first),
+    # actor_ids every distinct actor and actor_count how many there are
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+    actor_ids = models.JSONField(default=list, blank=True)
+    
+    # Notification types that fold together instead of adding rows
+    COALESCED_TYPES = ('question_reaction', 'answer_reaction')
+    RECENT_ACTORS = 3
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread notifications are the recipient's rows above the read watermark
+            models.Index(fields=['recipient', '-id'], name='notification_recipient_idx'),
+        ]
     
     def __str__(self):
         return f"Notification for {self.recipient.username} from {self.sender.username}"
     
+    @classmethod
+    def unread_for(cls, user_id):
+        """The user's notifications above their read watermark and not read one by one"""
+        watermark = NotificationReadState.objects.filter(user_id=user_id).values('last_read_id')[:1]
+        return cls.objects.filter(
+            recipient_id=user_id,
+            id__gt=Coalesce(Subquery(watermark), Value(0)),
+            is_read=False,
+        )
+    
+    @staticmethod
+    def actor_entry(user):
+        return {'id': user.id, 'name': user.get_full_name() or user.username}
+    
+    def add_actor(self, user):
+        """Fold another actor into this notification; someone who already acted is not counted again"""
+        if user.id not in self.actor_ids:
+            self.actor_ids = self.actor_ids + [user.id]
+            self.actor_count += 1
+        others = [actor for actor in self.recent_actors if actor['id'] != user.id]
+        self.recent_actors = [self.actor_entry(user)] + others[:self.RECENT_ACTORS - 1]
+        self.sender = user
+    
+    def get_actors_display(self):
+        """'Alice', 'Alice and Bob' or 'Alice and 41 others'"""
+        names = [actor['name'] for actor in self.recent_actors] or [
+            self.sender.get_full_name() or self.sender.username
+        ]
+        if self.actor_count <= 1:
+            return names[0]
+        if self.actor_count == 2 and len(names) > 1:
+            return f"{names[0]} and {names[1]}"
+        others = self.actor_count - 1
+        return f"{names[0]} and {others} other{'s' if others != 1 else ''}"
+    
     def get_message(self):
+        actors = self.get_actors_display()
         if self.notification_type == 'question_reaction':
+            if self.actor_count > 1:
+                return f"{actors} reacted to your question"
             reaction_emoji = dict(QuestionReaction.REACTION_CHOICES).get(self.reaction_type, '👍')
-            return f"{self.sender.get_full_name() or self.sender.username} reacted {reaction_emoji} to your question"
+            return f"{actors} reacted {reaction_emoji} to your question"
         elif self.notification_type == 'question_answer':
-            return f"{self.sender.get_full_name() or self.sender.username} answered your question"
+            return f"{actors} answered your question"
         elif self.notification_type == 'answer_reaction':
+            if self.actor_count > 1:
+                return f"{actors} reacted to your answer"
             reaction_emoji = dict(AnswerReaction.REACTION_CHOICES).get(self.reaction_type, '👍')
-            return f"{self.sender.get_full_name() or self.sender.username} reacted {reaction_emoji} to your answer"
+            return f"{actors} reacted {reaction_emoji} to your answer"
         return "New notification"
     
     def get_url(self):
         if self.question:
             return f"/ai-checker/question/{self.question.id}/"
-        return "/ai-checker/"
\ No newline at end of file
+        return "/ai-checker/"
+
+
+class NotificationReadState(models.Model):
+    """Per-user read watermark: every notification up to last_read_id counts as read"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_read_state')
+    last_read_id = models.BigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by ai_checker.unread; null until it is next counted
+    unread_count = models.IntegerField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.username} read up to {self.last_read_id}"
+    
+    @classmethod
+    def watermark(cls, user_id):
+        return cls.objects.filter(user_id=user_id).values_list('last_read_id', flat=True).first() or 0
+    
+    @classmethod
+    def mark_all_read(cls, user_id):
+        """Move the watermark past every existing notification with one upsert"""
+        latest_id = Notification.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, last_read_id=latest_id, last_read_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['last_read_id', 'last_read_at'],
+        )
+    
+    @classmethod
+    def annotate_unread(cls, user_id, notifications):
+        """Set .unread on each of the user's notifications; returns them as a list"""
+        watermark = cls.watermark(user_id)
+        notifications = list(notifications)
+        for notification in notifications:
+            notification.unread = not notification.is_read and notification.id > watermark
+        return notifications
+
+
+def adjust_counters(model, pk, **deltas):
+    """Atomically add deltas to counter columns of one row, e.g. answers_count=1"""
+    model.objects.filter(pk=pk).update(**{
+        field: F(field) + delta for field, delta in deltas.items() if delta
+    })
+
+
+def reaction_deltas(old_type, new_type):
+    """Counter changes for a reaction going from old_type to new_type (None = no reaction)"""
+    deltas = {'reactions_count': (new_type is not None) - (old_type is not None)}
+    if old_type != new_type:
+        if old_type is not None:
+            deltas[f'{old_type}_count'] = -1
+        if new_type is not None:
+            deltas[f'{new_type}_count'] = 1
+    return deltas
+
+
+@receiver(post_save, sender=Answer)
+def count_answer_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_counters(Question, instance.question_id, answers_count=1)
+
+
+@receiver(post_delete, sender=Answer)
+def count_answer_deleted(sender, instance, **kwargs):
+    adjust_counters(Question, instance.question_id, answers_count=-1)
+
+
+@receiver(post_save, sender=Question)
+def index_question_for_search(sender, instance, **kwargs):
+    search.index_question(instance)
+
+
+@receiver(post_init, sender=Question)
+@receiver(post_save, sender=Question)
+def remember_image(sender, instance, **kwargs):
+    # The image the row holds, as of post_save because a new upload only gets
+    # its final name while saving; read from __dict__ so a deferred field isn't loaded
+    if 'image' in instance.__dict__:
+        image = instance.__dict__['image']
+        instance._saved_image = getattr(image, 'name', image) or ''
+
+
+@receiver(pre_save, sender=Question)
+def discard_previous_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_saved_image', None)
+    if instance._state.adding or previous is None or 'image' not in instance.__dict__:
+        return
+    if (instance.image.name or '') != previous:
+        images.discard_previous(instance, previous)
+
+
+@receiver(post_save, sender=Question)
+def process_question_image(sender, instance, **kwargs):
+    if images.needs_processing(instance):
+        images.schedule(instance.pk)
+
+
+@receiver(post_save, sender=Answer)
+def index_answer_for_search(sender, instance, **kwargs):
+    search.index_answer(instance)
+
+
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Answer)
+def unindex_for_search(sender, instance, **kwargs):
+    search.remove(sender.__name__.lower(), instance.pk)
+
+
+@receiver(post_init, sender=QuestionReaction)
+@receiver(post_init, sender=AnswerReaction)
+def remember_reaction_type(sender, instance, **kwargs):
+    # The type the counters include for this row; read from __dict__ so a
+    # deferred field isn't loaded here
+    instance._counted_type = instance.__dict__.get('reaction_type')
+
+
+@receiver(post_save, sender=QuestionReaction)
+@receiver(post_save, sender=AnswerReaction)
+def count_reaction_saved(sender, instance, created, **kwargs):
+    old_type = None if created else instance._counted_type
+    if old_type != instance.reaction_type:
+        target, pk = _reaction_target(instance)
+        adjust_counters(target, pk, **reaction_deltas(old_type, instance.reaction_type))
+    instance._counted_type = instance.reaction_type
+
+
+@receiver(post_delete, sender=QuestionReaction)
+@receiver(post_delete, sender=AnswerReaction)
+def count_reaction_deleted(sender, instance, **kwargs):
+    target, pk = _reaction_target(instance)
+    adjust_counters(target, pk, **reaction_deltas(instance._counted_type or instance.reaction_type, None))
+
+
+def _reaction_target(reaction):
+    if isinstance(reaction, QuestionReaction):
+        return Question, reaction.question_id
+    return Answer, reaction.answer_id
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    # Whether it was still unread depends on the watermark; recount on next read
+    if not instance.is_read:
+        unread.invalidate(instance.recipient_id)
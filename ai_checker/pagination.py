@@ -0,0 +1,60 @@
+"""
+Keyset pagination for the Q&A feed.
+
+Pages are ordered newest first on (created_at, id) and the next page starts
+strictly after the last row shown, so every page is one index range scan no
+matter how deep the reader has scrolled and nothing is ever counted. The
+position travels as an opaque URL-safe cursor.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+# Range of a 64-bit primary key; anything outside it can't come from encode_cursor
+MAX_PK = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj):
+    payload = json.dumps([obj.created_at.isoformat(), obj.pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor made by encode_cursor"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(payload)
+        created_at, pk = datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, ValueError, TypeError, OverflowError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from e
+    if not 0 < pk <= MAX_PK or timezone.is_naive(created_at) == settings.USE_TZ:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+    return created_at, pk
+
+
+def keyset_page(queryset, cursor=None, per_page=10):
+    """One page of queryset newest first, after cursor; returns (items, next cursor or None)"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # created_at <= bound first so the index seek starts at the cursor
+        queryset = queryset.filter(
+            Q(created_at__lte=created_at),
+            Q(created_at__lt=created_at) | Q(id__lt=pk),
+        )
+
+    # One extra row tells whether another page exists
+    items = list(queryset[:per_page + 1])
+    if len(items) > per_page:
+        items = items[:per_page]
+        return items, encode_cursor(items[-1])
+    return items, None
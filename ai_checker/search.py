@@ -0,0 +1,242 @@
+"""
+Full-text search over Q&A questions and answers.
+
+Every question and answer has one row in the ai_checker_qa_search table
+(kind, object_id, question_id, title, content), written in the same
+transaction as the post by the signals in models.py. Migration 0006 creates
+the table for the database in use:
+
+- SQLite: an FTS5 virtual table (porter stemming), ranked with bm25(). Rows
+  are found by a rowid derived from (kind, object_id), see row_id().
+- PostgreSQL: a plain table with a weighted tsvector column and a GIN index,
+  ranked with ts_rank().
+
+Other databases get no table and search() falls back to icontains. On
+SQLite and PostgreSQL the last word of a query matches as a prefix.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+TABLE = 'ai_checker_qa_search'
+
+# Titles count for more than body text in the ranking
+TITLE_WEIGHT = 4.0
+SNIPPET_WORDS = 24
+# A half-typed last word is also tried without up to STEM_CUT of its last
+# letters, keeping at least MIN_STEM (see _prefix_terms)
+MIN_STEM = 4
+STEM_CUT = 4
+
+# Highlight markers, swapped for <mark> once the text has been escaped
+_START, _STOP = '\x02', '\x03'
+_markers = re.compile(f'[{_START}{_STOP}]')
+_words = re.compile(r'\w+')
+
+SearchHit = namedtuple('SearchHit', [
+    'kind', 'object_id', 'question_id', 'question_title', 'title_html', 'snippet_html', 'score',
+])
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _clean(text):
+    return _markers.sub('', text or '')
+
+
+def index_question(question):
+    _replace('question', question.pk, question.pk, question.title, question.content)
+
+
+def index_answer(answer):
+    _replace('answer', answer.pk, answer.question_id, '', answer.content)
+
+
+def row_id(kind, object_id):
+    """The FTS5 rowid of a post: questions even, answers odd"""
+    return object_id * 2 + (kind == 'answer')
+
+
+def remove(kind, object_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        _delete(cursor, kind, object_id)
+
+
+def _delete(cursor, kind, object_id):
+    if connection.vendor == 'sqlite':
+        # kind and object_id are UNINDEXED in FTS5; filtering on them scans the table
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [row_id(kind, object_id)])
+    else:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE kind = %s AND object_id = %s', [kind, object_id])
+
+
+def _replace(kind, object_id, question_id, title, content):
+    if not is_supported():
+        return
+    values = [kind, object_id, question_id, _clean(title), _clean(content)]
+    with connection.cursor() as cursor:
+        _delete(cursor, kind, object_id)
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                f'INSERT INTO {TABLE} (rowid, kind, object_id, question_id, title, content) '
+                f'VALUES (%s, %s, %s, %s, %s, %s)',
+                [row_id(kind, object_id)] + values,
+            )
+        else:
+            cursor.execute(
+                f'INSERT INTO {TABLE} (kind, object_id, question_id, title, content) VALUES (%s, %s, %s, %s, %s)',
+                values,
+            )
+
+
+def rebuild():
+    """Reindex every question and answer; returns the number of rows indexed"""
+    from .models import Question, Answer
+
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    count = 0
+    for question in Question.objects.only('title', 'content').iterator():
+        index_question(question)
+        count += 1
+    for answer in Answer.objects.only('question_id', 'content').iterator():
+        index_answer(answer)
+        count += 1
+    return count
+
+
+def search(query, limit=20):
+    """Best hits for query, at most one per question, best first"""
+    if not _words.search(query):
+        return []
+    if connection.vendor == 'sqlite':
+        run = _search_sqlite
+    elif connection.vendor == 'postgresql':
+        run = _search_postgresql
+    else:
+        return _search_fallback(query, limit)
+    rows = run(query, limit * 3)
+    if not rows and len(_words.findall(query)[-1]) > MIN_STEM:
+        # Try the stems of the last word only when it finds nothing as typed
+        rows = run(query, limit * 3, stems=True)
+
+    hits = []
+    seen = set()
+    for kind, object_id, question_id, question_title, title, snippet, score in rows:
+        if question_id in seen:
+            continue
+        seen.add(question_id)
+        hits.append(SearchHit(
+            kind, object_id, question_id, question_title,
+            _highlight(title) if kind == 'question' else escape(question_title),
+            _highlight(snippet), score,
+        ))
+        if len(hits) == limit:
+            break
+    return hits
+
+
+def _highlight(text):
+    return mark_safe(escape(text or '').replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def _prefix_terms(word, stems):
+    """
+    (term, is_prefix) pairs for the last word of a query: the word as a prefix
+    and, with stems, its shorter leading parts as whole words.
+
+    The index holds stemmed words, and the half-typed word gets stemmed too,
+    so "failin" becomes a prefix that "fail" (from "failing") doesn't start
+    with; one of the leading parts is the stem being typed. They can also be
+    unrelated words ("hear" in "heart"), so search() only tries them when
+    the word as a prefix finds nothing.
+    """
+    word = word.lower()
+    terms = [(word, True)]
+    if stems:
+        shortest = max(MIN_STEM, len(word) - STEM_CUT)
+        terms += [(word[:length], False) for length in range(len(word) - 1, shortest - 1, -1)]
+    return terms
+
+
+def _fts5_query(query, stems=False):
+    # Quote every word so user input can't be read as FTS5 syntax; the last
+    # word is a prefix match so results appear while it is still being typed.
+    # FTS5 only allows an implicit AND between plain phrases, hence the AND
+    *words, last = _words.findall(query)
+    last = ' OR '.join(f'"{term}"' + ('*' if is_prefix else '') for term, is_prefix in _prefix_terms(last, stems))
+    return ' AND '.join([f'"{word}"' for word in words] + [f'({last})'])
+
+
+def _tsquery(query, stems=False):
+    # The same query for to_tsquery(); words are \w+, so quoting them is enough
+    *words, last = _words.findall(query)
+    last = ' | '.join(f"'{term}'" + (':*' if is_prefix else '') for term, is_prefix in _prefix_terms(last, stems))
+    return ' & '.join([f"'{word}'" for word in words] + [f'({last})'])
+
+
+def _search_sqlite(query, limit, stems=False):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT {TABLE}.kind, {TABLE}.object_id, {TABLE}.question_id, q.title,
+                   highlight({TABLE}, 3, %s, %s),
+                   snippet({TABLE}, 4, %s, %s, '…', %s),
+                   bm25({TABLE}, 0, 0, 0, %s, 1.0) AS score
+            FROM {TABLE}
+            JOIN ai_checker_question q ON q.id = {TABLE}.question_id
+            WHERE {TABLE} MATCH %s
+            ORDER BY score
+            LIMIT %s
+            ''',
+            [_START, _STOP, _START, _STOP, SNIPPET_WORDS, TITLE_WEIGHT, _fts5_query(query, stems), limit],
+        )
+        # bm25() is lower for better matches
+        return [row[:6] + (-row[6],) for row in cursor.fetchall()]
+
+
+def _search_postgresql(query, limit, stems=False):
+    options = f'StartSel={_START}, StopSel={_STOP}'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            SELECT s.kind, s.object_id, s.question_id, q.title,
+                   ts_headline('english', s.title, query, %s),
+                   ts_headline('english', s.content, query, %s),
+                   ts_rank(s.document, query) AS score
+            FROM {TABLE} s
+            JOIN ai_checker_question q ON q.id = s.question_id,
+                 to_tsquery('english', %s) query
+            WHERE s.document @@ query
+            ORDER BY score DESC
+            LIMIT %s
+            ''',
+            [
+                options + ', HighlightAll=true',
+                options + f', MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}',
+                _tsquery(query, stems), limit,
+            ],
+        )
+        return cursor.fetchall()
+
+
+def _search_fallback(query, limit):
+    from django.db.models import Q
+    from .models import Question
+
+    questions = Question.objects.filter(
+        Q(title__icontains=query) | Q(content__icontains=query)
+    ).only('title', 'content')[:limit]
+    return [
+        SearchHit('question', q.pk, q.pk, q.title, escape(q.title), escape(q.content[:200]), 0.0)
+        for q in questions
+    ]
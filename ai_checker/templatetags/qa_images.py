@@ -0,0 +1,28 @@
+from django import template
+from django.utils.html import format_html
+
+from ai_checker import images
+
+register = template.Library()
+
+FEED_SIZES = '(max-width: 680px) 100vw, 680px'
+
+@register.simple_tag
+def question_image(question, css_class='post-image', sizes=FEED_SIZES):
+    """Responsive <picture> for a question's image, WebP first"""
+    image = images.sources(question)
+    if image is None:
+        return ''
+    if not image['srcset']:
+        return format_html(
+            '<img src="{}" alt="Question image" class="{}" loading="lazy">',
+            image['src'], css_class,
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="Question image" class="{}" loading="lazy">'
+        '</picture>',
+        image['webp_srcset'], sizes,
+        image['src'], image['srcset'], sizes, image['width'], image['height'], css_class,
+    )
@@ -0,0 +1,498 @@
+from datetime import timedelta
+from io import BytesIO, StringIO
+import asyncio
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from ai_checker import images, search, unread
+from ai_checker.broker import FileChannel, NotificationBroker
+from ai_checker.forms import QuestionForm
+from ai_checker.models import (
+    Answer, AnswerReaction, Notification, NotificationReadState, Question, QuestionReaction,
+)
+from ai_checker.pagination import InvalidCursor, decode_cursor, keyset_page
+from ai_checker.views import _notification_events
+
+# Keep test runs out of the shared file cache
+LOCMEM_CACHES = {**settings.CACHES, 'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def png(width, height):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, QA_IMAGE_WIDTHS=(16,))
+class QuestionImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        # Processing is run by hand; the background pool can't see the test transaction
+        schedule = mock.patch('ai_checker.images.schedule')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+        self.author = User.objects.create_user('asker', password='pw')
+
+    def ask(self, width=32, height=32):
+        question = Question(author=self.author, title='Rash', content='What is this?')
+        question.image.save('rash.png', ContentFile(png(width, height)), save=False)
+        question.save()
+        return question
+
+    def exists(self, name):
+        return Question._meta.get_field('image').storage.exists(name)
+
+    def test_form_rejects_images_over_the_pixel_cap(self):
+        data = {'title': 'Rash', 'content': 'What is this?'}
+        with override_settings(QA_IMAGE_MAX_PIXELS=1000):
+            form = QuestionForm(data, {'image': SimpleUploadedFile('big.png', png(40, 40), 'image/png')})
+            self.assertFalse(form.is_valid())
+            self.assertIn('pixels', form.errors['image'][0])
+
+            form = QuestionForm(data, {'image': SimpleUploadedFile('ok.png', png(20, 20), 'image/png')})
+            self.assertTrue(form.is_valid(), form.errors)
+
+    def test_command_reports_images_over_the_pixel_cap(self):
+        question = self.ask()
+        out, err = StringIO(), StringIO()
+
+        with override_settings(QA_IMAGE_MAX_PIXELS=1000):
+            call_command('generate_image_variants', stdout=out, stderr=err)
+
+        self.assertIn('0 images, 1 failed', out.getvalue())
+        self.assertIn(f'Question {question.pk}', err.getvalue())
+        question.refresh_from_db()
+        self.assertEqual(question.image_variants, {})
+
+    def test_replacing_an_unprocessed_image_deletes_the_upload(self):
+        question = self.ask()
+        first = question.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.image.save('other.png', ContentFile(png(32, 32)))
+
+        self.assertFalse(self.exists(first))
+        self.assertTrue(self.exists(question.image.name))
+
+    def test_clearing_a_processed_image_deletes_its_variants(self):
+        question = self.ask()
+        variants = images.process(question.pk)
+        files = images._variant_files(variants)
+        self.assertTrue(files and all(self.exists(name) for name in files))
+
+        question = Question.objects.get(pk=question.pk)
+        question.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+
+        self.assertFalse(any(self.exists(name) for name in files))
+        question.refresh_from_db()
+        self.assertEqual(question.image_variants, {})
+
+    def test_replacing_after_background_processing_deletes_its_output(self):
+        # Loaded before processing rewrote the image, saved after
+        question = self.ask()
+        stale = Question.objects.get(pk=question.pk)
+        files = images._variant_files(images.process(question.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stale.image.save('other.png', ContentFile(png(32, 32)))
+
+        self.assertFalse(any(self.exists(name) for name in files))
+        self.assertTrue(os.path.basename(stale.image.name).startswith('other'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class NotificationTests(TestCase):
+    def setUp(self):
+        # A broker without a file channel keeps events in this process
+        broker = mock.patch('ai_checker.views.get_broker', return_value=NotificationBroker())
+        broker.start()
+        self.addCleanup(broker.stop)
+        self.author = User.objects.create_user('rv_author', password='pw')
+        self.question = Question.objects.create(author=self.author, title='Murmur', content='Systolic?')
+
+    def react(self, user, reaction_type='like', question=None):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('ai_checker:react_to_question', args=[(question or self.question).pk]),
+                {'reaction_type': reaction_type}, content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def unread_count(self):
+        self.client.force_login(self.author)
+        return self.client.get(reverse('ai_checker:notification_count')).json()['unread_count']
+
+    def post_as_author(self, name, *args):
+        self.client.force_login(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse(f'ai_checker:{name}', args=args))
+        self.assertEqual(response.status_code, 200)
+
+    def test_actor_who_reacts_again_is_counted_once(self):
+        users = [User.objects.create_user(f'rv_u{i}', password='pw') for i in range(5)]
+        for user in users:
+            self.react(user)
+        # Toggled off and on again, well after dropping out of recent_actors
+        self.react(users[0])
+        self.react(users[0])
+
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.get_message(), 'rv_u0 and 4 others reacted to your question')
+
+    def test_unread_count_across_fold_mark_one_and_mark_all(self):
+        other_question = Question.objects.create(author=self.author, title='Rash', content='Itchy?')
+        alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+
+        self.react(alice)
+        self.assertEqual(self.unread_count(), 1)
+        # Folds into the unread notification for the same question
+        self.react(bob)
+        self.assertEqual(self.unread_count(), 1)
+        self.react(alice, question=other_question)
+        self.assertEqual(self.unread_count(), 2)
+
+        first = Notification.objects.filter(question=self.question).get()
+        self.post_as_author('mark_notification_read', first.pk)
+        self.assertEqual(self.unread_count(), 1)
+        # Marking it again doesn't move the count
+        self.post_as_author('mark_notification_read', first.pk)
+        self.assertEqual(self.unread_count(), 1)
+
+        # A read notification isn't folded into; a new one is added
+        self.react(User.objects.create_user('carol', password='pw'))
+        self.assertEqual(Notification.objects.filter(question=self.question).count(), 2)
+        self.assertEqual(self.unread_count(), 2)
+
+        self.post_as_author('mark_all_notifications_read')
+        self.assertEqual(self.unread_count(), 0)
+        self.assertEqual(unread.count_unread(self.author.id), 0)
+
+        self.react(bob, question=other_question)
+        self.assertEqual(self.unread_count(), 1)
+        # The cached count agrees with a fresh count
+        self.assertEqual(unread.count_unread(self.author.id), 1)
+
+    def test_stored_count_is_adjusted_in_the_writers_transaction(self):
+        self.react(User.objects.create_user('alice', password='pw'))
+        self.assertEqual(self.unread_count(), 1)
+        state = NotificationReadState.objects.get(user=self.author)
+        self.assertEqual(state.unread_count, 1)
+
+        # Later reads use the stored value instead of counting
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(unread.get_unread_count(self.author.id), 1)
+        self.assertEqual(len(queries), 1)
+
+        # A rolled-back write takes its adjustment with it
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            unread.adjust(self.author.id, 1)
+            raise DatabaseError
+        self.assertEqual(unread.get_unread_count(self.author.id), 1)
+
+        # Deleting an unread notification clears the value; the next read recounts
+        Notification.objects.filter(recipient=self.author).delete()
+        state.refresh_from_db()
+        self.assertIsNone(state.unread_count)
+        self.assertEqual(self.unread_count(), 0)
+        state.refresh_from_db()
+        self.assertEqual(state.unread_count, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QACounterTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'counter_u{i}', password='pw') for i in range(3)]
+        self.question = Question.objects.create(author=self.users[0], title='Murmur', content='Systolic?')
+        self.answer = Answer.objects.create(question=self.question, author=self.users[1], content='Aortic stenosis')
+        QuestionReaction.objects.create(user=self.users[1], question=self.question, reaction_type='like')
+        QuestionReaction.objects.create(user=self.users[2], question=self.question, reaction_type='helpful')
+        AnswerReaction.objects.create(user=self.users[0], answer=self.answer, reaction_type='helpful')
+
+    def test_signals_keep_counters_in_step(self):
+        reaction = QuestionReaction.objects.get(user=self.users[1])
+        reaction.reaction_type = 'love'
+        reaction.save()
+        AnswerReaction.objects.filter(user=self.users[0]).get().delete()
+
+        self.question.refresh_from_db()
+        self.answer.refresh_from_db()
+        self.assertEqual(self.question.answers_count, 1)
+        self.assertEqual(self.question.reactions_count, 2)
+        self.assertEqual(self.question.get_reaction_counts(), {'like': 0, 'love': 1, 'helpful': 1, 'confused': 0})
+        self.assertEqual(self.answer.reactions_count, 0)
+        self.assertEqual(self.answer.helpful_count, 0)
+
+    def test_repair_reports_drift_and_fixes_it(self):
+        Question.objects.filter(pk=self.question.pk).update(answers_count=7, like_count=0)
+        Answer.objects.filter(pk=self.answer.pk).update(reactions_count=3)
+        Question.objects.create(author=self.users[0], title='Untouched', content='Fine')
+
+        out = StringIO()
+        call_command('repair_qa_counters', dry_run=True, chunk_size=1, stdout=out)
+        self.assertIn('Would fix 1 questions, 1 answers', out.getvalue())
+        self.assertIn("'answers_count': 1", out.getvalue())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).answers_count, 7)
+
+        out = StringIO()
+        call_command('repair_qa_counters', chunk_size=1, stdout=out)
+        self.assertIn('Fixed 1 questions, 1 answers', out.getvalue())
+        self.question.refresh_from_db()
+        self.answer.refresh_from_db()
+        self.assertEqual((self.question.answers_count, self.question.like_count), (1, 1))
+        self.assertEqual(self.answer.reactions_count, 1)
+
+        out = StringIO()
+        call_command('repair_qa_counters', stdout=out)
+        self.assertIn('Fixed 0 questions, 0 answers', out.getvalue())
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        stale = Question.objects.get(pk=self.question.pk)
+        Answer.objects.create(question=self.question, author=self.users[2], content='Mitral regurgitation')
+
+        stale.title = 'Holosystolic murmur'
+        stale.save()
+
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.title, 'Holosystolic murmur')
+        self.assertEqual(self.question.answers_count, 2)
+
+
+def cursor_for(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FeedPaginationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('feed_author', password='pw')
+        now = timezone.now()
+        # Pairs share a timestamp, so pages must break ties on id
+        self.questions = [
+            Question.objects.create(
+                author=self.author, title=f'Q{i}', content='?', created_at=now - timedelta(minutes=i // 2),
+            )
+            for i in range(25)
+        ]
+        self.client.force_login(self.author)
+
+    def load_more(self, cursor=None):
+        params = {'cursor': cursor} if cursor is not None else {}
+        return self.client.get(reverse('ai_checker:load_more_questions'), params)
+
+    def test_cursors_walk_every_question_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            data = self.load_more(cursor).json()
+            seen += [question['id'] for question in data['questions']]
+            cursor = data['next_cursor']
+            self.assertEqual(data['has_next'], cursor is not None)
+            if cursor is None:
+                break
+
+        expected = Question.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_page_is_one_query_without_a_count(self):
+        _, cursor = keyset_page(Question.objects.all(), per_page=10)
+        with CaptureQueriesContext(connection) as queries:
+            items, _ = keyset_page(Question.objects.all(), cursor, per_page=10)
+        self.assertEqual(len(items), 10)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_tampered_cursors_are_rejected(self):
+        created_at = self.questions[0].created_at.isoformat()
+        tampered = [
+            '!!!',
+            'bm90IGpzb24',  # "not json"
+            cursor_for([created_at]),
+            cursor_for([None, 1]),
+            cursor_for(['yesterday', 1]),
+            cursor_for([created_at, 'x']),
+            cursor_for([created_at, 10 ** 20]),
+            cursor_for([created_at, float('inf')]),
+            cursor_for([created_at, -1]),
+            cursor_for([created_at.replace('+00:00', ''), 1]),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(cursor)
+                self.assertEqual(self.load_more(cursor).status_code, 400)
+
+    def test_feed_page_falls_back_to_the_top_on_a_bad_cursor(self):
+        response = self.client.get(reverse('ai_checker:question_feed'), {'cursor': cursor_for([None, 1])})
+        self.assertEqual(response.status_code, 200)
+        newest = Question.objects.order_by('-created_at', '-id')[:10]
+        self.assertEqual([q.pk for q in response.context['questions']], [q.pk for q in newest])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'these queries exercise the FTS5 table')
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('searcher', password='pw')
+        self.failure = Question.objects.create(
+            author=self.author, title='Managing heart failure', content='Which diuretic first?',
+        )
+        self.murmur = Question.objects.create(
+            author=self.author, title='Systolic murmur', content='Harsh murmur radiating to the carotids',
+        )
+        Answer.objects.create(
+            question=self.murmur, author=self.author, content='Think of aortic stenosis in congestive failing hearts',
+        )
+
+    def found(self, query):
+        return [hit.question_id for hit in search.search(query)]
+
+    def test_prefix_of_the_last_word(self):
+        self.assertEqual(self.found('heart fail'), [self.failure.pk, self.murmur.pk])
+        self.assertEqual(self.found('heart failu'), [self.failure.pk])
+        self.assertEqual(self.found('diur'), [self.failure.pk])
+
+    def test_half_typed_word_whose_stem_is_shorter(self):
+        # "failing" and "congestive" are indexed as "fail" and "congest"
+        self.assertEqual(self.found('failin'), [self.murmur.pk])
+        self.assertEqual(self.found('congesti'), [self.murmur.pk])
+
+    def test_stems_are_only_tried_when_nothing_matches(self):
+        hearing = Question.objects.create(author=self.author, title='Hearing loss', content='Sudden, one ear')
+        Question.objects.create(author=self.author, title='Can I run?', content='After surgery')
+        # "hear" is a leading part of "heart", but heart matches as typed
+        self.assertNotIn(hearing.pk, self.found('heart'))
+        self.assertEqual(self.found('cancer'), [])
+
+    def test_answers_are_found_and_edits_reindexed(self):
+        hit, = search.search('stenosis')
+        self.assertEqual((hit.kind, hit.question_id), ('answer', self.murmur.pk))
+        self.assertIn('<mark>stenosis</mark>', hit.snippet_html)
+
+        self.murmur.title = 'Diastolic murmur'
+        self.murmur.save()
+        self.assertEqual(self.found('systolic'), [])
+        self.murmur.answers.get().delete()
+        self.assertEqual(self.found('stenosis'), [])
+
+    def test_rows_are_written_and_deleted_by_rowid(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid, kind, object_id FROM {search.TABLE} ORDER BY rowid')
+            rows = cursor.fetchall()
+        self.assertEqual(len(rows), 3)
+        for rowid, kind, object_id in rows:
+            self.assertEqual(rowid, search.row_id(kind, object_id))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.murmur.delete()
+        deletes = [q['sql'] for q in queries if search.TABLE in q['sql']]
+        # The question and its cascaded answer, each by rowid
+        self.assertEqual(len(deletes), 2)
+        self.assertTrue(all('WHERE rowid = ' in sql for sql in deletes))
+        self.assertEqual(self.found('murmur'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ['heart OR', 'NEAR(heart', '"heart', 'heart*', '-murmur', '???']:
+            with self.subTest(query=query):
+                search.search(query)
+        self.assertEqual(self.found('???'), [])
+
+
+class BrokerTests(SimpleTestCase):
+    def channel_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return os.path.join(directory, 'notifications.channel')
+
+    def test_publish_from_another_thread_reaches_only_that_users_streams(self):
+        broker = NotificationBroker()
+
+        async def receive():
+            async with broker.subscribe(1) as mine, broker.subscribe(2) as theirs:
+                publisher = threading.Thread(target=broker.publish, args=(1, 'count', {'unread_count': 3}))
+                publisher.start()
+                received = await asyncio.wait_for(mine.get(), 1)
+                publisher.join()
+                return received, theirs.empty()
+
+        self.assertEqual(asyncio.run(receive()), (('count', {'unread_count': 3}), True))
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_events_cross_brokers_through_the_file_channel(self):
+        path = self.channel_path()
+        publisher = NotificationBroker(path, poll_interval=0.01)
+        listener = NotificationBroker(path, poll_interval=0.01)
+
+        async def receive():
+            async with publisher.subscribe(7) as local, listener.subscribe(7) as remote:
+                # Let the tailers skip the (empty) backlog before publishing
+                await asyncio.sleep(0.05)
+                publisher.publish(7, 'notification', {'id': 1})
+                received = await asyncio.wait_for(remote.get(), 2)
+                # The publisher's own stream gets it once, not again from the file
+                own = await asyncio.wait_for(local.get(), 1)
+                await asyncio.sleep(0.05)
+                return received, own, local.empty()
+
+        self.assertEqual(
+            asyncio.run(receive()),
+            (('notification', {'id': 1}), ('notification', {'id': 1}), True),
+        )
+
+    def test_channel_reader_follows_rotation(self):
+        path = self.channel_path()
+        writer, reader = FileChannel(path, max_bytes=100), FileChannel(path)
+        writer.append({'n': 0})
+        self.assertEqual(reader.read_new(), [])  # the backlog is skipped
+
+        # The third line takes the file past max_bytes, so it is rotated once
+        for n in range(1, 4):
+            writer.append({'n': n, 'padding': 'x' * 20})
+        self.assertTrue(os.path.exists(path + '.old'))
+        self.assertFalse(os.path.exists(path))
+        writer.append({'n': 4})
+
+        self.assertEqual([message['n'] for message in reader.read_new()], [1, 2, 3, 4])
+
+    def test_stream_starts_with_the_count_and_forwards_events(self):
+        broker = NotificationBroker()
+
+        async def stream():
+            events = _notification_events(5, 2)
+            first = await events.__anext__()
+            broker.publish(5, 'count', {'unread_count': 3})
+            second = await asyncio.wait_for(events.__anext__(), 1)
+            await events.aclose()
+            return first, second
+
+        with mock.patch('ai_checker.views.get_broker', return_value=broker):
+            first, second = asyncio.run(stream())
+        self.assertEqual(first, 'retry: 3000\nevent: count\ndata: {"unread_count": 2}\n\n')
+        self.assertEqual(second, 'event: count\ndata: {"unread_count": 3}\n\n')
+        self.assertEqual(broker.subscriber_count(), 0)
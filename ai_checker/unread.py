@@ -0,0 +1,65 @@
+"""
+Per-user count of unread notifications, kept in NotificationReadState.
+
+Every page shows the count (see context_processors), so it is read from that
+one row rather than counted. Creating and reading notifications add to it
+with an F() update in the writer's own transaction, so concurrent changes
+never lose an adjustment and a rolled-back write takes its adjustment with
+it. Deleting notifications clears the value; a missing value is counted
+again, in the same UPDATE that stores it, on the next read.
+"""
+from django.db.models import Count, F, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def get_unread_count(user_id):
+    from .models import NotificationReadState
+
+    rows = NotificationReadState.objects.filter(user_id=user_id)
+    count = rows.values_list('unread_count', flat=True).first()
+    if count is None:
+        NotificationReadState.objects.get_or_create(user_id=user_id)
+        # Only fills in a value no writer has stored meanwhile
+        _store_count(rows.filter(unread_count__isnull=True), user_id)
+        count = rows.values_list('unread_count', flat=True).first() or 0
+    return max(count, 0)
+
+
+def count_unread(user_id):
+    from .models import Notification
+
+    return Notification.unread_for(user_id).count()
+
+
+def adjust(user_id, delta):
+    """Add delta to the user's count; a count not stored yet stays unset"""
+    from .models import NotificationReadState
+
+    NotificationReadState.objects.filter(user_id=user_id).update(unread_count=F('unread_count') + delta)
+
+
+def reset(user_id):
+    """Recount after the read watermark moved"""
+    from .models import NotificationReadState
+
+    _store_count(NotificationReadState.objects.filter(user_id=user_id), user_id)
+
+
+def invalidate(user_id):
+    """Clear the user's count so the next read recounts it"""
+    from .models import NotificationReadState
+
+    NotificationReadState.objects.filter(user_id=user_id).update(unread_count=None)
+
+
+def _store_count(rows, user_id):
+    from .models import Notification
+
+    unread = (
+        Notification.unread_for(user_id)
+        .order_by()
+        .values('recipient')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    rows.update(unread_count=Coalesce(Subquery(unread), Value(0)))
@@ -6,6 +6,7 @@ app_name = 'ai_checker'
 urlpatterns = [
     path('', views.question_feed, name='question_feed'),
     path('ask/', views.ask_question, name='ask_question'),
+    path('search/', views.search_questions, name='search'),
     path('question/<int:question_id>/', views.question_detail, name='question_detail'),
     path('react/question/<int:question_id>/', views.react_to_question, name='react_to_question'),
     path('react/answer/<int:answer_id>/', views.react_to_answer, name='react_to_answer'),
@@ -15,6 +16,7 @@ urlpatterns = [
     path('notifications/', views.notifications, name='notifications'),
     path('notifications/count/', views.get_notification_count, name='notification_count'),
     path('notifications/json/', views.notifications_json, name='notifications_json'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     path('notifications/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
 ]
\ No newline at end of file
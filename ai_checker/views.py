@@ -1,60 +1,158 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
 from django.contrib import messages
+from django.conf import settings
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Q
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 
-from .models import Question, Answer, QuestionReaction, AnswerReaction, Notification
+from core.sse import sse_message
+
+from .models import Question, Answer, QuestionReaction, AnswerReaction, Notification, NotificationReadState
 from .forms import QuestionForm, AnswerForm
+from .pagination import keyset_page, InvalidCursor
+from .broker import get_broker
+from . import images, search, unread
+
+QUESTIONS_PER_PAGE = 10
+NOTIFICATION_HEARTBEAT = 20
 
 def create_notification(recipient, sender, notification_type, question=None, answer=None, reaction_type=None):
     """Helper function to create notifications"""
-    if recipient != sender:  # Don't notify yourself
-        Notification.objects.create(
+    if recipient == sender:  # Don't notify yourself
+        return
+    if notification_type in Notification.COALESCED_TYPES:
+        with transaction.atomic():
+            if _fold_notification(recipient, sender, notification_type, question, answer, reaction_type):
+                return
+    create_notifications([recipient], sender, notification_type, question, answer, reaction_type)
+
+def create_notifications(recipients, sender, notification_type, question=None, answer=None, reaction_type=None):
+    """Notify several users of one event with a single INSERT"""
+    actors = [Notification.actor_entry(sender)]
+    notifications = Notification.objects.bulk_create([
+        Notification(
             recipient=recipient,
             sender=sender,
             notification_type=notification_type,
             question=question,
             answer=answer,
-            reaction_type=reaction_type
+            reaction_type=reaction_type,
+            recent_actors=actors,
+            actor_ids=[sender.id],
         )
+        for recipient in recipients if recipient != sender
+    ])
+    for notification in notifications:
+        unread.adjust(notification.recipient_id, 1)
+        _publish_notification(notification)
+    return notifications
+
+def _fold_notification(recipient, sender, notification_type, question, answer, reaction_type):
+    """Fold into the recipient's unread notification for the same post, if one is recent enough"""
+    window = timezone.timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 3600))
+    notification = (
+        Notification.unread_for(recipient.id)
+        .select_for_update()
+        .filter(
+            notification_type=notification_type,
+            question=question,
+            answer=answer,
+            created_at__gte=timezone.now() - window,
+        )
+        .order_by('-id')
+        .first()
+    )
+    if notification is None:
+        return False
+    notification.add_actor(sender)
+    notification.reaction_type = reaction_type
+    # Bump it to the top of the list; it stays unread, so the unread count is unchanged
+    notification.created_at = timezone.now()
+    notification.save(update_fields=[
+        'sender', 'actor_count', 'recent_actors', 'actor_ids', 'reaction_type', 'created_at',
+    ])
+    _publish_notification(notification)
+    return True
+
+def _notification_data(notification, is_read=False):
+    return {
+        'id': notification.id,
+        'message': notification.get_message(),
+        'sender_name': notification.sender.get_full_name() or notification.sender.username,
+        'time_ago': notification.created_at.strftime('%B %d, %Y at %I:%M %p'),
+        'is_read': is_read,
+        'actor_count': notification.actor_count,
+        'url': notification.get_url(),
+        'question_title': notification.question.title if notification.question else None,
+    }
+
+def _publish_notification(notification):
+    """Push the notification and the new unread count to the recipient's open pages once committed"""
+    data = _notification_data(notification)
+    transaction.on_commit(lambda: get_broker().publish(
+        notification.recipient_id, 'notification',
+        {'notification': data, 'unread_count': unread.get_unread_count(notification.recipient_id)},
+    ))
+
+def _publish_count(user_id):
+    transaction.on_commit(lambda: get_broker().publish(
+        user_id, 'count', {'unread_count': unread.get_unread_count(user_id)}
+    ))
 
 @login_required
 def question_feed(request):
     """Main Q&A feed page - similar to Facebook home"""
-    questions = Question.objects.select_related('author').prefetch_related(
-        'answers__author', 'reactions'
-    ).all()
+    # Counts are stored on the question, so one row per question is enough
+    feed = Question.objects.select_related('author')
     
-    # Pagination
-    paginator = Paginator(questions, 10)  # Show 10 questions per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Keyset pagination; a stale or mangled cursor just starts from the top
+    try:
+        questions, next_cursor = keyset_page(feed, request.GET.get('cursor'), QUESTIONS_PER_PAGE)
+    except InvalidCursor:
+        questions, next_cursor = keyset_page(feed, None, QUESTIONS_PER_PAGE)
     
     # Get user's reactions for each question and add to question objects
     if request.user.is_authenticated:
         user_reactions = QuestionReaction.objects.filter(
             user=request.user,
-            question__in=page_obj
-        ).select_related('question')
+            question__in=questions
+        )
         
         # Create a dictionary for quick lookup
-        reactions_dict = {reaction.question.id: reaction.reaction_type for reaction in user_reactions}
+        reactions_dict = {reaction.question_id: reaction.reaction_type for reaction in user_reactions}
         
         # Add user reaction to each question object
-        for question in page_obj:
+        for question in questions:
             question.user_reaction = reactions_dict.get(question.id, None)
     
     context = {
-        'page_obj': page_obj,
+        'questions': questions,
+        'next_cursor': next_cursor,
         'question_form': QuestionForm(),
     }
     return render(request, 'ai_checker/question_feed.html', context)
 
+@login_required
+def search_questions(request):
+    """Ranked full-text search over questions and answers"""
+    query = request.GET.get('q', '').strip()
+    hits = search.search(query) if query else []
+    
+    context = {
+        'query': query,
+        'hits': hits,
+    }
+    return render(request, 'ai_checker/search.html', context)
+
 @login_required
 def ask_question(request):
     """Handle question creation"""
@@ -77,7 +175,7 @@ def ask_question(request):
 def question_detail(request, question_id):
     """Detailed view of a question with all answers"""
     question = get_object_or_404(Question, id=question_id)
-    answers = question.answers.select_related('author').prefetch_related('reactions')
+    answers = question.answers.select_related('author')
     
     # Handle answer submission
     if request.method == 'POST':
@@ -141,24 +239,31 @@ def react_to_question(request, question_id):
     if reaction_type not in dict(QuestionReaction.REACTION_CHOICES):
         return JsonResponse({'error': 'Invalid reaction type'}, status=400)
     
-    reaction, created = QuestionReaction.objects.get_or_create(
-        user=request.user,
-        question=question,
-        defaults={'reaction_type': reaction_type}
-    )
+    # The reaction and the counters it moves commit together
+    with transaction.atomic():
+        reaction, created = QuestionReaction.objects.get_or_create(
+            user=request.user,
+            question=question,
+            defaults={'reaction_type': reaction_type}
+        )
+        
+        removed = False
+        if not created:
+            if reaction.reaction_type == reaction_type:
+                # Remove reaction if clicking the same reaction
+                reaction.delete()
+                removed = True
+            else:
+                # Update reaction type
+                reaction.reaction_type = reaction_type
+                reaction.save()
     
-    if not created:
-        if reaction.reaction_type == reaction_type:
-            # Remove reaction if clicking the same reaction
-            reaction.delete()
-            return JsonResponse({
-                'status': 'removed',
-                'reactions_count': question.get_reactions_count()
-            })
-        else:
-            # Update reaction type
-            reaction.reaction_type = reaction_type
-            reaction.save()
+    question.refresh_from_db(fields=['reactions_count'])
+    if removed:
+        return JsonResponse({
+            'status': 'removed',
+            'reactions_count': question.reactions_count
+        })
     
     # Create notification for question author
     if created or reaction.reaction_type != reaction_type:
@@ -173,7 +278,7 @@ def react_to_question(request, question_id):
     return JsonResponse({
         'status': 'added' if created else 'updated',
         'reaction_type': reaction_type,
-        'reactions_count': question.get_reactions_count()
+        'reactions_count': question.reactions_count
     })
 
 @login_required
@@ -187,22 +292,28 @@ def react_to_answer(request, answer_id):
     if reaction_type not in dict(AnswerReaction.REACTION_CHOICES):
         return JsonResponse({'error': 'Invalid reaction type'}, status=400)
     
-    reaction, created = AnswerReaction.objects.get_or_create(
-        user=request.user,
-        answer=answer,
-        defaults={'reaction_type': reaction_type}
-    )
+    with transaction.atomic():
+        reaction, created = AnswerReaction.objects.get_or_create(
+            user=request.user,
+            answer=answer,
+            defaults={'reaction_type': reaction_type}
+        )
+        
+        removed = False
+        if not created:
+            if reaction.reaction_type == reaction_type:
+                reaction.delete()
+                removed = True
+            else:
+                reaction.reaction_type = reaction_type
+                reaction.save()
     
-    if not created:
-        if reaction.reaction_type == reaction_type:
-            reaction.delete()
-            return JsonResponse({
-                'status': 'removed',
-                'reactions_count': answer.reactions.count()
-            })
-        else:
-            reaction.reaction_type = reaction_type
-            reaction.save()
+    answer.refresh_from_db(fields=['reactions_count'])
+    if removed:
+        return JsonResponse({
+            'status': 'removed',
+            'reactions_count': answer.reactions_count
+        })
     
     # Create notification for answer author
     if created or reaction.reaction_type != reaction_type:
@@ -218,7 +329,7 @@ def react_to_answer(request, answer_id):
     return JsonResponse({
         'status': 'added' if created else 'updated',
         'reaction_type': reaction_type,
-        'reactions_count': answer.reactions.count()
+        'reactions_count': answer.reactions_count
     })
 
 @login_required
@@ -232,6 +343,7 @@ def notifications(request):
     paginator = Paginator(notifications, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = NotificationReadState.annotate_unread(request.user.id, page_obj.object_list)
     
     context = {
         'page_obj': page_obj,
@@ -241,73 +353,109 @@ def notifications(request):
 @login_required
 def get_notification_count(request):
     """Get unread notification count via AJAX"""
-    unread_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-    return JsonResponse({'unread_count': unread_count})
+    return JsonResponse({'unread_count': unread.get_unread_count(request.user.id)})
 
 @login_required
 @require_POST
 def mark_notification_read(request, notification_id):
     """Mark a notification as read"""
     notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    # Only the request that flips the flag of a still-unread row moves the counter
+    if Notification.unread_for(request.user.id).filter(pk=notification.pk).update(is_read=True):
+        unread.adjust(request.user.id, -1)
+        _publish_count(request.user.id)
     return JsonResponse({'status': 'success'})
 
 @login_required
 @require_POST
 def mark_all_notifications_read(request):
     """Mark all notifications as read"""
-    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+    # One upsert of the watermark, however many notifications are unread
+    NotificationReadState.mark_all_read(request.user.id)
+    unread.reset(request.user.id)
+    _publish_count(request.user.id)
     return JsonResponse({'status': 'success'})
 
 @login_required
 def load_more_questions(request):
     """AJAX endpoint for infinite scroll"""
-    page = request.GET.get('page', 1)
-    questions = Question.objects.select_related('author').prefetch_related(
-        'answers__author', 'reactions'
-    ).all()
-    
-    paginator = Paginator(questions, 10)
-    page_obj = paginator.get_page(page)
+    try:
+        questions, next_cursor = keyset_page(
+            Question.objects.select_related('author'), request.GET.get('cursor'), QUESTIONS_PER_PAGE
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
     
     questions_data = []
-    for question in page_obj:
+    for question in questions:
         questions_data.append({
             'id': question.id,
             'title': question.title,
             'content': question.content,
             'author': question.author.username,
             'created_at': question.created_at.strftime('%B %d, %Y at %I:%M %p'),
-            'answers_count': question.get_answers_count(),
-            'reactions_count': question.get_reactions_count(),
-            'image_url': question.image.url if question.image else None,
+            'answers_count': question.answers_count,
+            'reactions_count': question.reactions_count,
+            'image': images.sources(question),
         })
     
     return JsonResponse({
         'questions': questions_data,
-        'has_next': page_obj.has_next(),
-        'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
     })
 
 @login_required
 def notifications_json(request):
     """Get notifications in JSON format for dropdown"""
     limit = int(request.GET.get('limit', 10))
-    notifications = Notification.objects.filter(recipient=request.user).select_related(
-        'sender', 'question', 'answer'
-    )[:limit]
+    notifications = NotificationReadState.annotate_unread(
+        request.user.id,
+        Notification.objects.filter(recipient=request.user).select_related(
+            'sender', 'question', 'answer'
+        )[:limit],
+    )
     
-    notifications_data = []
-    for notification in notifications:
-        notifications_data.append({
-            'id': notification.id,
-            'message': notification.get_message(),
-            'sender_name': notification.sender.get_full_name() or notification.sender.username,
-            'time_ago': notification.created_at.strftime('%B %d, %Y at %I:%M %p'),
-            'is_read': notification.is_read,
-            'url': notification.get_url(),
-            'question_title': notification.question.title if notification.question else None,
-        })
+    notifications_data = [
+        _notification_data(notification, is_read=not notification.unread)
+        for notification in notifications
+    ]
+    
+    return JsonResponse({'notifications': notifications_data})
+
+async def notification_stream(request):
+    """Live unread count and new notifications as Server-Sent Events"""
+    user_id = await sync_to_async(lambda: request.user.id if request.user.is_authenticated else None)()
+    if user_id is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an open stream holds a worker thread for its whole life;
+        # 204 tells EventSource not to reconnect, and the page polls instead
+        return HttpResponse(status=204)
     
-    return JsonResponse({'notifications': notifications_data})
\ No newline at end of file
+    unread_count = await sync_to_async(unread.get_unread_count)(user_id)
+    response = StreamingHttpResponse(
+        _notification_events(user_id, unread_count), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass events straight through
+    return response
+
+async def _notification_events(user_id, unread_count):
+    loop = asyncio.get_running_loop()
+    # Streams end after a while so a vanished client can't hold one forever;
+    # EventSource reconnects on its own after the retry delay
+    closes_at = loop.time() + settings.NOTIFICATION_STREAM_TIMEOUT
+    async with get_broker().subscribe(user_id) as events:
+        yield 'retry: 3000\n' + sse_message({'unread_count': unread_count}, event='count')
+        while True:
+            remaining = closes_at - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event, data = await asyncio.wait_for(events.get(), min(NOTIFICATION_HEARTBEAT, remaining))
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from timing out an idle stream
+                yield ': ping\n\n'
+                continue
+            yield sse_message(data, event=event)
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from core.mixins import DirtyFieldsMixin
+
 
 class AnatomySystem(models.Model):
     name = models.CharField(max_length=100)
@@ -27,7 +29,7 @@ class AnatomyStructure(models.Model):
         return f"{self.system.name} - {self.name}"
 
 
-class AnatomyProgress(models.Model):
+class AnatomyProgress(DirtyFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     structure = models.ForeignKey(AnatomyStructure, on_delete=models.CASCADE)
     viewed_at = models.DateTimeField(auto_now_add=True)
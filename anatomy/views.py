@@ -1,8 +1,9 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.db import transaction
 from .models import AnatomySystem, AnatomyStructure, AnatomyProgress
-from core.models import Activity, StudentProfile
+from core.models import GamificationEvent
 import json
 
 
@@ -56,30 +57,28 @@ def system_detail(request, system_id):
 def structure_detail(request, structure_id):
     structure = get_object_or_404(AnatomyStructure, id=structure_id)
     
-    # Record or update progress
-    progress, created = AnatomyProgress.objects.get_or_create(
-        user=request.user,
-        structure=structure,
-        defaults={'xp_earned': structure.xp_reward}
-    )
-    
-    if created:
-        # First time viewing - award XP
-        try:
-            profile = request.user.studentprofile
-        except StudentProfile.DoesNotExist:
-            profile = StudentProfile.objects.create(user=request.user)
-        
-        profile.add_xp(structure.xp_reward)
-        
-        # Record activity
-        Activity.objects.create(
+    with transaction.atomic():
+        # Record or update progress
+        progress, created = AnatomyProgress.objects.get_or_create(
             user=request.user,
-            activity_type='anatomy_explored',
-            title=f'Explored Anatomy: {structure.name}',
-            description=f'Studied {structure.name} in {structure.system.name}',
-            xp_earned=structure.xp_reward
+            structure=structure,
+            defaults={'xp_earned': structure.xp_reward}
         )
+        
+        if created:
+            # First time viewing - queue XP and activity for the gamification worker
+            GamificationEvent.publish(
+                request.user,
+                'anatomy_viewed',
+                xp=structure.xp_reward,
+                source='anatomy',
+                activity={
+                    'activity_type': 'anatomy_explored',
+                    'title': f'Explored Anatomy: {structure.name}',
+                    'description': f'Studied {structure.name} in {structure.system.name}',
+                    'xp_earned': structure.xp_reward,
+                },
+            )
     
     context = {
         'structure': structure,
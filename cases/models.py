@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 import json
 
+from core.mixins import DirtyFieldsMixin
+
 class Case(models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Easy'),
@@ -44,7 +46,7 @@ class Choice(models.Model):
     def __str__(self):
         return f"{self.step.title} - {self.text[:50]}"
 
-class CaseAttempt(models.Model):
+class CaseAttempt(DirtyFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     case = models.ForeignKey(Case, on_delete=models.CASCADE)
     current_step = models.IntegerField(default=0)
@@ -4,9 +4,10 @@ from django.http import JsonResponse
 import json
 from django.utils import timezone
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Sum
 from .models import Case, CaseStep, Choice, CaseAttempt
-from core.models import StudentProfile, Activity, Achievement
+from core.models import StudentProfile, GamificationEvent
 
 @login_required
 def case_list(request):
@@ -96,64 +97,51 @@ def submit_choice(request, attempt_id):
     except Choice.DoesNotExist:
         return JsonResponse({'error': 'Invalid choice'}, status=400)
     
-    # Record choice
-    choices_made = attempt.get_choices_made()
-    choices_made.append({
-        'step': attempt.current_step,
-        'choice_id': choice.id,
-        'xp_earned': choice.xp_reward
-    })
-    attempt.choices_made = json.dumps(choices_made)
-    attempt.total_xp_earned += choice.xp_reward
-    attempt.save()
-    
-    # Update user profile
-    profile = StudentProfile.objects.get(user=request.user)
-    profile.add_xp(choice.xp_reward)
-    profile.save()
-    
-    # Move to next step or complete
-    next_step_number = attempt.current_step + 1
-    has_next_step = CaseStep.objects.filter(
-        case=attempt.case,
-        step_number=next_step_number
-    ).exists()
-    
-    if has_next_step:
-        attempt.current_step = next_step_number
-        attempt.save()
-        return redirect('case_step', attempt_id=attempt.id)
-    else:
+    with transaction.atomic():
+        # Record choice
+        choices_made = attempt.get_choices_made()
+        choices_made.append({
+            'step': attempt.current_step,
+            'choice_id': choice.id,
+            'xp_earned': choice.xp_reward
+        })
+        attempt.choices_made = json.dumps(choices_made)
+        attempt.total_xp_earned += choice.xp_reward
+        
+        # Move to next step or complete
+        next_step_number = attempt.current_step + 1
+        has_next_step = CaseStep.objects.filter(
+            case=attempt.case,
+            step_number=next_step_number
+        ).exists()
+        
+        if has_next_step:
+            attempt.current_step = next_step_number
+            attempt.save()
+            
+            # Queue step XP for the gamification worker
+            GamificationEvent.publish(request.user, 'case_step', xp=choice.xp_reward, source='case')
+            return redirect('case_step', attempt_id=attempt.id)
+        
         # Complete the case
         attempt.completed = True
         attempt.completed_at = timezone.now()
         attempt.save()
         
-        # Update profile
-        profile.cases_completed += 1
-        profile.save()
-        
-        # Create activity
-        Activity.objects.create(
-            user=request.user,
-            activity_type='case_completed',
-            title=f'Completed "{attempt.case.title}"',
-            description=f'Successfully completed the case simulation',
-            xp_earned=attempt.total_xp_earned
+        # Queue XP, activity, case count and achievements for the gamification worker
+        GamificationEvent.publish(
+            request.user,
+            'case_completed',
+            xp=choice.xp_reward,
+            source='case',
+            activity={
+                'activity_type': 'case_completed',
+                'title': f'Completed "{attempt.case.title}"',
+                'description': 'Successfully completed the case simulation',
+                'xp_earned': attempt.total_xp_earned,
+            },
+            counters={'cases_completed': 1},
         )
-        
-        # Check for achievements
-        if profile.cases_completed >= 20:
-            Achievement.objects.get_or_create(
-                user=request.user,
-                achievement_type='case_master',
-                defaults={
-                    'title': 'Case Master',
-                    'description': 'Complete 20 cases',
-                    'xp_reward': 100
-                }
-            )
-        
         return redirect('case_complete', attempt_id=attempt.id)
     
 @login_required
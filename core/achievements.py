@@ -0,0 +1,159 @@
+"""
+Declarative achievement rules.
+
+Every rule awards one Achievement.ACHIEVEMENT_TYPES entry once a StudentProfile
+counter reaches a threshold. evaluate() checks a single profile against a
+cached set of the types the user already has, so the common case costs no
+queries; evaluate_bulk() awards rules to every qualifying profile with a few
+set-based queries, which is also how a newly added rule gets backfilled.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import StudentProfile, Achievement, forget_dashboard_summary, earned_achievements_key
+
+EARNED_TIMEOUT = 60 * 60 * 24
+
+
+class AchievementRule:
+    def __init__(self, achievement_type, field, threshold, title, description, xp_reward):
+        self.achievement_type = achievement_type
+        self.field = field
+        self.threshold = threshold
+        self.title = title
+        self.description = description
+        self.xp_reward = xp_reward
+
+    def matches(self, profile):
+        return getattr(profile, self.field) >= self.threshold
+
+    def condition(self):
+        return Q(**{f'{self.field}__gte': self.threshold})
+
+    def build(self, user_id, value):
+        """Unsaved Achievement; {field} placeholders take the profile's value"""
+        return Achievement(
+            user_id=user_id,
+            achievement_type=self.achievement_type,
+            title=self.title.format(**{self.field: value}),
+            description=self.description.format(**{self.field: value}),
+            xp_reward=self.xp_reward,
+        )
+
+
+RULES = {}
+
+
+def register(rule):
+    if rule.achievement_type not in dict(Achievement.ACHIEVEMENT_TYPES):
+        raise ValueError(f'Unknown achievement type: {rule.achievement_type}')
+    RULES[rule.achievement_type] = rule
+    return rule
+
+
+register(AchievementRule(
+    'level_up', 'level', 2,
+    'Level {level} Reached!', 'Congratulations on reaching level {level}!', 50,
+))
+register(AchievementRule(
+    'streak_7', 'longest_streak', 7,
+    'Week Warrior', '7-day learning streak!', 100,
+))
+register(AchievementRule(
+    'streak_30', 'longest_streak', 30,
+    'Month Master', '30-day learning streak!', 500,
+))
+register(AchievementRule(
+    'case_master', 'cases_completed', 20,
+    'Case Master', 'Complete 20 cases', 100,
+))
+register(AchievementRule(
+    'first_timed_challenge', 'timed_challenges_completed', 1,
+    'Time Attacker', 'Completed your first timed challenge!', 50,
+))
+
+
+def earned_types(user_id):
+    """Achievement types the user already has, cached per user"""
+    key = earned_achievements_key(user_id)
+    earned = cache.get(key)
+    if earned is None:
+        earned = set(
+            Achievement.objects.filter(user_id=user_id).values_list('achievement_type', flat=True)
+        )
+        _cache_earned(user_id, earned)
+    return earned
+
+
+def _cache_earned(user_id, earned):
+    # After commit, so a rolled-back award never ends up cached as earned
+    earned = set(earned)
+    transaction.on_commit(lambda: cache.set(earned_achievements_key(user_id), earned, EARNED_TIMEOUT))
+
+
+def evaluate(profile, fields=None):
+    """Award every matching rule (optionally only rules on the given fields)"""
+    rules = [
+        rule for rule in RULES.values()
+        if (fields is None or rule.field in fields) and rule.matches(profile)
+    ]
+    if not rules:
+        return []
+
+    earned = earned_types(profile.user_id)
+    new = [
+        rule.build(profile.user_id, getattr(profile, rule.field))
+        for rule in rules if rule.achievement_type not in earned
+    ]
+    if not new:
+        return []
+
+    Achievement.objects.bulk_create(new, ignore_conflicts=True)
+    earned |= {achievement.achievement_type for achievement in new}
+    _cache_earned(profile.user_id, earned)
+    forget_dashboard_summary(profile.user_id)
+    return new
+
+
+def evaluate_bulk(types=None, batch_size=1000):
+    """Award rules to every qualifying profile; returns {type: awarded count}"""
+    awarded = {}
+    for achievement_type in types or RULES:
+        rule = RULES[achievement_type]
+        qualifying = StudentProfile.objects.filter(rule.condition()).filter(
+            ~Exists(Achievement.objects.filter(
+                user_id=OuterRef('user_id'),
+                achievement_type=achievement_type,
+            ))
+        ).values_list('user_id', rule.field)
+
+        count = 0
+        batch = []
+        for user_id, value in qualifying.iterator(chunk_size=batch_size):
+            batch.append(rule.build(user_id, value))
+            if len(batch) >= batch_size:
+                count += _award(batch)
+                batch = []
+        if batch:
+            count += _award(batch)
+        awarded[achievement_type] = count
+    return awarded
+
+
+def _award(achievements):
+    """Insert achievements, skipping ones already held; returns how many were inserted"""
+    user_ids = {achievement.user_id for achievement in achievements}
+    existing = Achievement.objects.filter(
+        user_id__in=user_ids,
+        achievement_type__in={achievement.achievement_type for achievement in achievements},
+    )
+    with transaction.atomic():
+        # ignore_conflicts leaves no trace of skipped rows, so count around the insert
+        before = existing.count()
+        Achievement.objects.bulk_create(achievements, ignore_conflicts=True)
+        inserted = existing.count() - before
+        keys = [earned_achievements_key(user_id) for user_id in user_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        forget_dashboard_summary(*user_ids)
+    return inserted
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import StudentProfile, Achievement, Activity, StudySession
+from .models import StudentProfile, Achievement, Activity, ActivityArchive, StudySession, XPTransaction
 
 @admin.register(StudentProfile)
 class StudentProfileAdmin(admin.ModelAdmin):
@@ -41,6 +41,12 @@ class ActivityAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'title']
     date_hierarchy = 'created_at'
 
+@admin.register(ActivityArchive)
+class ActivityArchiveAdmin(admin.ModelAdmin):
+    list_display = ['user', 'month', 'activity_count', 'login_count', 'xp_earned', 'updated_at']
+    list_filter = ['month']
+    search_fields = ['user__username']
+
 @admin.register(StudySession)
 class StudySessionAdmin(admin.ModelAdmin):
     list_display = ['user', 'start_time', 'duration_minutes', 'xp_earned', 'activities_completed']
@@ -48,6 +54,25 @@ class StudySessionAdmin(admin.ModelAdmin):
     search_fields = ['user__username']
     date_hierarchy = 'start_time'
 
+@admin.register(XPTransaction)
+class XPTransactionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'source', 'amount', 'created_at']
+    list_filter = ['source', 'created_at']
+    search_fields = ['user__username']
+    date_hierarchy = 'created_at'
+    readonly_fields = ['user', 'source', 'amount', 'created_at']
+
+    # The ledger is append-only and written through StudentProfile.add_xp(),
+    # which also moves total_xp; rows edited here would drift from it
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.site_header = "MediStreak Admin Panel"
 admin.site.site_title = "MediStreak Admin"
 admin.site.index_title = "Welcome to MediStreak Admin Dashboard"
@@ -0,0 +1,167 @@
+"""
+Cache of chatbot answers keyed on a normalized question.
+
+"What is tension pneumothorax?" and "what is  tension pneumothorax" share one
+entry. Answers live in the 'chatbot' cache, which by default is AnswerCache:
+an in-process LRU store with a TTL, a byte budget and hit/miss counters that
+plugs into Django's cache framework like any other backend.
+"""
+import hashlib
+import pickle
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_punctuation = re.compile(r'[^\w\s]')
+_whitespace = re.compile(r'\s+')
+
+# Longest first, so "infections" loses "s" only after "ions" fails
+_suffixes = ('ations', 'ation', 'ings', 'ing', 'ies', 'ied', 'ed', 'es', 's')
+
+
+def stem(word):
+    """Crude suffix stripping, enough to merge plurals and verb forms"""
+    for suffix in _suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_prompt(text, stemming=False):
+    """Case-folded words without punctuation, single-spaced"""
+    words = _whitespace.split(_punctuation.sub(' ', text.casefold()).strip())
+    if stemming:
+        words = [stem(word) for word in words]
+    return ' '.join(word for word in words if word)
+
+
+def answer_key(question):
+    normalized = normalize_prompt(question, getattr(settings, 'CHATBOT_CACHE_STEMMING', False))
+    return 'chatbot-answer:' + hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def get_answer(question):
+    """Cached reply for the question, or None"""
+    return caches['chatbot'].get(answer_key(question))
+
+
+def store_answer(question, reply):
+    caches['chatbot'].set(answer_key(question), reply)
+
+
+# Like LocMemCache, state is per cache name so every thread's backend
+# instance shares the same store
+_stores = {}
+_expiry = {}
+_sizes = {}
+_stats = {}
+_locks = {}
+
+
+class AnswerCache(BaseCache):
+    """
+    In-memory cache with LRU eviction and an entry-size budget.
+
+    OPTIONS: MAX_ENTRIES (as usual) and MAX_BYTES, the total size of the
+    pickled values kept. stats() reports hits, misses and evictions.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', 5 * 1024 * 1024))
+        self._cache = _stores.setdefault(name, OrderedDict())
+        self._expire_info = _expiry.setdefault(name, {})
+        self._sizes = _sizes.setdefault(name, {'bytes': 0})
+        self._stats = _stats.setdefault(name, {'hits': 0, 'misses': 0, 'evictions': 0})
+        self._lock = _locks.setdefault(name, Lock())
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            if self._has_expired(key):
+                self._set(key, pickled, timeout)
+                return True
+            return False
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                self._stats['misses'] += 1
+                return default
+            pickled = self._cache[key]
+            self._cache.move_to_end(key)
+            self._stats['hits'] += 1
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._set(key, pickled, timeout)
+
+    def _set(self, key, pickled, timeout):
+        self._delete(key)
+        if len(pickled) > self._max_bytes:
+            return
+        self._cache[key] = pickled
+        self._expire_info[key] = self.get_backend_timeout(timeout)
+        self._sizes['bytes'] += len(pickled)
+        # Evict least recently used entries until back under both limits
+        while len(self._cache) > self._max_entries or self._sizes['bytes'] > self._max_bytes:
+            oldest = next(iter(self._cache))
+            self._delete(oldest)
+            self._stats['evictions'] += 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                return False
+            self._expire_info[key] = self.get_backend_timeout(timeout)
+            return True
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                return False
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            return self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            self._sizes['bytes'] = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._cache), bytes=self._sizes['bytes'])
+
+    def _has_expired(self, key):
+        exp = self._expire_info.get(key, -1)
+        return exp is not None and exp <= time.time()
+
+    def _delete(self, key):
+        try:
+            pickled = self._cache.pop(key)
+        except KeyError:
+            return False
+        del self._expire_info[key]
+        self._sizes['bytes'] -= len(pickled)
+        return True
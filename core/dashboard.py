@@ -0,0 +1,50 @@
+"""
+Per-user dashboard summary kept in the Django cache.
+
+The summary is dropped by the signal receivers in core.models once a change
+to the user's activities, achievements, study sessions or XP commits, and it expires
+on its own so rank movement caused by other students still shows up.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import (
+    StudentProfile, Activity, Achievement, StudyDailyRollup, ActivityCalendar, dashboard_summary_key,
+)
+
+SUMMARY_TIMEOUT = 300
+LEADERBOARD_KEY = 'dashboard-leaderboard'
+LEADERBOARD_TIMEOUT = 60
+
+
+def get_summary(user, profile, refresh=False):
+    """Cached summary for today, rebuilt on a miss, after midnight or on request"""
+    today = timezone.localdate()
+    key = dashboard_summary_key(user.id)
+    summary = None if refresh else cache.get(key)
+    if summary is None or summary['date'] != today:
+        summary = build_summary(user, profile, today)
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def build_summary(user, profile, today):
+    calendar = ActivityCalendar.for_user(user.id)
+    return {
+        'date': today,
+        'active_today': calendar.is_active(today),
+        'heatmap': calendar.heatmap(today),
+        'recent_activities': list(Activity.objects.filter(user=user)[:5]),
+        'recent_achievements': list(Achievement.objects.filter(user=user)[:3]),
+        'user_rank': profile.get_rank(),
+        'today_study_time': StudyDailyRollup.totals(user.id, today)['today_minutes'],
+    }
+
+
+def get_leaderboard():
+    """Top 10 students by XP, shared by every user's dashboard"""
+    leaderboard = cache.get(LEADERBOARD_KEY)
+    if leaderboard is None:
+        leaderboard = list(StudentProfile.objects.select_related('user').order_by('-total_xp')[:10])
+        cache.set(LEADERBOARD_KEY, leaderboard, LEADERBOARD_TIMEOUT)
+    return leaderboard
@@ -0,0 +1,133 @@
+"""
+Outbox processing for gamification side effects.
+
+Views queue a GamificationEvent next to their own writes; process_batch()
+turns a batch of events into one bulk insert of activities, one ledger insert
+and one atomic XP update per user, then evaluates achievements. If the batch
+fails, its events are applied one at a time and the ones that still fail are
+marked with their error, so a bad event never blocks the rest of the outbox.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .achievements import evaluate as evaluate_achievements
+from .models import (
+    StudentProfile, Activity, XPTransaction, GamificationEvent, forget_dashboard_summary,
+)
+
+
+class EventsAlreadyClaimed(Exception):
+    """Another worker processed part of the batch first"""
+
+
+def process_batch(batch_size=500):
+    """Process up to batch_size pending events, returning how many were handled"""
+    try:
+        with transaction.atomic():
+            events = _claim_events(batch_size)
+            if not events:
+                return 0
+            try:
+                with transaction.atomic():
+                    user_ids = _apply_events(events)
+            except Exception:
+                user_ids = _apply_each(events)
+    except EventsAlreadyClaimed:
+        return 0
+
+    forget_dashboard_summary(*user_ids)
+    return len(events)
+
+
+def _apply_each(events):
+    """Apply events one by one, recording the error on any that fail"""
+    user_ids = set()
+    for event in events:
+        try:
+            with transaction.atomic():
+                user_ids |= _apply_events([event])
+        except Exception as e:
+            print(f"Gamification event {event.id} failed: {e!r}")
+            # Stays claimed, so the worker moves on; requeue it with retry_failed()
+            GamificationEvent.objects.filter(pk=event.pk).update(error=repr(e)[:1000])
+    return user_ids
+
+
+def retry_failed():
+    """Put failed events back in the outbox; returns how many"""
+    return GamificationEvent.objects.exclude(error='').update(processed_at=None, error='')
+
+
+def prune_processed(days, chunk_size=1000):
+    """Delete events applied more than days ago, in short chunks; failed ones are kept"""
+    cutoff = timezone.now() - timezone.timedelta(days=days)
+    old = GamificationEvent.objects.filter(processed_at__lt=cutoff, error='')
+    deleted = 0
+    while True:
+        ids = list(old.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += GamificationEvent.objects.filter(id__in=ids).delete()[0]
+
+
+def _claim_events(batch_size):
+    pending = GamificationEvent.objects.filter(processed_at__isnull=True).order_by('id')
+    if connection.features.has_select_for_update_skip_locked:
+        pending = pending.select_for_update(skip_locked=True)
+    events = list(pending[:batch_size])
+    if not events:
+        return events
+
+    # Without SKIP LOCKED (SQLite) two workers can read the same batch;
+    # only the one whose UPDATE claims every row goes on
+    claimed = GamificationEvent.objects.filter(
+        id__in=[event.id for event in events],
+        processed_at__isnull=True,
+    ).update(processed_at=timezone.now())
+    if claimed != len(events):
+        raise EventsAlreadyClaimed
+    return events
+
+
+def _apply_events(events):
+    activities = []
+    xp_by_user = defaultdict(Counter)
+    counters_by_user = defaultdict(Counter)
+
+    for event in events:
+        payload = event.payload
+        if payload.get('activity'):
+            activities.append(Activity(user_id=event.user_id, **payload['activity']))
+        if payload.get('xp'):
+            xp_by_user[event.user_id][payload.get('source', 'other')] += payload['xp']
+        counters_by_user[event.user_id].update(payload.get('counters') or {})
+
+    Activity.objects.bulk_create(activities)
+    XPTransaction.objects.bulk_create([
+        XPTransaction(user_id=user_id, source=source, amount=amount)
+        for user_id, by_source in xp_by_user.items()
+        for source, amount in by_source.items()
+        if amount
+    ])
+
+    user_ids = {event.user_id for event in events}
+    profiles = StudentProfile.objects.in_bulk(user_ids, field_name='user_id')
+    for user_id in user_ids:
+        profile = profiles.get(user_id) or StudentProfile.objects.create(user_id=user_id)
+
+        counters = {field: n for field, n in counters_by_user[user_id].items() if n}
+        if counters:
+            StudentProfile.objects.filter(pk=profile.pk).update(
+                **{field: F(field) + n for field, n in counters.items()}
+            )
+            profile.refresh_from_db(fields=list(counters))
+
+        amount = sum(xp_by_user[user_id].values())
+        if amount:
+            profile.apply_xp(amount)
+
+        evaluate_achievements(profile)
+    return user_ids
@@ -0,0 +1,146 @@
+"""
+Materialized leaderboard snapshots.
+
+refresh_snapshot() ranks every StudentProfile into a new LeaderboardSnapshot
+and then swaps it in. Reads only ever touch a window of LeaderboardEntry rows
+addressed by position, so a page costs the same however many students exist.
+Snapshots are only built by the refresh_leaderboard command; until the first
+one completes the leaderboard page says it is being built.
+"""
+from datetime import timedelta
+
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import StudentProfile, LeaderboardSnapshot, LeaderboardEntry, LeaderboardRefreshLock
+
+PAGE_SIZE = 25
+WINDOW_RADIUS = 5  # rows shown either side of the student on "jump to my position"
+REFRESH_LOCK_NAME = 'leaderboard-refresh'
+REFRESH_LOCK_TIMEOUT = 30 * 60  # a crashed refresh stops blocking the next one after this
+
+
+def refresh_snapshot(chunk_size=2000):
+    """Build a new snapshot, publish it and drop older ones; None if a refresh is already running"""
+    lock = _acquire_refresh_lock()
+    if lock is None:
+        return None
+    try:
+        return _build_snapshot(chunk_size)
+    finally:
+        lock.delete()
+
+
+def _acquire_refresh_lock():
+    """Insert the lock row, or None while another refresh holds it"""
+    now = timezone.now()
+    LeaderboardRefreshLock.objects.filter(
+        name=REFRESH_LOCK_NAME, acquired_at__lt=now - timedelta(seconds=REFRESH_LOCK_TIMEOUT)
+    ).delete()
+    # The unique name means only one of several concurrent inserts succeeds,
+    # so cron and manual runs never overlap
+    try:
+        with transaction.atomic():
+            return LeaderboardRefreshLock.objects.create(name=REFRESH_LOCK_NAME, acquired_at=now)
+    except IntegrityError:
+        return None
+
+
+def _build_snapshot(chunk_size):
+    # One transaction and one ordered query, so every student is ranked from
+    # the same view of total_xp even while XP is being awarded, and a refresh
+    # that fails leaves no half-built snapshot behind
+    with transaction.atomic():
+        snapshot = LeaderboardSnapshot.objects.create()
+        position = rank = 0
+        previous_xp = None
+        profiles = StudentProfile.objects.select_related('user').order_by('-total_xp', 'user_id')
+        entries = []
+        for profile in profiles.iterator(chunk_size=chunk_size):
+            position += 1
+            if profile.total_xp != previous_xp:
+                rank = position
+                previous_xp = profile.total_xp
+            entries.append(LeaderboardEntry(
+                snapshot=snapshot,
+                position=position,
+                rank=rank,
+                user_id=profile.user_id,
+                username=profile.user.username,
+                display_name=profile.user.get_full_name() or profile.user.username,
+                university=profile.university,
+                year_of_study=profile.get_year_of_study_display(),
+                level=profile.level,
+                total_xp=profile.total_xp,
+                cases_completed=profile.cases_completed,
+                current_streak=profile.current_streak,
+                longest_streak=profile.longest_streak,
+                quiz_accuracy=profile.quiz_accuracy,
+            ))
+            if len(entries) >= chunk_size:
+                LeaderboardEntry.objects.bulk_create(entries)
+                entries = []
+        LeaderboardEntry.objects.bulk_create(entries)
+        
+        snapshot.total_entries = position
+        snapshot.completed_at = timezone.now()
+        snapshot.save(update_fields=['total_entries', 'completed_at'])
+    
+    # Completed snapshots that this one replaces, plus any unfinished ones
+    # left by refreshes from before snapshots were built in one transaction
+    stale = LeaderboardSnapshot.objects.filter(
+        Q(completed_at__lt=snapshot.completed_at) | Q(completed_at__isnull=True)
+    )
+    for old in stale:
+        drop_snapshot(old, chunk_size)
+    return snapshot
+
+
+def drop_snapshot(snapshot, chunk_size=2000):
+    """Delete a snapshot's entries in short transactions, then the snapshot"""
+    while True:
+        ids = list(snapshot.entries.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            LeaderboardEntry.objects.filter(id__in=ids).delete()
+    snapshot.delete()
+
+
+def current_snapshot():
+    """Latest completed snapshot, or None until refresh_leaderboard has built one"""
+    return LeaderboardSnapshot.objects.filter(
+        completed_at__isnull=False
+    ).order_by('-completed_at').first()
+
+
+def get_page(snapshot, after=None, before=None, size=PAGE_SIZE):
+    """Keyset page of entries strictly after or before a position"""
+    entries = snapshot.entries.all()
+    if before is not None:
+        rows = list(entries.filter(position__lt=before).order_by('-position')[:size])
+        rows.reverse()
+    elif after is not None:
+        rows = list(entries.filter(position__gt=after)[:size])
+    else:
+        rows = list(entries[:size])
+    return rows
+
+
+def get_window(snapshot, user, radius=WINDOW_RADIUS):
+    """Entries around the user's own position, or None if they are not ranked"""
+    entry = snapshot.entries.filter(user=user).first()
+    if entry is None:
+        return None
+    return list(snapshot.entries.filter(
+        position__gte=entry.position - radius,
+        position__lte=entry.position + radius,
+    ))
+
+
+def get_podium(snapshot, rows=None):
+    """Top three entries, reusing the current page when it starts at the top"""
+    if rows and rows[0].position == 1:
+        return rows[:3]
+    return list(snapshot.entries.filter(position__lte=3))
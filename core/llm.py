@@ -0,0 +1,271 @@
+"""
+Pluggable LLM backends for the chatbot.
+
+Every backend answers generate(question, context) with the reply text ('' when
+the answer was blocked) and stream(question, context) with the reply in
+chunks; context is optional reference text from the platform's own content.
+Pick a backend with CHATBOT_BACKEND:
+
+- 'gemini': the Gemini API. The SDK is only imported when this backend is built.
+- 'fake': deterministic local answers after CHATBOT_FAKE_LATENCY seconds,
+  failing CHATBOT_FAKE_ERROR_RATE of the time, for offline work and benchmarks.
+- 'record': Gemini, appending every exchange to the CHATBOT_RECORDING file.
+- 'replay': answers from the CHATBOT_RECORDING file with the recorded latency.
+
+get_client() builds the configured backend once per process and hands the
+same object to every request and thread, so the Gemini SDK is configured once
+and its model object (and HTTP connections) are reused.
+"""
+import abc
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .answer_cache import normalize_prompt
+from .resilience import Overloaded, DeadlineExceeded
+
+MODEL_NAME = 'gemini-1.5-flash'
+
+PROMPT_TEMPLATE = "Medical assistant: Answer this medical education question in 2-3 sentences: {question}"
+
+CONTEXT_PROMPT_TEMPLATE = (
+    "Medical assistant: Using these course notes where relevant,\n{context}\n"
+    "answer this medical education question in 2-3 sentences: {question}"
+)
+
+# Lower temperature and a short limit keep answers fast and focused
+GENERATION_CONFIG = {
+    'temperature': 0.3,
+    'max_output_tokens': 500,
+    'top_k': 20,
+    'top_p': 0.8,
+}
+
+SAFETY_SETTINGS = [
+    {'category': 'HARM_CATEGORY_HARASSMENT', 'threshold': 'BLOCK_ONLY_HIGH'},
+    {'category': 'HARM_CATEGORY_HATE_SPEECH', 'threshold': 'BLOCK_ONLY_HIGH'},
+    {'category': 'HARM_CATEGORY_SEXUALLY_EXPLICIT', 'threshold': 'BLOCK_ONLY_HIGH'},
+    {'category': 'HARM_CATEGORY_DANGEROUS_CONTENT', 'threshold': 'BLOCK_ONLY_HIGH'},
+]
+
+
+def build_prompt(question, context=None):
+    if context:
+        return CONTEXT_PROMPT_TEMPLATE.format(question=question, context=context)
+    return PROMPT_TEMPLATE.format(question=question)
+
+
+class LLMConfigurationError(Exception):
+    """The configured backend cannot be built (e.g. no API key)"""
+
+
+class LLMBackendError(Exception):
+    """The backend failed to produce an answer"""
+
+
+class LLMBackend(abc.ABC):
+    @abc.abstractmethod
+    def generate(self, question, context=None):
+        """The reply text, or '' when the answer was blocked"""
+
+    def stream(self, question, context=None):
+        """Reply in chunks; backends without native streaming send it whole"""
+        reply = self.generate(question, context)
+        if reply:
+            yield reply
+
+
+class GeminiBackend(LLMBackend):
+    def __init__(self, api_key, model_name=MODEL_NAME, timeout=None):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        self.google_exceptions = google_exceptions
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(
+            model_name,
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS,
+        )
+        self.request_options = {'timeout': timeout} if timeout else None
+
+    def generate(self, question, context=None):
+        response = self._generate_content(build_prompt(question, context))
+        try:
+            return response.text.strip()
+        except ValueError:
+            # No text part: the candidate was blocked by the safety settings
+            return ''
+
+    def stream(self, question, context=None):
+        response = self._generate_content(build_prompt(question, context), stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Blocked mid-stream; what was sent so far stands
+                return
+            if text:
+                yield text
+
+    def _generate_content(self, prompt, stream=False):
+        try:
+            return self.model.generate_content(
+                prompt,
+                stream=stream,
+                request_options=self.request_options,
+            )
+        except self.google_exceptions.ResourceExhausted as e:
+            raise Overloaded() from e
+        except self.google_exceptions.DeadlineExceeded as e:
+            raise DeadlineExceeded() from e
+
+
+class FakeBackend(LLMBackend):
+    """Canned local answers after a fixed delay, failing at a seeded random rate"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate(self, question, context=None):
+        self._maybe_fail()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(question)
+
+    def stream(self, question, context=None):
+        self._maybe_fail()
+        words = self._answer(question).split(' ')
+        for i, word in enumerate(words):
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            yield word if i == 0 else ' ' + word
+
+    def _maybe_fail(self):
+        if not self.error_rate:
+            return
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            if self.latency:
+                time.sleep(self.latency)
+            raise LLMBackendError('Simulated upstream failure')
+
+    def _answer(self, question):
+        return f"(offline answer) {question.strip()} is a common medical education topic."
+
+
+class RecordingBackend(LLMBackend):
+    """Pass questions to another backend and append each exchange to a JSONL file"""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+
+    def generate(self, question, context=None):
+        started = time.perf_counter()
+        reply = self.backend.generate(question, context)
+        self._record(question, reply, time.perf_counter() - started)
+        return reply
+
+    def stream(self, question, context=None):
+        started = time.perf_counter()
+        parts = []
+        for text in self.backend.stream(question, context):
+            parts.append(text)
+            yield text
+        self._record(question, ''.join(parts).strip(), time.perf_counter() - started)
+
+    def _record(self, question, reply, latency):
+        line = json.dumps({'question': question, 'reply': reply, 'latency': round(latency, 4)})
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class ReplayBackend(LLMBackend):
+    """Answer from a RecordingBackend file, matching normalized questions"""
+
+    def __init__(self, path, use_latency=True):
+        self.use_latency = use_latency
+        self.recordings = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recordings[normalize_prompt(entry['question'])] = entry
+
+    def generate(self, question, context=None):
+        entry = self.recordings.get(normalize_prompt(question))
+        if entry is None:
+            raise LLMBackendError(f'No recorded answer for: {question}')
+        if self.use_latency:
+            time.sleep(entry['latency'])
+        return entry['reply']
+
+
+def _build_gemini():
+    api_key = getattr(settings, 'GEMINI_API_KEY', None)
+    if not api_key:
+        raise LLMConfigurationError('GEMINI_API_KEY not found in settings')
+    return GeminiBackend(api_key, timeout=getattr(settings, 'CHATBOT_DEADLINE', None))
+
+
+def _build_fake():
+    return FakeBackend(
+        latency=getattr(settings, 'CHATBOT_FAKE_LATENCY', 0.0),
+        error_rate=getattr(settings, 'CHATBOT_FAKE_ERROR_RATE', 0.0),
+    )
+
+
+def _recording_path():
+    path = getattr(settings, 'CHATBOT_RECORDING', None)
+    if not path:
+        raise LLMConfigurationError('CHATBOT_RECORDING is not set')
+    return path
+
+
+BACKENDS = {
+    'gemini': _build_gemini,
+    'fake': _build_fake,
+    'record': lambda: RecordingBackend(_build_gemini(), _recording_path()),
+    'replay': lambda: ReplayBackend(_recording_path()),
+}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The shared backend for this process, built on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_backend(getattr(settings, 'CHATBOT_BACKEND', 'gemini'))
+    return _client
+
+
+def build_backend(name):
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise LLMConfigurationError(f'Unknown CHATBOT_BACKEND: {name}')
+    try:
+        return factory()
+    except OSError as e:
+        raise LLMConfigurationError(str(e))
+
+
+def reset_client():
+    """Drop the shared backend so the next call rebuilds it from settings"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,67 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from core.models import Activity, ActivityArchive, ActivityCalendar, forget_dashboard_summaries_once
+
+class Command(BaseCommand):
+    help = (
+        'Moves activities older than --days into per-user monthly ActivityArchive '
+        'rows. Login activities are only counted. Each chunk is its own short '
+        'transaction so the activity table is never locked for long, and adds a '
+        'new compressed block to each archive it touches instead of rewriting it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='Keep this many days of activity')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+        old = Activity.objects.filter(created_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'Would archive {old.count()} activities older than {cutoff:%Y-%m-%d}')
+            return
+
+        archived = chunks = 0
+        last_id = 0
+        while True:
+            activities = list(old.filter(id__gt=last_id).order_by('id')[:options['chunk_size']])
+            if not activities:
+                break
+            last_id = activities[-1].id
+
+            # Streaks and the heatmap are seeded from activity history, so make
+            # sure every calendar exists before its rows go away
+            user_ids = {activity.user_id for activity in activities}
+            seeded = set(
+                ActivityCalendar.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+            )
+            for user_id in user_ids - seeded:
+                ActivityCalendar.for_user(user_id)
+
+            by_month = defaultdict(list)
+            for activity in activities:
+                month = timezone.localdate(activity.created_at).replace(day=1)
+                by_month[activity.user_id, month].append(activity)
+
+            # One dashboard invalidation per user, not one per deleted row
+            with transaction.atomic(), forget_dashboard_summaries_once():
+                for (user_id, month), group in by_month.items():
+                    ActivityArchive.append(user_id, month, group)
+                Activity.objects.filter(id__in=[activity.id for activity in activities]).delete()
+
+            archived += len(activities)
+            chunks += 1
+            self.stdout.write(f'Archived {archived} activities')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} activities older than {cutoff:%Y-%m-%d} in {chunks} chunks'
+        ))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.contrib.auth.models import User
+from core.models import StudySession, StudyDailyRollup
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds StudyDailyRollup from finished StudySession rows, '
+        'a chunk of users at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per chunk')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        users = rows = 0
+
+        last_id = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+
+            days = (
+                StudySession.objects.filter(user_id__in=user_ids, end_time__isnull=False)
+                .annotate(date=TruncDate('start_time'))
+                .values('user_id', 'date')
+                .annotate(
+                    minutes=Sum('duration_minutes'),
+                    sessions=Count('id'),
+                    xp=Sum('xp_earned'),
+                )
+                .order_by()
+            )
+            rollups = [StudyDailyRollup(**day) for day in days]
+
+            with transaction.atomic():
+                StudyDailyRollup.objects.filter(user_id__in=user_ids).delete()
+                StudyDailyRollup.objects.bulk_create(rollups)
+
+            users += len(user_ids)
+            rows += len(rollups)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rows} daily rollups for {users} users'
+        ))
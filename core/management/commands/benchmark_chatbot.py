@@ -0,0 +1,152 @@
+import json
+import random
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from core import llm, views
+from core.resilience import Guard, KeyedTokenBuckets
+
+QUESTIONS = [
+    'What is tension pneumothorax?',
+    'How does the renin-angiotensin system regulate blood pressure?',
+    'What are the signs of diabetic ketoacidosis?',
+    'Explain the Frank-Starling mechanism.',
+    'What causes nephrotic syndrome?',
+    'How do beta blockers work?',
+    'What is the first-line treatment for anaphylaxis?',
+    'Describe the brachial plexus.',
+]
+
+class Command(BaseCommand):
+    help = (
+        'Sends questions to /chatbot/ at a fixed concurrency and reports latency '
+        'percentiles and throughput. Runs in-process against the chosen backend '
+        '(fake by default, so no network is needed) or against a running server with --url. '
+        'In-process runs measure the backend: the answer cache is off and the rate limits '
+        'are lifted unless --cache or --limits is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--backend', choices=sorted(llm.BACKENDS), default='fake',
+                            help='Backend for in-process runs')
+        parser.add_argument('--latency', type=float, help='Fake backend latency in seconds')
+        parser.add_argument('--error-rate', type=float, help='Fake backend error rate')
+        parser.add_argument('--distinct', type=int, default=len(QUESTIONS),
+                            help='Number of distinct questions to cycle through')
+        parser.add_argument('--url', help='Benchmark a running server instead, e.g. http://127.0.0.1:8000/chatbot/')
+        parser.add_argument('--cache', action='store_true', help='Keep the answer cache on for in-process runs')
+        parser.add_argument('--limits', action='store_true', help='Keep the chatbot rate limits for in-process runs')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        rng = random.Random(options['seed'])
+        questions = [
+            QUESTIONS[i % len(QUESTIONS)] + ('' if i < len(QUESTIONS) else f' (variant {i})')
+            for i in range(options['distinct'])
+        ]
+        workload = [rng.choice(questions) for _ in range(options['requests'])]
+
+        if options['url']:
+            self.stdout.write('The server\'s answer cache and rate limits apply to --url runs')
+            send = self.remote_sender(options['url'])
+            results, elapsed = self.run(workload, send, options['concurrency'])
+        else:
+            overrides = {'CHATBOT_BACKEND': options['backend']}
+            if options['latency'] is not None:
+                overrides['CHATBOT_FAKE_LATENCY'] = options['latency']
+            if options['error_rate'] is not None:
+                overrides['CHATBOT_FAKE_ERROR_RATE'] = options['error_rate']
+            if not options['cache']:
+                overrides['CACHES'] = {
+                    **settings.CACHES,
+                    'chatbot': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+                }
+            saved_limits = views.chatbot_guard, views.chatbot_user_limits
+            if not options['limits']:
+                # The global bucket (burst 20, 120/min by default) and the in-flight cap
+                # would turn most requests into 503s; keep only the deadline and breaker
+                views.chatbot_guard = Guard(
+                    rate=float('inf'),
+                    burst=float('inf'),
+                    deadline=settings.CHATBOT_DEADLINE,
+                    max_in_flight=max(options['concurrency'], settings.CHATBOT_MAX_IN_FLIGHT),
+                    failure_threshold=settings.CHATBOT_BREAKER_FAILURES,
+                    reset_timeout=settings.CHATBOT_BREAKER_RESET,
+                )
+                views.chatbot_user_limits = KeyedTokenBuckets(float('inf'), float('inf'))
+            with override_settings(**overrides):
+                llm.reset_client()
+                caches['chatbot'].clear()
+                try:
+                    results, elapsed = self.run(workload, self.local_sender(), options['concurrency'])
+                finally:
+                    llm.reset_client()
+                    views.chatbot_guard, views.chatbot_user_limits = saved_limits
+
+        self.report(results, elapsed)
+
+    def local_sender(self):
+        def send(i, question):
+            # A distinct address per request, like many students, so the
+            # per-user rate limit doesn't turn the run into a 429 test
+            client = Client(REMOTE_ADDR=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}')
+            response = client.post('/chatbot/', {'message': question})
+            return response.status_code, json.loads(response.content).get('cached', False)
+        return send
+
+    def remote_sender(self, url):
+        def send(i, question):
+            data = urllib.parse.urlencode({'message': question}).encode()
+            try:
+                with urllib.request.urlopen(url, data=data, timeout=60) as response:
+                    return response.status, json.loads(response.read()).get('cached', False)
+            except urllib.error.HTTPError as e:
+                return e.code, False
+        return send
+
+    def run(self, workload, send, concurrency):
+        def timed(item):
+            i, question = item
+            started = time.perf_counter()
+            try:
+                status, cached = send(i, question)
+            except Exception as e:
+                status, cached = type(e).__name__, False
+            return time.perf_counter() - started, status, cached
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, enumerate(workload)))
+        return results, time.perf_counter() - started
+
+    def report(self, results, elapsed):
+        latencies = sorted(latency for latency, _, _ in results)
+        statuses = Counter(status for _, status, _ in results)
+        cached = sum(1 for _, _, hit in results if hit)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+        self.stdout.write(f'{len(results)} requests in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s)')
+        self.stdout.write(
+            f'latency ms  p50 {percentile(50):.1f}  p95 {percentile(95):.1f}  '
+            f'p99 {percentile(99):.1f}  max {latencies[-1] * 1000:.1f}'
+        )
+        self.stdout.write(
+            'status  ' + '  '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))
+            + f'  (cache hits: {cached})'
+        )
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import StudentProfile, XPRankIndex
+
+class Command(BaseCommand):
+    help = (
+        'Compares XP rank index lookups with the COUNT(*) rank query. '
+        'Synthetic profiles are created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        header = f"{'profiles':>10} {'build s':>9} {'count ms':>10} {'index ms':>10} {'speedup':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                build_time = self.populate(size, rng)
+                count_ms, index_ms = self.time_lookups(options['lookups'], rng)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'{size:>10} {build_time:>9.2f} {count_ms:>10.3f} {index_ms:>10.3f} '
+                f'{count_ms / index_ms if index_ms else 0:>8.1f}x'
+            )
+
+    def populate(self, size, rng, batch_size=10000):
+        """Insert size synthetic profiles and rebuild the index over them"""
+        for start in range(0, size, batch_size):
+            stop = min(start + batch_size, size)
+            users = User.objects.bulk_create([
+                User(username=f'rank_bench_{i}', password='!') for i in range(start, stop)
+            ])
+            # bulk_create skips the post_save signals, so no per-row index updates
+            StudentProfile.objects.bulk_create([
+                StudentProfile(
+                    user=user,
+                    student_id=f'RB{i:010d}',
+                    total_xp=int(rng.expovariate(1 / 1500)),
+                )
+                for i, user in zip(range(start, stop), users)
+            ])
+
+        started = time.perf_counter()
+        XPRankIndex.rebuild()
+        return time.perf_counter() - started
+
+    def time_lookups(self, lookups, rng):
+        """Average milliseconds per rank lookup for both strategies"""
+        samples = [int(rng.expovariate(1 / 1500)) for _ in range(lookups)]
+
+        started = time.perf_counter()
+        expected = [StudentProfile.objects.filter(total_xp__gt=xp).count() for xp in samples]
+        count_ms = (time.perf_counter() - started) * 1000 / lookups
+
+        started = time.perf_counter()
+        actual = [XPRankIndex.count_above(xp) for xp in samples]
+        index_ms = (time.perf_counter() - started) * 1000 / lookups
+
+        if expected != actual:
+            raise CommandError('Rank index disagrees with COUNT(*) query')
+        return count_ms, index_ms
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core import retrieval
+
+class Command(BaseCommand):
+    help = (
+        'Builds the BM25 index of case, quiz and anatomy content that the chatbot '
+        'searches before calling the LLM. Content changes mark it stale; run with '
+        '--if-stale on a schedule (e.g. every few minutes from cron) to pick them up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Only rebuild if content changed since the last build')
+        parser.add_argument('--query', help='Search the new index and print the best matches')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            index = retrieval.rebuild_if_stale() if options['if_stale'] else retrieval.build_index()
+        except ImportError as e:
+            raise CommandError(str(e))
+        if index is None:
+            self.stdout.write('Content has not changed since the last build; skipped')
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index.passages)} passages ({len(index.terms)} terms) '
+            f'in {time.perf_counter() - started:.2f}s to {retrieval.index_path()}'
+        ))
+        if options['query']:
+            for match in index.search(options['query'], limit=5):
+                self.stdout.write(
+                    f'{match.confidence:.2f}  {match.score:6.2f}  {match.passage.source}  {match.passage.title[:70]}'
+                )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.achievements import RULES, evaluate_bulk
+
+class Command(BaseCommand):
+    help = 'Awards achievement rules to every qualifying student (use after adding or changing a rule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', dest='types', action='append', help='Only evaluate this achievement type (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        types = options['types']
+        unknown = set(types or []) - set(RULES)
+        if unknown:
+            raise CommandError(f"No rule for: {', '.join(sorted(unknown))}")
+
+        awarded = evaluate_bulk(types, batch_size=options['batch_size'])
+        for achievement_type, count in awarded.items():
+            self.stdout.write(f'{achievement_type}: {count} awarded')
+        self.stdout.write(self.style.SUCCESS(f'Awarded {sum(awarded.values())} achievements'))
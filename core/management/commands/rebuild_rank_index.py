@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core.models import XPRankIndex
+
+class Command(BaseCommand):
+    help = 'Rebuilds the XP rank index from StudentProfile.total_xp'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        indexed = XPRankIndex.rebuild(batch_size=options['batch_size'])
+        nodes = XPRankIndex.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rank index rebuilt: {indexed} profiles in {nodes} nodes'
+        ))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from core.models import StudentProfile, XPTransaction, XPRankIndex
+
+class Command(BaseCommand):
+    help = (
+        'Compares StudentProfile.total_xp and level with the XP ledger and reports drift. '
+        'With --fix, rewrites them from the ledger and rebuilds the rank index; profiles with '
+        'XP but no ledger history (e.g. seeded by scripts/) get an opening balance entry '
+        'instead of being reset. A correction made outside add_xp() is drift too: record it '
+        'with add_xp() before running --fix, or it is reverted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--fix', action='store_true', help='Write the ledger totals back to the profiles')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        fix = options['fix']
+        opened = drifted = 0
+
+        last_pk = 0
+        while True:
+            profiles = list(
+                StudentProfile.objects.filter(pk__gt=last_pk).order_by('pk')[:chunk_size]
+            )
+            if not profiles:
+                break
+            last_pk = profiles[-1].pk
+
+            ledger = dict(
+                XPTransaction.objects.filter(user_id__in=[p.user_id for p in profiles])
+                .values_list('user_id')
+                .annotate(total=Sum('amount'))
+                .order_by()
+            )
+
+            openings = []
+            changed = []
+            for profile in profiles:
+                if profile.user_id not in ledger:
+                    if profile.total_xp:
+                        openings.append(XPTransaction(
+                            user_id=profile.user_id, source='opening_balance', amount=profile.total_xp
+                        ))
+                    continue
+                total_xp = ledger[profile.user_id]
+                level = total_xp // 1000 + 1
+                if profile.total_xp != total_xp or profile.level != level:
+                    self.stdout.write(f'{profile.user_id}: profile has {profile.total_xp} XP, ledger {total_xp} XP')
+                    profile.total_xp = total_xp
+                    profile.level = level
+                    changed.append(profile)
+
+            opened += len(openings)
+            drifted += len(changed)
+            if not fix:
+                continue
+            with transaction.atomic():
+                XPTransaction.objects.bulk_create(openings)
+                StudentProfile.objects.bulk_update(changed, ['total_xp', 'level'])
+
+        if fix:
+            XPRankIndex.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Fixed {drifted} profiles, {opened} opening balances'
+            ))
+        elif drifted or opened:
+            self.stdout.write(self.style.WARNING(
+                f'{drifted} profiles differ from the ledger, {opened} need an opening balance; '
+                'run with --fix to rewrite them from the ledger'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('All profiles match the ledger'))
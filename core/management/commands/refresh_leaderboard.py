@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.leaderboard import refresh_snapshot
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized leaderboard snapshot (run it on a schedule, e.g. every few minutes from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        snapshot = refresh_snapshot(chunk_size=options['chunk_size'])
+        if snapshot is None:
+            self.stdout.write(self.style.WARNING('Another leaderboard refresh is already running; skipped'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Leaderboard snapshot {snapshot.pk} published with {snapshot.total_entries} students'
+        ))
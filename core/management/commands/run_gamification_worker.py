@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.gamification import process_batch, prune_processed, retry_failed
+
+PRUNE_INTERVAL = 60 * 60
+
+class Command(BaseCommand):
+    help = 'Drains the gamification outbox: activities, XP and achievements queued by user actions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit')
+        parser.add_argument('--prune-days', type=int, default=7,
+                            help='Delete applied events older than this many days, checked hourly; 0 keeps them')
+        parser.add_argument('--retry-failed', action='store_true', help='Requeue events that failed before starting')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        if options['retry_failed']:
+            self.stdout.write(f'Requeued {retry_failed()} failed events')
+        self.stdout.write('Gamification worker started')
+        last_pruned = None
+        try:
+            while True:
+                close_old_connections()
+                processed = process_batch(batch_size)
+                total += processed
+                if processed:
+                    self.stdout.write(f'Processed {processed} events')
+                    continue
+                if options['prune_days'] and (last_pruned is None or time.monotonic() - last_pruned > PRUNE_INTERVAL):
+                    pruned = prune_processed(options['prune_days'])
+                    last_pruned = time.monotonic()
+                    if pruned:
+                        self.stdout.write(f'Pruned {pruned} applied events')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Gamification worker stopped after {total} events'))
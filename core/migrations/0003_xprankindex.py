@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:33
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+RANK_INDEX_SIZE = 2 ** 20
+
+
+def build_rank_index(apps, schema_editor):
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    XPRankIndex = apps.get_model('core', 'XPRankIndex')
+
+    tree = defaultdict(int)
+    xp_counts = StudentProfile.objects.order_by().values_list('total_xp').annotate(n=Count('id'))
+    for xp, n in xp_counts:
+        i = min(max(xp, 0), RANK_INDEX_SIZE - 1) + 1
+        while i <= RANK_INDEX_SIZE:
+            tree[i] += n
+            i += i & -i
+
+    XPRankIndex.objects.bulk_create(
+        [XPRankIndex(position=i, count=c) for i, c in tree.items() if c]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_studentprofile_timed_challenges_completed_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XPRankIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_rank_index, migrations.RunPython.noop),
+    ]
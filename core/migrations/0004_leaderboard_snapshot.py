@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0003_xprankindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('rank', models.IntegerField()),
+                ('username', models.CharField(max_length=150)),
+                ('display_name', models.CharField(max_length=300)),
+                ('university', models.CharField(blank=True, max_length=200)),
+                ('year_of_study', models.CharField(max_length=30)),
+                ('level', models.IntegerField()),
+                ('total_xp', models.IntegerField()),
+                ('cases_completed', models.IntegerField()),
+                ('current_streak', models.IntegerField()),
+                ('longest_streak', models.IntegerField()),
+                ('quiz_accuracy', models.FloatField()),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('total_entries', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='studentprofile',
+            index=models.Index(fields=['-total_xp', 'user'], name='profile_xp_rank_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='snapshot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='core.leaderboardsnapshot'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['snapshot', 'user'], name='core_leader_snapsho_b97a5a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaderboardentry',
+            unique_together={('snapshot', 'position')},
+        ),
+    ]
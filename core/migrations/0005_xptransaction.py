@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_ledger_balances(apps, schema_editor):
+    StudentProfile = apps.get_model('core', 'StudentProfile')
+    XPTransaction = apps.get_model('core', 'XPTransaction')
+    XPTransaction.objects.bulk_create([
+        XPTransaction(user_id=user_id, source='opening_balance', amount=total_xp)
+        for user_id, total_xp in StudentProfile.objects.exclude(total_xp=0).values_list('user_id', 'total_xp')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0004_leaderboard_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XPTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('welcome', 'Welcome Bonus'), ('profile', 'Profile'), ('daily_login', 'Daily Login'), ('quiz', 'Quiz'), ('timed_challenge', 'Timed Challenge'), ('case', 'Case Simulation'), ('anatomy', 'Anatomy Explorer'), ('study_session', 'Study Session'), ('opening_balance', 'Opening Balance'), ('other', 'Other')], default='other', max_length=20)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='xp_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='core_xptran_user_id_165f2a_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0005_xptransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GamificationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('quiz_completed', 'Quiz Completed'), ('timed_challenge', 'Timed Challenge'), ('case_step', 'Case Step'), ('case_completed', 'Case Completed'), ('anatomy_viewed', 'Anatomy Viewed'), ('study_session_ended', 'Study Session Ended')], max_length=30)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='core_gamifi_process_1e497c_idx')],
+            },
+        ),
+    ]
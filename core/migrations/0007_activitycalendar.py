@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0006_gamificationevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('days', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='activity_calendar', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    StudySession = apps.get_model('core', 'StudySession')
+    StudyDailyRollup = apps.get_model('core', 'StudyDailyRollup')
+    days = (
+        StudySession.objects.filter(end_time__isnull=False)
+        .annotate(date=TruncDate('start_time'))
+        .values('user_id', 'date')
+        .annotate(minutes=Sum('duration_minutes'), sessions=Count('id'), xp=Sum('xp_earned'))
+        .order_by()
+    )
+    StudyDailyRollup.objects.bulk_create([StudyDailyRollup(**day) for day in days], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0007_activitycalendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudyDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('minutes', models.IntegerField(default=0)),
+                ('sessions', models.IntegerField(default=0)),
+                ('xp', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='study_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
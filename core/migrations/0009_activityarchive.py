@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:43
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0008_studydailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('activity_count', models.IntegerField(default=0)),
+                ('login_count', models.IntegerField(default=0)),
+                ('xp_earned', models.IntegerField(default=0)),
+                ('data', models.BinaryField(default=bytes)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', '-created_at'], name='activity_user_recent_idx'),
+        ),
+        migrations.AddField(
+            model_name='activityarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_archives', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='activityarchive',
+            unique_together={('user', 'month')},
+        ),
+    ]
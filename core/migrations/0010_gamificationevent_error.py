@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_activityarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamificationevent',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_data_to_chunks(apps, schema_editor):
+    ActivityArchive = apps.get_model('core', 'ActivityArchive')
+    ActivityArchiveChunk = apps.get_model('core', 'ActivityArchiveChunk')
+    # Existing blobs are concatenated gzip members, which read back as one chunk
+    for archive in ActivityArchive.objects.exclude(data=b'').only('id', 'data').iterator():
+        ActivityArchiveChunk.objects.create(archive_id=archive.id, data=bytes(archive.data))
+
+
+def move_chunks_to_data(apps, schema_editor):
+    ActivityArchive = apps.get_model('core', 'ActivityArchive')
+    ActivityArchiveChunk = apps.get_model('core', 'ActivityArchiveChunk')
+    for archive in ActivityArchive.objects.only('id').iterator():
+        chunks = ActivityArchiveChunk.objects.filter(archive_id=archive.id).order_by('id')
+        data = b''.join(bytes(chunk.data) for chunk in chunks)
+        ActivityArchive.objects.filter(id=archive.id).update(data=data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_gamificationevent_error'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityArchiveChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='core.activityarchive')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(move_data_to_chunks, move_chunks_to_data),
+        migrations.RemoveField(
+            model_name='activityarchive',
+            name='data',
+        ),
+    ]
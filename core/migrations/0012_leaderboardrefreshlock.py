@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_activityarchivechunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardRefreshLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('acquired_at', models.DateTimeField()),
+            ],
+        ),
+    ]
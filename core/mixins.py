@@ -0,0 +1,79 @@
+"""
+Reusable model mixins.
+
+DirtyFieldsMixin remembers every concrete field's value as it was loaded from
+or last written to the database. save() on an existing row then writes only
+the fields that changed, plus any auto_now timestamps, and skips the query
+(and the save signals) entirely when nothing changed.
+
+Because that save() is an UPDATE of named columns, saving an instance whose
+row was deleted meanwhile raises DatabaseError ("Save with update_fields did
+not affect any rows") instead of silently inserting the stale copy again.
+"""
+import copy
+import datetime
+import decimal
+import uuid
+
+# Values of these types can't change in place, so the snapshot can share them
+IMMUTABLE_TYPES = (
+    type(None), bool, int, float, str, bytes, decimal.Decimal,
+    datetime.date, datetime.time, datetime.timedelta, uuid.UUID,
+)
+
+
+class DirtyFieldsMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Only rows loaded from the database need a snapshot; new instances are inserted whole
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def _snapshot_fields(self, fields=None):
+        """Remember the current value of the given fields (default: all loaded)"""
+        if fields is None or not hasattr(self, '_saved_values'):
+            self._saved_values = {}
+        names = None if fields is None else set(fields)
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if names is not None and field.name not in names and field.attname not in names:
+                continue
+            # Deferred fields are absent from __dict__; reading them would query
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                # Only mutable values (e.g. JSONField dicts) need a copy
+                self._saved_values[field.attname] = value if isinstance(value, IMMUTABLE_TYPES) else copy.deepcopy(value)
+
+    def get_dirty_fields(self):
+        """Names of fields whose value differs from the database copy"""
+        missing = object()
+        saved_values = getattr(self, '_saved_values', {})
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname in self.__dict__
+            and self.__dict__[field.attname] != saved_values.get(field.attname, missing)
+        ]
+
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+            super().save(*args, **kwargs)
+            self._snapshot_fields(kwargs.get('update_fields'))
+            return
+
+        dirty = self.get_dirty_fields()
+        if not dirty:
+            return
+        auto_now = [field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        kwargs['update_fields'] = dirty + [name for name in auto_now if name not in dirty]
+        super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs['update_fields'])
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_fields(fields)
@@ -1,15 +1,53 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Count, Sum, Case, When, Value
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from collections import defaultdict
+from contextlib import contextmanager
+import gzip
+import json
+import threading
 import uuid
 
+from .mixins import DirtyFieldsMixin
+
 
 def generate_student_id():
     return str(uuid.uuid4())[:8].upper()
 
-class StudentProfile(models.Model):
+def dashboard_summary_key(user_id):
+    return f'dashboard-summary:{user_id}'
+
+_dashboard_batch = threading.local()
+
+def forget_dashboard_summary(*user_ids):
+    """Drop the users' cached dashboard summaries once the current transaction commits"""
+    pending = getattr(_dashboard_batch, 'user_ids', None)
+    if pending is not None:
+        pending.update(user_ids)
+        return
+    # Deleting earlier would let a concurrent dashboard load cache pre-commit data
+    keys = [dashboard_summary_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+@contextmanager
+def forget_dashboard_summaries_once():
+    """Within the block, collect forget_dashboard_summary() calls and drop each user's summary once"""
+    pending = _dashboard_batch.user_ids = set()
+    try:
+        yield
+    finally:
+        del _dashboard_batch.user_ids
+    forget_dashboard_summary(*pending)
+
+def earned_achievements_key(user_id):
+    return f'achievements-earned:{user_id}'
+
+class StudentProfile(DirtyFieldsMixin, models.Model):
     YEAR_CHOICES = [
         ('1', 'First Year'),
         ('2', 'Second Year'),
@@ -60,70 +98,62 @@ class StudentProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [models.Index(fields=['-total_xp', 'user'], name='profile_xp_rank_idx')]
+    
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username} - Level {self.level}"
     
-    def add_xp(self, amount):
+    def add_xp(self, amount, source='other'):
         """Add XP and handle level progression"""
-        self.total_xp += amount
-        # Level up logic: every 1000 XP = 1 level
-        new_level = (self.total_xp // 1000) + 1
-        if new_level > self.level:
-            self.level = new_level
-            # Create level up achievement
-            Achievement.objects.get_or_create(
-                user=self.user,
-                achievement_type='level_up',
-                defaults={
-                    'title': f'Level {new_level} Reached!',
-                    'description': f'Congratulations on reaching level {new_level}!',
-                    'xp_reward': 50
-                }
-            )
-        self.save()
+        if not amount:
+            return
+        with transaction.atomic():
+            XPTransaction.objects.create(user_id=self.user_id, source=source, amount=amount)
+            self.apply_xp(amount)
     
-    def update_streak(self):
-        """Update daily streak"""
-        today = timezone.now().date()
-        last_activity_date = self.last_activity.date()
+    def apply_xp(self, amount):
+        """Apply an XP change that is already recorded in the ledger"""
+        old_level = self.level
+        with transaction.atomic():
+            # Atomic increment, so concurrent requests never overwrite each other.
+            # Level up logic: every 1000 XP = 1 level
+            StudentProfile.objects.filter(pk=self.pk).update(
+                level=(F('total_xp') + amount) / 1000 + 1,
+                total_xp=F('total_xp') + amount,
+                updated_at=timezone.now(),
+            )
+            self.refresh_from_db(fields=['total_xp', 'level', 'updated_at'])
+            XPRankIndex.record(old_xp=self.total_xp - amount, new_xp=self.total_xp)
+            forget_dashboard_summary(self.user_id)
         
-        if last_activity_date == today:
-            return  # Already active today
-        elif last_activity_date == today - timezone.timedelta(days=1):
-            self.current_streak += 1
-            if self.current_streak > self.longest_streak:
-                self.longest_streak = self.current_streak
-        else:
-            self.current_streak = 1
+        if self.level > old_level:
+            # Check level up achievement
+            from .achievements import evaluate
+            evaluate(self, fields=['level'])
+    
+    def update_streak(self, calendar=None):
+        """Mark today in the activity calendar and update streaks; True on the first call of the day"""
+        today = timezone.localdate()
+        calendar = calendar or ActivityCalendar.for_user(self.user_id)
+        if not calendar.mark(today):
+            return False  # Already active today
+        calendar.save(update_fields=['start_date', 'days', 'updated_at'])
         
+        self.current_streak = calendar.current_streak(today)
+        # Seeded profiles may carry a longer streak than their calendar history
+        self.longest_streak = max(self.longest_streak, calendar.longest_streak())
         self.last_activity = timezone.now()
-        self.save()
+        self.save(update_fields=['current_streak', 'longest_streak', 'last_activity', 'updated_at'])
         
         # Check for streak achievements
-        if self.current_streak >= 7:
-            Achievement.objects.get_or_create(
-                user=self.user,
-                achievement_type='streak_7',
-                defaults={
-                    'title': 'Week Warrior',
-                    'description': '7-day learning streak!',
-                    'xp_reward': 100
-                }
-            )
-        if self.current_streak >= 30:
-            Achievement.objects.get_or_create(
-                user=self.user,
-                achievement_type='streak_30',
-                defaults={
-                    'title': 'Month Master',
-                    'description': '30-day learning streak!',
-                    'xp_reward': 500
-                }
-            )
+        from .achievements import evaluate
+        evaluate(self, fields=['longest_streak'])
+        return True
     
     def get_rank(self):
         """Get user's rank based on XP"""
-        return StudentProfile.objects.filter(total_xp__gt=self.total_xp).count() + 1
+        return XPRankIndex.count_above(self.total_xp) + 1
     
     def get_level_progress(self):
         """Get progress to next level as percentage"""
@@ -135,6 +165,276 @@ class StudentProfile(models.Model):
         return 1000 - (self.total_xp % 1000)
 
 
+class XPRankIndex(models.Model):
+    """
+    Fenwick tree over total_xp, persisted one row per non-empty node.
+
+    Each profile is counted once at the slot for its XP, so rank lookups and
+    updates touch O(log SIZE) rows and never scan the profile table.
+    """
+    SIZE = 2 ** 20  # XP at or above SIZE - 1 shares the top slot
+
+    position = models.PositiveIntegerField(unique=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Node {self.position}: {self.count}"
+
+    @classmethod
+    def slot(cls, xp):
+        """1-based tree position for an XP value"""
+        return min(max(xp, 0), cls.SIZE - 1) + 1
+
+    @classmethod
+    def update_path(cls, xp):
+        i = cls.slot(xp)
+        while i <= cls.SIZE:
+            yield i
+            i += i & -i
+
+    @classmethod
+    def prefix_path(cls, xp):
+        i = cls.slot(xp)
+        while i > 0:
+            yield i
+            i -= i & -i
+
+    @classmethod
+    def record(cls, old_xp=None, new_xp=None):
+        """Move one profile from old_xp to new_xp (None = not indexed)"""
+        deltas = defaultdict(int)
+        if old_xp is not None:
+            for position in cls.update_path(old_xp):
+                deltas[position] -= 1
+        if new_xp is not None:
+            for position in cls.update_path(new_xp):
+                deltas[position] += 1
+
+        # Paths of nearby XP values converge, so most shared nodes cancel out
+        deltas = {position: delta for position, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        with transaction.atomic():
+            if cls._add(deltas) < len(deltas):
+                # Some nodes don't exist yet: take the change back, create the
+                # missing nodes empty and apply it once more. Nodes are never
+                # deleted outside rebuild(), so every node ends up with exactly
+                # its delta even if another request created one meanwhile
+                cls._add({position: -delta for position, delta in deltas.items()})
+                cls.objects.bulk_create(
+                    [cls(position=position, count=0) for position in deltas], ignore_conflicts=True
+                )
+                cls._add(deltas)
+
+    @classmethod
+    def _add(cls, deltas):
+        """Add each delta to its node in a single UPDATE; returns how many of the nodes exist"""
+        return cls.objects.filter(position__in=list(deltas)).update(count=F('count') + Case(
+            *[When(position=position, then=Value(delta)) for position, delta in deltas.items()],
+            default=Value(0),
+        ))
+
+    @classmethod
+    def count_above(cls, xp):
+        """Number of profiles with strictly more XP than xp"""
+        prefix = list(cls.prefix_path(xp))
+        counts = dict(
+            cls.objects.filter(position__in=prefix + [cls.SIZE]).values_list('position', 'count')
+        )
+        at_or_below = sum(counts.get(position, 0) for position in prefix)
+        return counts.get(cls.SIZE, 0) - at_or_below
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+        """Rebuild the whole tree from StudentProfile.total_xp"""
+        tree = [0] * (cls.SIZE + 1)
+        xp_counts = StudentProfile.objects.order_by().values_list('total_xp').annotate(n=Count('id'))
+        for xp, n in xp_counts:
+            tree[cls.slot(xp)] += n
+
+        # Linear-time construction: push each node's sum up to its parent
+        for i in range(1, cls.SIZE + 1):
+            parent = i + (i & -i)
+            if parent <= cls.SIZE:
+                tree[parent] += tree[i]
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(
+                [cls(position=i, count=c) for i, c in enumerate(tree) if i and c],
+                batch_size=batch_size,
+            )
+        return tree[cls.SIZE]
+
+
+class ActivityCalendar(models.Model):
+    """
+    One bit per day a student was active, bit 0 being start_date. Streaks,
+    "active today" and the dashboard heatmap are all bit operations on it.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='activity_calendar')
+    start_date = models.DateField()
+    days = models.BinaryField(default=bytes)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.active_days()} active days"
+    
+    @classmethod
+    def for_user(cls, user_id):
+        """Load the calendar, seeding it once from the user's activity history"""
+        try:
+            return cls.objects.get(user_id=user_id)
+        except cls.DoesNotExist:
+            today = timezone.localdate()
+            calendar = cls(user_id=user_id, start_date=today)
+            for day in Activity.objects.filter(user_id=user_id).dates('created_at', 'day'):
+                # Today is left to update_streak(), which skips a day already marked
+                if day < today:
+                    calendar.mark(day)
+            try:
+                with transaction.atomic():
+                    calendar.save()
+            except IntegrityError:
+                return cls.objects.get(user_id=user_id)
+            return calendar
+    
+    @property
+    def bits(self):
+        return int.from_bytes(self.days, 'little')
+    
+    @bits.setter
+    def bits(self, value):
+        self.days = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+    
+    def _index(self, day):
+        return (day - self.start_date).days
+    
+    def is_active(self, day):
+        index = self._index(day)
+        return index >= 0 and bool(self.bits >> index & 1)
+    
+    def mark(self, day):
+        """Set the bit for day; returns False if it was already set"""
+        bits = self.bits
+        index = self._index(day)
+        if index < 0:
+            # Day precedes the calendar: move the origin back
+            bits <<= -index
+            self.start_date = day
+            index = 0
+        if bits >> index & 1:
+            return False
+        self.bits = bits | 1 << index
+        return True
+    
+    def current_streak(self, today):
+        """Run of active days ending today, or yesterday if today is not marked yet"""
+        end = self._index(today)
+        if end < 0:
+            return 0
+        if not self.bits >> end & 1:
+            end -= 1
+        if end < 0:
+            return 0
+        window = self.bits & ((1 << (end + 1)) - 1)
+        gaps = ~window & ((1 << (end + 1)) - 1)
+        # The highest clear bit at or below `end` is where the run starts
+        return end + 1 if not gaps else end - (gaps.bit_length() - 1)
+    
+    def longest_streak(self):
+        bits = self.bits
+        longest = 0
+        while bits:
+            bits &= bits >> 1
+            longest += 1
+        return longest
+    
+    def active_days(self):
+        return bin(self.bits).count('1')
+    
+    def heatmap(self, today, days=84):
+        """(date, active) pairs for the last `days` days, oldest first"""
+        first = self._index(today) - days + 1
+        window = self.bits >> first if first >= 0 else self.bits << -first
+        return [
+            (today - timezone.timedelta(days=days - 1 - i), bool(window >> i & 1))
+            for i in range(days)
+        ]
+
+
+class LeaderboardSnapshot(models.Model):
+    """A materialized ranking of every student, rebuilt by refresh_leaderboard"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    total_entries = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Leaderboard snapshot {self.pk} ({self.total_entries} students)"
+
+class LeaderboardEntry(models.Model):
+    snapshot = models.ForeignKey(LeaderboardSnapshot, on_delete=models.CASCADE, related_name='entries')
+    position = models.IntegerField()  # 1-based row number, used as the keyset cursor
+    rank = models.IntegerField()  # competition rank, students with equal XP share it
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    username = models.CharField(max_length=150)
+    display_name = models.CharField(max_length=300)
+    university = models.CharField(max_length=200, blank=True)
+    year_of_study = models.CharField(max_length=30)
+    level = models.IntegerField()
+    total_xp = models.IntegerField()
+    cases_completed = models.IntegerField()
+    current_streak = models.IntegerField()
+    longest_streak = models.IntegerField()
+    quiz_accuracy = models.FloatField()
+    
+    class Meta:
+        ordering = ['position']
+        unique_together = ['snapshot', 'position']
+        indexes = [models.Index(fields=['snapshot', 'user'])]
+        verbose_name_plural = 'Leaderboard entries'
+    
+    def __str__(self):
+        return f"#{self.rank} {self.username} - {self.total_xp} XP"
+
+
+class LeaderboardRefreshLock(models.Model):
+    """Held while refresh_leaderboard runs; the unique name lets only one run insert it"""
+    name = models.CharField(max_length=50, unique=True)
+    acquired_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} since {self.acquired_at}"
+
+
+class XPTransaction(models.Model):
+    """Append-only ledger of every XP change; StudentProfile.total_xp is its running sum"""
+    SOURCE_CHOICES = [
+        ('welcome', 'Welcome Bonus'),
+        ('profile', 'Profile'),
+        ('daily_login', 'Daily Login'),
+        ('quiz', 'Quiz'),
+        ('timed_challenge', 'Timed Challenge'),
+        ('case', 'Case Simulation'),
+        ('anatomy', 'Anatomy Explorer'),
+        ('study_session', 'Study Session'),
+        ('opening_balance', 'Opening Balance'),
+        ('other', 'Other'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='xp_transactions')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='other')
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
+    def __str__(self):
+        return f"{self.user.username} {self.amount:+d} XP ({self.get_source_display()})"
+
+
 class Achievement(models.Model):
     ACHIEVEMENT_TYPES = [
         ('case_master', 'Case Master'),
@@ -186,10 +486,82 @@ class Activity(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Activities'
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='activity_user_recent_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
+class ActivityArchive(models.Model):
+    """
+    One user's archived activities for one month. The rows themselves are in
+    ActivityArchiveChunk, one per archive_activities chunk; login rows are
+    kept only as a count.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_archives')
+    month = models.DateField()  # first day of the month
+    activity_count = models.IntegerField(default=0)
+    login_count = models.IntegerField(default=0)
+    xp_earned = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-month']
+        unique_together = ['user', 'month']
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.month:%Y-%m}: {self.activity_count} activities"
+    
+    @classmethod
+    def append(cls, user_id, month, activities):
+        """Add activities to the month's archive as a new chunk (call inside a transaction)"""
+        archive, _ = cls.objects.get_or_create(user_id=user_id, month=month)
+        lines = []
+        login_count = xp_earned = 0
+        for activity in activities:
+            xp_earned += activity.xp_earned
+            if activity.activity_type == 'login':
+                login_count += 1
+                continue
+            lines.append(json.dumps({
+                'id': activity.id,
+                'activity_type': activity.activity_type,
+                'title': activity.title,
+                'description': activity.description,
+                'xp_earned': activity.xp_earned,
+                'created_at': activity.created_at.isoformat(),
+            }))
+        # Counters move by increments and earlier chunks are never read back,
+        # so each call writes only what it adds
+        cls.objects.filter(pk=archive.pk).update(
+            activity_count=F('activity_count') + len(activities),
+            login_count=F('login_count') + login_count,
+            xp_earned=F('xp_earned') + xp_earned,
+            updated_at=timezone.now(),
+        )
+        if lines:
+            ActivityArchiveChunk.objects.create(
+                archive=archive, data=gzip.compress('\n'.join(lines).encode() + b'\n'),
+            )
+    
+    def entries(self):
+        """Archived non-login activities as dicts"""
+        entries = []
+        for chunk in self.chunks.all():
+            entries += [json.loads(line) for line in gzip.decompress(bytes(chunk.data)).decode().splitlines()]
+        return entries
+
+class ActivityArchiveChunk(models.Model):
+    """Gzipped JSONL of the activities one archive_activities chunk moved into an archive"""
+    archive = models.ForeignKey(ActivityArchive, on_delete=models.CASCADE, related_name='chunks')
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+
 class StudySession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     start_time = models.DateTimeField(auto_now_add=True)
@@ -201,6 +573,56 @@ class StudySession(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.start_time.date()}"
 
+class StudyDailyRollup(models.Model):
+    """Study minutes, sessions and XP per user per day, kept by end_study_session"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='study_rollups')
+    date = models.DateField()
+    minutes = models.IntegerField(default=0)
+    sessions = models.IntegerField(default=0)
+    xp = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['user', 'date']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.date}: {self.minutes} min"
+    
+    @classmethod
+    def record(cls, session):
+        """Add a finished session to the rollup for the day it started"""
+        day = timezone.localdate(session.start_time)
+        changes = {
+            'minutes': F('minutes') + session.duration_minutes,
+            'sessions': F('sessions') + 1,
+            'xp': F('xp') + session.xp_earned,
+        }
+        if cls.objects.filter(user_id=session.user_id, date=day).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=session.user_id, date=day, minutes=session.duration_minutes,
+                    sessions=1, xp=session.xp_earned,
+                )
+        except IntegrityError:
+            # Another session for the same day created the row first
+            cls.objects.filter(user_id=session.user_id, date=day).update(**changes)
+    
+    @classmethod
+    def totals(cls, user_id, today=None):
+        """Today, this week and all-time study totals in one query"""
+        today = today or timezone.localdate()
+        week_start = today - timezone.timedelta(days=today.weekday())
+        totals = cls.objects.filter(user_id=user_id).aggregate(
+            today_minutes=Sum('minutes', filter=Q(date=today)),
+            week_minutes=Sum('minutes', filter=Q(date__gte=week_start)),
+            total_minutes=Sum('minutes'),
+            total_sessions=Sum('sessions'),
+            total_xp=Sum('xp'),
+        )
+        return {name: value or 0 for name, value in totals.items()}
+
 class TimedChallengeAttempt(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     score = models.IntegerField()
@@ -215,6 +637,54 @@ class TimedChallengeAttempt(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.score}/{self.total_questions} in {self.time_taken}s"
 
+class GamificationEvent(models.Model):
+    """
+    Outbox row for the XP, activity and achievement side effects of a user
+    action. Written in the same transaction as the action itself and drained
+    in batches by `manage.py run_gamification_worker`.
+    """
+    EVENT_TYPES = [
+        ('quiz_completed', 'Quiz Completed'),
+        ('timed_challenge', 'Timed Challenge'),
+        ('case_step', 'Case Step'),
+        ('case_completed', 'Case Completed'),
+        ('anatomy_viewed', 'Anatomy Viewed'),
+        ('study_session_ended', 'Study Session Ended'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    # {"xp": int, "source": str, "activity": {...} or null, "counters": {field: n}}
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)  # set when applying the event failed
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['processed_at', 'id'])]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.event_type}"
+    
+    @classmethod
+    def publish(cls, user, event_type, xp=0, source='other', activity=None, counters=None):
+        """Queue side effects; call inside the transaction that made the change"""
+        event = cls.objects.create(
+            user=user,
+            event_type=event_type,
+            payload={
+                'xp': xp,
+                'source': source,
+                'activity': activity,
+                'counters': counters or {},
+            },
+        )
+        if getattr(settings, 'GAMIFICATION_PROCESS_INLINE', False):
+            from .gamification import process_batch
+            transaction.on_commit(process_batch)
+        return event
+
 # Signal handlers - KEEP ONLY ONE SET!
 @receiver(post_save, sender=User)
 def create_student_profile(sender, instance, created, **kwargs):
@@ -223,25 +693,58 @@ def create_student_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_student_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'studentprofile'):
+    # Only a profile already loaded on this user can have unsaved changes
+    if User.studentprofile.related.is_cached(instance):
         instance.studentprofile.save()
 
+@receiver(post_save, sender=StudentProfile)
+def index_new_student_profile(sender, instance, created, **kwargs):
+    if created:
+        XPRankIndex.record(new_xp=instance.total_xp)
+
+@receiver(post_delete, sender=StudentProfile)
+def unindex_student_profile(sender, instance, **kwargs):
+    XPRankIndex.record(old_xp=instance.total_xp)
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+@receiver(post_save, sender=StudySession)
+@receiver(post_delete, sender=StudySession)
+def invalidate_dashboard_summary(sender, instance, **kwargs):
+    forget_dashboard_summary(instance.user_id)
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def invalidate_earned_achievements(sender, instance, **kwargs):
+    key = earned_achievements_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+@receiver(post_save, sender='cases.Case')
+@receiver(post_delete, sender='cases.Case')
+@receiver(post_save, sender='cases.CaseStep')
+@receiver(post_delete, sender='cases.CaseStep')
+@receiver(post_save, sender='cases.Choice')
+@receiver(post_delete, sender='cases.Choice')
+@receiver(post_save, sender='quizzes.Question')
+@receiver(post_delete, sender='quizzes.Question')
+@receiver(post_save, sender='anatomy.AnatomyStructure')
+@receiver(post_delete, sender='anatomy.AnatomyStructure')
+def mark_retrieval_index_stale(sender, instance, **kwargs):
+    from .retrieval import mark_stale
+    transaction.on_commit(mark_stale)
+
 # Signal to update timed challenge count
 @receiver(post_save, sender=TimedChallengeAttempt)
 def update_timed_challenge_count(sender, instance, created, **kwargs):
     if created:
         profile = instance.user.studentprofile
-        profile.timed_challenges_completed += 1
-        profile.save()
+        StudentProfile.objects.filter(pk=profile.pk).update(
+            timed_challenges_completed=F('timed_challenges_completed') + 1
+        )
+        profile.refresh_from_db(fields=['timed_challenges_completed'])
         
-        # Create achievement for first timed challenge
-        if profile.timed_challenges_completed == 1:
-            Achievement.objects.get_or_create(
-                user=instance.user,
-                achievement_type='first_timed_challenge',
-                defaults={
-                    'title': 'Time Attacker',
-                    'description': 'Completed your first timed challenge!',
-                    'xp_reward': 50
-                }
-            )
\ No newline at end of file
+        # Check achievement for first timed challenge
+        from .achievements import evaluate
+        evaluate(profile, fields=['timed_challenges_completed'])
@@ -0,0 +1,199 @@
+"""
+Fail-fast protection for calls to a slow or rate-limited upstream.
+
+- TokenBucket / KeyedTokenBuckets: request rate limits (global and per key).
+- CircuitBreaker: after repeated failures, reject calls for a cool-down
+  period instead of waiting on a degraded upstream, then let one trial through.
+- LoadShedder: reject new calls while too many are already in flight.
+- Guard: all of the above plus a hard deadline around a single call.
+
+A thread can't be stopped, so a call past its deadline keeps running until
+the upstream returns or its own request timeout fires (the Gemini backend
+uses the same deadline). Guard keeps such a call's in-flight slot until it
+really ends, so abandoned calls are bounded by max_in_flight: once that many
+are stuck, new calls are shed instead of queueing behind them.
+
+Every rejection is a Rejected subclass carrying a user-facing message, so
+callers can serve a fallback without inspecting error strings.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+
+
+class Rejected(Exception):
+    message = 'Service temporarily unavailable due to high demand. Please try again in a moment.'
+
+    def __init__(self, message=None):
+        if message:
+            self.message = message
+        super().__init__(self.message)
+
+
+class RateLimited(Rejected):
+    message = 'You are sending questions too quickly. Please wait a moment and try again.'
+
+
+class Overloaded(Rejected):
+    pass
+
+
+class CircuitOpen(Rejected):
+    pass
+
+
+class DeadlineExceeded(Rejected):
+    message = 'Response took too long. Please try a shorter question.'
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+
+class KeyedTokenBuckets:
+    """One TokenBucket per key (e.g. per user), keeping the max_keys most recent"""
+
+    def __init__(self, rate, capacity, max_keys=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+                if len(self._buckets) > self.max_keys:
+                    # The least recently seen key would have refilled by now anyway
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        return bucket.consume(tokens)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, trial_timeout=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # A trial that never reports back must not keep the circuit half-open forever
+        self.trial_timeout = reset_timeout if trial_timeout is None else trial_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go ahead"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if (
+                (self.state == self.OPEN and now - self._opened_at >= self.reset_timeout)
+                or (self.state == self.HALF_OPEN and now - self._trial_started_at >= self.trial_timeout)
+            ):
+                # Let exactly one trial call through
+                self.state = self.HALF_OPEN
+                self._trial_started_at = now
+                return
+            raise CircuitOpen()
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class LoadShedder:
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def acquire(self):
+        """Take one in-flight slot, raising Overloaded if none is free"""
+        if not self._slots.acquire(blocking=False):
+            raise Overloaded()
+
+    def release(self):
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        """Hold one in-flight slot for the block, raising Overloaded if none is free"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Guard:
+    """Rate limit, circuit breaker, load shedding and a deadline for one upstream"""
+
+    def __init__(self, rate, burst, deadline, max_in_flight, failure_threshold, reset_timeout):
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.shedder = LoadShedder(max_in_flight)
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='guarded-call')
+
+    def admit(self):
+        """Raise a Rejected error if a call may not start now"""
+        if not self.bucket.consume():
+            raise Overloaded()
+        self.breaker.before_call()
+
+    def call(self, fn):
+        """fn() with every protection applied"""
+        self.shedder.acquire()
+        try:
+            self.admit()
+            future = self._executor.submit(fn)
+        except BaseException:
+            self.shedder.release()
+            raise
+        # Released when fn really returns, even if we stop waiting at the deadline
+        future.add_done_callback(lambda _: self.shedder.release())
+        try:
+            result = future.result(timeout=self.deadline)
+        except TimeoutError:
+            self.breaker.record_failure()
+            raise DeadlineExceeded()
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
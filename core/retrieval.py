@@ -0,0 +1,229 @@
+"""
+Local BM25 retrieval over the platform's own medical content.
+
+Case histories, case steps and choice consequences, quiz explanations and
+anatomy structures are split into passages and indexed as a sparse
+passage-by-term matrix of precomputed BM25 weights, so scoring a question is
+one column slice and a row sum. The index is pickled to RETRIEVAL_INDEX_PATH
+by `manage.py build_retrieval_index` and reloaded by every process when the
+file changes. Content changes only mark the index stale; the command run
+with --if-stale (e.g. from cron) rebuilds it.
+
+Only explanatory passages (anatomy text, quiz explanations) may answer a
+question on their own. Case vignettes, steps and choice consequences are
+written for a scenario ("Correct! ...") and only ever ground the LLM.
+
+NumPy and SciPy are optional: without them search() finds nothing and the
+chatbot simply asks the LLM.
+"""
+import math
+import os
+import pickle
+import tempfile
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .answer_cache import normalize_prompt, stem
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+K1 = 1.5
+B = 0.75
+STALE_KEY = 'retrieval-index-stale'
+
+# A match answers the question on its own only if it is this confident and
+# clearly ahead of the runner-up; weaker matches become LLM context instead
+DIRECT_CONFIDENCE = 0.9
+DIRECT_MARGIN = 1.5
+DIRECT_SOURCES = frozenset({'anatomy', 'quiz-question'})
+CONTEXT_CONFIDENCE = 0.3
+CONTEXT_PASSAGES = 3
+CONTEXT_CHARS = 300
+
+STOPWORDS = frozenset("""
+    a about an and are as at be by can describe do does explain for from how in
+    is it its of on or tell than that the their this to what when where which
+    who why with
+""".split())
+
+Passage = namedtuple('Passage', ['source', 'title', 'text'])
+Match = namedtuple('Match', ['passage', 'score', 'confidence'])
+
+
+def tokenize(text):
+    return [stem(word) for word in normalize_prompt(text).split() if word not in STOPWORDS]
+
+
+def collect_passages():
+    """Every indexable passage of platform content"""
+    from anatomy.models import AnatomyStructure
+    from cases.models import Case, CaseStep, Choice
+    from quizzes.models import Question
+
+    for case in Case.objects.filter(is_active=True):
+        yield Passage(f'case:{case.pk}', case.title, f'{case.description} {case.patient_info}')
+    for step in CaseStep.objects.select_related('case').filter(case__is_active=True):
+        yield Passage(
+            f'case-step:{step.pk}', f'{step.case.title}: {step.title}',
+            f'{step.description} {step.patient_info}'.strip(),
+        )
+    for choice in Choice.objects.select_related('step__case').filter(step__case__is_active=True).exclude(consequence=''):
+        yield Passage(f'case-choice:{choice.pk}', f'{choice.step.case.title}: {choice.text}', choice.consequence)
+    for question in Question.objects.exclude(explanation=''):
+        yield Passage(f'quiz-question:{question.pk}', question.question_text, question.explanation)
+    for structure in AnatomyStructure.objects.all():
+        yield Passage(
+            f'anatomy:{structure.pk}', structure.name,
+            f'{structure.description} {structure.function}',
+        )
+
+
+class RetrievalIndex:
+    def __init__(self, passages, terms, idf, weights):
+        self.passages = passages
+        self.terms = terms
+        self.idf = idf
+        self.weights = weights  # CSC: passages x terms
+
+    @classmethod
+    def build(cls, passages):
+        passages = list(passages)
+        terms = {}
+        rows, cols, counts = [], [], []
+        for row, passage in enumerate(passages):
+            for term, count in Counter(tokenize(f'{passage.title} {passage.text}')).items():
+                rows.append(row)
+                cols.append(terms.setdefault(term, len(terms)))
+                counts.append(count)
+
+        n = len(passages)
+        rows, cols, tf = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(counts, dtype=float)
+        length = np.bincount(rows, weights=tf, minlength=n)
+        avg_length = length.mean() if n else 1.0
+        df = np.bincount(cols, minlength=len(terms))
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        norm = K1 * (1 - B + B * length[rows] / (avg_length or 1.0))
+        weights = sparse.csc_matrix(
+            (idf[cols] * tf * (K1 + 1) / (tf + norm), (rows, cols)),
+            shape=(n, len(terms)),
+        )
+        return cls(passages, terms, idf, weights)
+
+    def search(self, query, limit=3):
+        """Best passages for the query, each with its BM25 score and a 0-1 confidence"""
+        tokens = set(tokenize(query))
+        columns = [self.terms[token] for token in tokens if token in self.terms]
+        if not columns:
+            return []
+
+        scores = np.asarray(self.weights[:, columns].sum(axis=1)).ravel()
+        # Score of an average-length passage containing every query term once;
+        # terms the corpus lacks count at the rarest idf, lowering confidence
+        rarest = math.log(1 + (len(self.passages) + 0.5) / 0.5)
+        reference = self.idf[columns].sum() + rarest * (len(tokens) - len(columns))
+
+        best = np.argsort(-scores)[:limit]
+        return [
+            Match(self.passages[i], float(scores[i]), min(1.0, float(scores[i] / reference)))
+            for i in best if scores[i] > 0
+        ]
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def index_path():
+    return getattr(settings, 'RETRIEVAL_INDEX_PATH', None) or os.path.join(
+        settings.BASE_DIR, 'cache', 'retrieval_index.pkl'
+    )
+
+
+def build_index():
+    """Index all platform content and save it for every process to load"""
+    if np is None:
+        raise ImportError('Building the retrieval index requires numpy and scipy')
+    index = RetrievalIndex.build(collect_passages())
+    path = index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return index
+
+
+def get_index():
+    """The saved index, reloaded whenever the file changes; None if there is none"""
+    global _index, _index_mtime
+    if np is None:
+        return None
+    try:
+        mtime = os.stat(index_path()).st_mtime
+    except OSError:
+        return None
+    if mtime != _index_mtime:
+        with _index_lock:
+            if mtime != _index_mtime:
+                with open(index_path(), 'rb') as f:
+                    _index = pickle.load(f)
+                _index_mtime = mtime
+    return _index
+
+
+def search(query, limit=3):
+    index = get_index()
+    return index.search(query, limit) if index is not None else []
+
+
+def lookup(question):
+    """(reply straight from platform content, or None; context for the LLM, or None)"""
+    matches = search(question, limit=CONTEXT_PASSAGES)
+    if not matches:
+        return None, None
+
+    top = matches[0]
+    runner_up = matches[1].score if len(matches) > 1 else 0.0
+    if (
+        answers_directly(top.passage)
+        and top.confidence >= DIRECT_CONFIDENCE
+        and top.score >= DIRECT_MARGIN * runner_up
+    ):
+        return top.passage.text, None
+
+    context = '\n'.join(
+        f'- {match.passage.title}: {match.passage.text[:CONTEXT_CHARS]}'
+        for match in matches if match.confidence >= CONTEXT_CONFIDENCE
+    )
+    return None, context or None
+
+
+def answers_directly(passage):
+    return passage.source.split(':', 1)[0] in DIRECT_SOURCES
+
+
+def mark_stale():
+    """Note that content changed, for the next `build_retrieval_index --if-stale`"""
+    cache.set(STALE_KEY, True, None)
+
+
+def rebuild_if_stale():
+    """Rebuild the index if content changed since the last build; the new index or None"""
+    if not cache.get(STALE_KEY):
+        return None
+    # Cleared first, so changes made during the build mark it stale again
+    cache.delete(STALE_KEY)
+    try:
+        return build_index()
+    except BaseException:
+        mark_stale()
+        raise
@@ -0,0 +1,211 @@
+"""
+Single-flight call coalescing.
+
+SingleFlight.do(key, fn) runs fn once for every caller that asks for the same
+key while a call is already in flight. Callers in the same process wait on the
+leader's future; callers in other processes on the host wait on a file lock
+and pick up the result the leader wrote next to it, as JSON, so fn must
+return a JSON value (the chatbot's replies are strings) to be shared across
+processes. Without fcntl (Windows) only in-process callers are coalesced.
+
+Waiters trust whatever they read from the directory, so it must be private:
+it is created 0700 and, if it already exists, used only when it is a real
+directory owned by this user with no group or other access. Otherwise
+coalescing stays in-process and a warning is printed.
+
+A result file is only useful to callers that were already waiting when it
+was written, so leaders sweep the directory now and then and delete result
+files older than twice wait_timeout, along with lock files nobody holds.
+Deleting a lock file can at worst let two processes lead the same key once.
+"""
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_missing = object()
+
+
+class SingleFlight:
+    def __init__(self, name, directory=None, wait_timeout=30.0, poll_interval=0.05, sweep_interval=60.0):
+        self.name = name
+        self.directory = directory or os.path.join(tempfile.gettempdir(), f'singleflight-{name}-{os.getuid()}')
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'saved': 0}
+        self._last_sweep = 0.0
+        self._shared = fcntl is not None and _private_directory(self.directory)
+
+    def do(self, key, fn):
+        """Result of fn(), shared with concurrent callers of the same key; returns (result, shared)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            try:
+                result = future.result(timeout=self.wait_timeout)
+            except TimeoutError:
+                # The leader is stuck; don't queue behind it
+                return self._call(fn), False
+            self._count('saved')
+            return result, True
+
+        try:
+            result, shared = self._run_across_processes(key, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, shared
+
+    def stats(self):
+        """Upstream calls made and calls saved by coalescing, in this process"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _run_across_processes(self, key, fn):
+        if not self._shared:
+            return self._call(fn), False
+
+        self._sweep_if_due()
+        path = os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+        started = time.time()
+        with open(path + '.lock', 'a') as lock_file:
+            acquired, waited = self._acquire(lock_file)
+            if not acquired:
+                return self._call(fn), False
+            try:
+                if waited:
+                    # Another process held the lock; use its result if it finished after we asked
+                    result = self._read_result(path, since=started)
+                    if result is not _missing:
+                        self._count('saved')
+                        return result, True
+                result = self._call(fn)
+                self._write_result(path, result)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        """Take the host-wide lock for the key within wait_timeout; returns (acquired, waited)"""
+        waited = False
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True, waited
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() >= deadline:
+                    return False, waited
+                time.sleep(self.poll_interval)
+
+    def _read_result(self, path, since):
+        try:
+            if os.path.getmtime(path + '.result') < since:
+                return _missing
+            with open(path + '.result', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return _missing
+
+    def _write_result(self, path, result):
+        try:
+            data = json.dumps(result)
+        except (TypeError, ValueError):
+            # Not shareable across processes; waiters there make their own call
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path + '.result')
+
+    def _sweep_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.sweep()
+        except OSError as e:
+            print(f"Single-flight sweep of {self.directory} failed: {e}")
+
+    def sweep(self, max_age=None):
+        """Delete result and temp files older than max_age and unheld lock files; returns how many"""
+        if not self._shared:
+            return 0
+        cutoff = time.time() - (2 * self.wait_timeout if max_age is None else max_age)
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                    if entry.name.endswith('.lock'):
+                        if not self._remove_unheld_lock(entry.path):
+                            continue
+                    else:
+                        os.unlink(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    # Another process swept it first
+                    continue
+        return removed
+
+    def _remove_unheld_lock(self, path):
+        with open(path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                os.unlink(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return True
+
+    def _call(self, fn):
+        self._count('calls')
+        return fn()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def _private_directory(path):
+    """Create path 0700 if needed; True if it is a directory only this user can use"""
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError as e:
+        print(f"Single-flight directory {path} is unusable ({e}); coalescing in-process only")
+        return False
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        print(
+            f"Single-flight directory {path} is not a private directory owned by this user "
+            f"(mode {stat.filemode(info.st_mode)}); coalescing in-process only"
+        )
+        return False
+    return True
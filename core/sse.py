@@ -0,0 +1,10 @@
+"""
+Server-Sent Events formatting shared by the streaming views.
+"""
+import json
+
+
+def sse_message(data, event=None):
+    """One Server-Sent Events message carrying data as JSON"""
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
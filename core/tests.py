@@ -0,0 +1,868 @@
+from datetime import date, datetime
+from io import StringIO
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.sites import site as admin_site
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Q, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from anatomy.models import AnatomyStructure, AnatomySystem
+from core.achievements import RULES, _award, evaluate
+from core.answer_cache import AnswerCache
+from core import dashboard, views as core_views
+from core.gamification import process_batch, prune_processed, retry_failed
+from core.leaderboard import REFRESH_LOCK_NAME, REFRESH_LOCK_TIMEOUT, current_snapshot, refresh_snapshot
+from core.models import (
+    Achievement, Activity, ActivityArchive, ActivityCalendar, GamificationEvent, LeaderboardEntry, LeaderboardRefreshLock,
+    LeaderboardSnapshot, StudentProfile, StudyDailyRollup, StudySession, XPRankIndex, XPTransaction, dashboard_summary_key, earned_achievements_key,
+)
+from core.retrieval import Passage, RetrievalIndex, lookup, np, rebuild_if_stale, search
+from core.resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Guard, Overloaded
+from core.singleflight import SingleFlight, fcntl
+
+# Keep test runs out of the shared file cache
+LOCMEM_CACHES = {**settings.CACHES, 'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GamificationWorkerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+
+    def publish(self, xp=10, activity=None):
+        return GamificationEvent.publish(self.user, 'quiz_completed', xp=xp, source='quiz', activity=activity)
+
+    def test_failing_event_does_not_block_the_batch(self):
+        good = self.publish(activity={'activity_type': 'quiz', 'title': 'Quiz'})
+        bad = self.publish(activity={'no_such_field': 1})
+        later = self.publish(xp=5)
+
+        self.assertEqual(process_batch(), 3)
+
+        bad.refresh_from_db()
+        self.assertIsNotNone(bad.processed_at)
+        self.assertIn('no_such_field', bad.error)
+        self.assertFalse(GamificationEvent.objects.filter(pk__in=[good.pk, later.pk]).exclude(error='').exists())
+        self.assertEqual(Activity.objects.filter(user=self.user, title='Quiz').count(), 1)
+        self.user.studentprofile.refresh_from_db()
+        self.assertEqual(self.user.studentprofile.total_xp, 15)  # the failed event applied nothing
+        # Nothing left to retry on the next pass
+        self.assertEqual(process_batch(), 0)
+
+    def test_retry_failed_requeues_events(self):
+        bad = self.publish(activity={'no_such_field': 1})
+        process_batch()
+
+        self.assertEqual(retry_failed(), 1)
+        bad.refresh_from_db()
+        self.assertIsNone(bad.processed_at)
+        self.assertEqual(bad.error, '')
+
+    def test_prune_keeps_recent_and_failed_events(self):
+        old = self.publish()
+        bad = self.publish(activity={'no_such_field': 1})
+        recent = self.publish()
+        process_batch()
+        GamificationEvent.objects.filter(pk__in=[old.pk, bad.pk]).update(
+            processed_at=timezone.now() - timezone.timedelta(days=30)
+        )
+
+        self.assertEqual(prune_processed(days=7), 1)
+        self.assertEqual(
+            set(GamificationEvent.objects.values_list('pk', flat=True)), {bad.pk, recent.pk}
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AchievementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='pw')
+        self.profile = self.user.studentprofile
+
+    def test_rolled_back_award_is_not_cached(self):
+        self.profile.timed_challenges_completed = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.assertTrue(evaluate(self.profile, fields=['timed_challenges_completed']))
+                    raise RuntimeError('batch failed')
+            except RuntimeError:
+                pass
+
+        self.assertFalse(Achievement.objects.filter(user=self.user).exists())
+        self.assertFalse(cache.get(earned_achievements_key(self.user.id)))
+
+    def test_award_counts_only_inserted_rows(self):
+        other = User.objects.create_user('other', password='pw')
+        rule = RULES['first_timed_challenge']
+        Achievement.objects.create(
+            user=self.user, achievement_type='first_timed_challenge', title='Time Attacker', xp_reward=50,
+        )
+
+        # The student who already has it is skipped by ignore_conflicts
+        self.assertEqual(_award([rule.build(self.user.id, 1), rule.build(other.id, 1)]), 1)
+        self.assertEqual(Achievement.objects.filter(achievement_type='first_timed_challenge').count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+
+    def add_activities(self, count, days_ago=400):
+        created_at = timezone.now() - timezone.timedelta(days=days_ago)
+        for i in range(count):
+            activity = Activity.objects.create(user=self.user, activity_type='quiz', title=f'Quiz {i}', xp_earned=10)
+            Activity.objects.filter(pk=activity.pk).update(created_at=created_at)
+
+    def test_each_chunk_adds_a_block_without_rewriting_the_archive(self):
+        self.add_activities(5)
+        call_command('archive_activities', days=180, chunk_size=3, stdout=StringIO())
+
+        archive = ActivityArchive.objects.get(user=self.user)
+        self.assertEqual(archive.chunks.count(), 2)
+        self.assertEqual(archive.activity_count, 5)
+        self.assertEqual(archive.xp_earned, 50)
+        self.assertEqual(sorted(entry['title'] for entry in archive.entries()), [f'Quiz {i}' for i in range(5)])
+        self.assertFalse(Activity.objects.filter(user=self.user).exists())
+
+    def test_chunk_invalidates_the_dashboard_once_per_user(self):
+        self.add_activities(4)
+        cache.set(dashboard_summary_key(self.user.id), 'stale')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('archive_activities', days=180, stdout=StringIO())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(dashboard_summary_key(self.user.id)))
+
+
+class ActivityCalendarTests(SimpleTestCase):
+    def calendar(self, *days):
+        calendar = ActivityCalendar(start_date=date(2024, 12, 30))
+        for day in days:
+            calendar.mark(day)
+        return calendar
+
+    def test_mark_sets_each_day_once(self):
+        calendar = self.calendar()
+        self.assertTrue(calendar.mark(date(2024, 12, 31)))
+        self.assertFalse(calendar.mark(date(2024, 12, 31)))
+        self.assertTrue(calendar.is_active(date(2024, 12, 31)))
+        self.assertFalse(calendar.is_active(date(2024, 12, 30)))
+        self.assertEqual(calendar.active_days(), 1)
+
+    def test_mark_before_the_origin_moves_it_back(self):
+        calendar = self.calendar(date(2025, 1, 2), date(2024, 12, 30))
+        self.assertTrue(calendar.mark(date(2024, 12, 20)))
+
+        self.assertEqual(calendar.start_date, date(2024, 12, 20))
+        self.assertEqual(
+            [day for day in (date(2024, 12, 20), date(2024, 12, 30), date(2025, 1, 2)) if calendar.is_active(day)],
+            [date(2024, 12, 20), date(2024, 12, 30), date(2025, 1, 2)],
+        )
+        self.assertEqual(calendar.active_days(), 3)
+        self.assertFalse(calendar.is_active(date(2024, 12, 19)))
+
+    def test_current_streak_runs_across_the_new_year(self):
+        calendar = self.calendar(date(2024, 12, 30), date(2024, 12, 31), date(2025, 1, 1), date(2025, 1, 2))
+
+        self.assertEqual(calendar.current_streak(date(2025, 1, 2)), 4)
+        # Today not marked yet: the run ending yesterday still counts
+        self.assertEqual(calendar.current_streak(date(2025, 1, 3)), 4)
+        self.assertEqual(calendar.current_streak(date(2025, 1, 4)), 0)
+        self.assertEqual(calendar.current_streak(date(2024, 12, 1)), 0)
+
+    def test_current_streak_stops_at_a_gap(self):
+        calendar = self.calendar(date(2024, 12, 30), date(2025, 1, 1), date(2025, 1, 2))
+        self.assertEqual(calendar.current_streak(date(2025, 1, 2)), 2)
+
+    def test_longest_streak_picks_the_longest_run(self):
+        calendar = self.calendar(
+            date(2024, 12, 30), date(2024, 12, 31), date(2025, 1, 1),
+            date(2025, 1, 5), date(2025, 1, 6),
+        )
+        self.assertEqual(calendar.longest_streak(), 3)
+        self.assertEqual(self.calendar().longest_streak(), 0)
+
+    def test_heatmap_covers_days_before_the_origin(self):
+        calendar = self.calendar(date(2024, 12, 31), date(2025, 1, 2))
+
+        heatmap = calendar.heatmap(date(2025, 1, 2), days=6)
+
+        self.assertEqual(heatmap, [
+            (date(2024, 12, 28), False),
+            (date(2024, 12, 29), False),
+            (date(2024, 12, 30), False),
+            (date(2024, 12, 31), True),
+            (date(2025, 1, 1), False),
+            (date(2025, 1, 2), True),
+        ])
+        # Days after the last mark are inactive
+        self.assertEqual(calendar.heatmap(date(2025, 1, 4), days=3)[0], (date(2025, 1, 2), True))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ActivityCalendarSeedingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+
+    def test_first_load_seeds_past_days_and_leaves_today_to_update_streak(self):
+        for days_ago in (0, 1, 2):
+            activity = Activity.objects.create(user=self.user, activity_type='quiz', title='Quiz')
+            Activity.objects.filter(pk=activity.pk).update(
+                created_at=timezone.now() - timezone.timedelta(days=days_ago)
+            )
+
+        calendar = ActivityCalendar.for_user(self.user.id)
+        today = timezone.localdate()
+        self.assertFalse(calendar.is_active(today))
+        self.assertTrue(calendar.is_active(today - timezone.timedelta(days=2)))
+
+        self.assertTrue(self.user.studentprofile.update_streak())
+        profile = StudentProfile.objects.get(user=self.user)
+        self.assertEqual(profile.current_streak, 3)
+        self.assertIsNotNone(profile.last_activity)
+        self.assertFalse(self.user.studentprofile.update_streak())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DirtyFieldsSaveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+
+    def test_unchanged_save_runs_no_queries(self):
+        profile = StudentProfile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_single_field_save_updates_only_that_column(self):
+        profile = StudentProfile.objects.get(user=self.user)
+        profile.university = 'Makerere'
+        with CaptureQueriesContext(connection) as queries:
+            profile.save()
+
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        assignments = sql.split(' SET ')[1].split(' WHERE ')[0]
+        self.assertEqual(
+            sorted(column.split(' = ')[0] for column in assignments.split(', ')),
+            ['"university"', '"updated_at"'],
+        )
+        self.assertEqual(StudentProfile.objects.get(pk=profile.pk).university, 'Makerere')
+
+    def test_user_save_does_not_touch_the_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual([q['sql'].split()[0] for q in queries], ['UPDATE'])
+
+        # A loaded but unchanged profile isn't written either
+        user.studentprofile
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse(any('core_studentprofile' in q['sql'] for q in queries))
+
+    def test_save_of_a_deleted_row_raises(self):
+        profile = StudentProfile.objects.get(user=self.user)
+        StudentProfile.objects.filter(pk=profile.pk).delete()
+        profile.university = 'Makerere'
+        with self.assertRaises(DatabaseError):
+            profile.save()
+
+    def test_submit_timed_results_only_increments_the_challenge_counter(self):
+        self.client.force_login(self.user)
+        # session, user, savepoint, attempt, profile, counter update, refresh,
+        # earned achievements, first-challenge award, outbox event, release
+        with self.assertNumQueries(11), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('quizzes:submit_timed_results'),
+                data=json.dumps({'score': 7, 'total_questions': 10, 'time_taken': 95}),
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.json(), {'success': True, 'xp_earned': 70})
+        profile_writes = [
+            q['sql'] for q in queries
+            if 'core_studentprofile' in q['sql'] and not q['sql'].startswith('SELECT')
+        ]
+        # XP is left to the gamification worker; the profile row is never saved whole
+        self.assertEqual(len(profile_writes), 1)
+        self.assertIn('SET "timed_challenges_completed" = ', profile_writes[0])
+        self.assertNotIn('"total_xp"', profile_writes[0])
+        self.assertEqual(GamificationEvent.objects.get(user=self.user).payload['xp'], 70)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class XPRankIndexTests(TestCase):
+    def setUp(self):
+        self.profiles = [User.objects.create_user(f'rank{i}', password='pw').studentprofile for i in range(5)]
+
+    def assertRanksMatchProfiles(self):
+        for profile in StudentProfile.objects.all():
+            above = StudentProfile.objects.filter(total_xp__gt=profile.total_xp).count()
+            self.assertEqual(profile.get_rank(), above + 1, profile.user.username)
+
+    def test_ranks_follow_xp_up_and_down_with_ties(self):
+        for profile, amount in zip(self.profiles, [300, 120, 300, 5, 1200]):
+            profile.add_xp(amount)
+        self.assertRanksMatchProfiles()
+        ranks = [profile.get_rank() for profile in self.profiles]
+        self.assertEqual(ranks[0], ranks[2])  # equal XP shares a rank
+
+        # XP going down moves a student below the ones they had passed
+        self.profiles[4].add_xp(-1150)
+        self.profiles[0].add_xp(-300)
+        self.assertRanksMatchProfiles()
+
+        self.profiles[1].user.delete()
+        self.assertRanksMatchProfiles()
+        # The root node counts every indexed profile
+        self.assertEqual(XPRankIndex.objects.get(position=XPRankIndex.SIZE).count, StudentProfile.objects.count())
+
+    def test_incremental_updates_agree_with_a_rebuild(self):
+        for profile, amount in zip(self.profiles, [50, 2 ** 21, 50, 7, 999]):
+            profile.add_xp(amount)
+        self.profiles[2].add_xp(-20)
+        incremental = dict(XPRankIndex.objects.exclude(count=0).values_list('position', 'count'))
+
+        XPRankIndex.rebuild()
+
+        self.assertEqual(dict(XPRankIndex.objects.values_list('position', 'count')), incremental)
+
+    def test_record_updates_existing_nodes_in_one_statement(self):
+        XPRankIndex.record(new_xp=10)
+        XPRankIndex.record(new_xp=20)
+
+        with CaptureQueriesContext(connection) as queries:
+            XPRankIndex.record(old_xp=10, new_xp=20)
+
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(XPRankIndex.count_above(10), StudentProfile.objects.filter(total_xp__gt=10).count() + 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class XPLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+        self.profile = self.user.studentprofile
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_xp', *args, stdout=out)
+        return out.getvalue()
+
+    def test_add_xp_writes_one_ledger_row_per_change(self):
+        self.profile.add_xp(50, source='welcome')
+        self.profile.add_xp(980, source='quiz')
+        self.profile.add_xp(-30)
+        self.profile.add_xp(0)
+
+        self.assertEqual(
+            list(XPTransaction.objects.filter(user=self.user).order_by('id').values_list('source', 'amount')),
+            [('welcome', 50), ('quiz', 980), ('other', -30)],
+        )
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_xp, 1000)
+        self.assertEqual(self.profile.level, 2)
+        self.assertIn('All profiles match the ledger', self.reconcile())
+
+    def test_ledger_row_rolls_back_with_the_xp_change(self):
+        with mock.patch.object(XPRankIndex, 'record', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.profile.add_xp(50)
+
+        self.assertFalse(XPTransaction.objects.exists())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_xp, 0)
+
+    def test_reconcile_reports_drift_and_fix_rewrites_from_the_ledger(self):
+        self.profile.add_xp(1500, source='quiz')
+        StudentProfile.objects.filter(pk=self.profile.pk).update(total_xp=99, level=1)
+        seeded = User.objects.create_user('seeded', password='pw')
+        StudentProfile.objects.filter(user=seeded).update(total_xp=700)
+
+        report = self.reconcile()
+        self.assertIn(f'{self.user.id}: profile has 99 XP, ledger 1500 XP', report)
+        self.assertIn('1 profiles differ from the ledger, 1 need an opening balance', report)
+        # A report alone changes nothing
+        self.assertEqual(StudentProfile.objects.get(pk=self.profile.pk).total_xp, 99)
+        self.assertFalse(XPTransaction.objects.filter(user=seeded).exists())
+
+        self.assertIn('Fixed 1 profiles, 1 opening balances', self.reconcile('--fix', '--chunk-size', '1'))
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_xp, self.profile.level), (1500, 2))
+        self.assertEqual(
+            list(XPTransaction.objects.filter(user=seeded).values_list('source', 'amount')),
+            [('opening_balance', 700)],
+        )
+        self.assertEqual(StudentProfile.objects.get(user=seeded).get_rank(), 2)
+        self.assertIn('All profiles match the ledger', self.reconcile())
+
+    def test_admin_cannot_add_change_or_delete_ledger_rows(self):
+        self.profile.add_xp(50)
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_superuser('admin', password='pw')
+        model_admin = admin_site._registry[XPTransaction]
+        row = XPTransaction.objects.get()
+
+        self.assertFalse(model_admin.has_add_permission(request))
+        self.assertFalse(model_admin.has_change_permission(request, row))
+        self.assertFalse(model_admin.has_delete_permission(request, row))
+        self.assertTrue(model_admin.has_view_permission(request, row))
+        self.assertEqual(
+            set(model_admin.get_readonly_fields(request, row)),
+            {field.name for field in XPTransaction._meta.fields} - {'id'},
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', password='pw')
+        self.profile = self.user.studentprofile
+
+    def cached_summary(self):
+        dashboard.get_summary(self.user, self.profile)
+        return cache.get(dashboard_summary_key(self.user.id))
+
+    def assertWriteForgetsSummary(self, write):
+        self.assertIsNotNone(self.cached_summary())
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+            # Not before the write commits, or a concurrent load could cache old data
+            self.assertIsNotNone(cache.get(dashboard_summary_key(self.user.id)))
+        self.assertIsNone(cache.get(dashboard_summary_key(self.user.id)))
+
+    def test_xp_session_and_activity_writes_forget_the_summary(self):
+        other = User.objects.create_user('other', password='pw').studentprofile
+        other.add_xp(100)
+        self.assertEqual(self.cached_summary()['user_rank'], 2)
+
+        self.assertWriteForgetsSummary(lambda: self.profile.add_xp(500))
+        self.assertEqual(self.cached_summary()['user_rank'], 1)
+
+        session = StudySession.objects.create(user=self.user)
+        self.assertWriteForgetsSummary(lambda: StudySession.objects.create(user=self.user))
+        self.assertWriteForgetsSummary(session.delete)
+
+        self.assertWriteForgetsSummary(
+            lambda: Activity.objects.create(user=self.user, activity_type='quiz', title='Quiz')
+        )
+        self.assertEqual([a.title for a in self.cached_summary()['recent_activities']], ['Quiz'])
+        self.assertWriteForgetsSummary(lambda: Activity.objects.filter(user=self.user).delete())
+
+    def test_gamification_worker_forgets_the_summary(self):
+        GamificationEvent.publish(
+            self.user, 'quiz_completed', xp=10, source='quiz',
+            activity={'activity_type': 'quiz', 'title': 'Quiz'},
+        )
+        self.assertWriteForgetsSummary(process_batch)
+
+    def test_other_users_writes_leave_the_summary_cached(self):
+        other = User.objects.create_user('other', password='pw')
+        self.assertIsNotNone(self.cached_summary())
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(user=other, activity_type='quiz', title='Quiz')
+        self.assertIsNotNone(cache.get(dashboard_summary_key(self.user.id)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StudyRollupTests(TestCase):
+    TODAY = date(2025, 1, 8)  # a Wednesday; the week started on the 6th
+
+    def setUp(self):
+        self.user = User.objects.create_user('student', password='pw')
+        other = User.objects.create_user('other', password='pw')
+        # (user, day, minutes, xp): two sessions some days, and one last week
+        for user, day, minutes, xp in [
+            (self.user, 8, 25, 30), (self.user, 8, 40, 45), (self.user, 7, 15, 10),
+            (self.user, 6, 60, 80), (self.user, 3, 90, 100), (other, 8, 5, 5),
+        ]:
+            self.end_session(user, timezone.make_aware(datetime(2025, 1, day, 12)), minutes, xp)
+        # Still running: counts nowhere
+        StudySession.objects.create(user=self.user)
+
+    def end_session(self, user, start_time, minutes, xp):
+        session = StudySession.objects.create(user=user)
+        StudySession.objects.filter(pk=session.pk).update(
+            start_time=start_time,
+            end_time=start_time + timezone.timedelta(minutes=minutes),
+            duration_minutes=minutes,
+            xp_earned=xp,
+        )
+        session.refresh_from_db()
+        StudyDailyRollup.record(session)
+
+    def expected_totals(self):
+        """The same totals aggregated straight from the sessions"""
+        week_start = self.TODAY - timezone.timedelta(days=self.TODAY.weekday())
+        totals = StudySession.objects.filter(user=self.user, end_time__isnull=False).aggregate(
+            today_minutes=Sum('duration_minutes', filter=Q(start_time__date=self.TODAY)),
+            week_minutes=Sum('duration_minutes', filter=Q(start_time__date__gte=week_start)),
+            total_minutes=Sum('duration_minutes'),
+            total_sessions=Count('id'),
+            total_xp=Sum('xp_earned'),
+        )
+        return {name: value or 0 for name, value in totals.items()}
+
+    def test_recorded_sessions_match_a_direct_aggregate(self):
+        totals = StudyDailyRollup.totals(self.user.id, today=self.TODAY)
+
+        self.assertEqual(totals, self.expected_totals())
+        self.assertEqual(totals['today_minutes'], 65)
+        self.assertEqual(totals['week_minutes'], 140)
+        self.assertEqual(StudyDailyRollup.objects.get(user=self.user, date=self.TODAY).sessions, 2)
+
+    def test_backfill_rebuilds_the_same_rollups(self):
+        recorded = set(StudyDailyRollup.objects.values_list('user_id', 'date', 'minutes', 'sessions', 'xp'))
+        StudyDailyRollup.objects.filter(user=self.user, date=self.TODAY).update(minutes=0)
+
+        call_command('backfill_study_rollups', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            set(StudyDailyRollup.objects.values_list('user_id', 'date', 'minutes', 'sessions', 'xp')), recorded
+        )
+        self.assertEqual(StudyDailyRollup.totals(self.user.id, today=self.TODAY), self.expected_totals())
+
+    def test_totals_are_zero_without_sessions(self):
+        StudyDailyRollup.objects.all().delete()
+        self.assertEqual(set(StudyDailyRollup.totals(self.user.id).values()), {0})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LeaderboardRefreshTests(TestCase):
+    def setUp(self):
+        for name, xp in [('ann', 50), ('ben', 80), ('cat', 50), ('dan', 10)]:
+            user = User.objects.create_user(name, password='pw')
+            StudentProfile.objects.filter(user=user).update(total_xp=xp)
+
+    def test_ranks_every_student_with_shared_ranks_for_ties(self):
+        snapshot = refresh_snapshot(chunk_size=3)
+
+        self.assertEqual(snapshot, current_snapshot())
+        self.assertEqual(snapshot.total_entries, 4)
+        self.assertEqual(
+            [(e.position, e.rank, e.username) for e in snapshot.entries.all()],
+            [(1, 1, 'ben'), (2, 2, 'ann'), (3, 2, 'cat'), (4, 4, 'dan')],
+        )
+        self.assertFalse(LeaderboardRefreshLock.objects.exists())
+
+    def test_new_snapshot_replaces_the_old_one(self):
+        old = refresh_snapshot()
+        StudentProfile.objects.filter(user__username='dan').update(total_xp=100)
+        new = refresh_snapshot()
+
+        self.assertFalse(LeaderboardSnapshot.objects.filter(pk=old.pk).exists())
+        self.assertEqual(new.entries.get(position=1).username, 'dan')
+
+    def test_refresh_is_skipped_while_another_holds_the_lock(self):
+        LeaderboardRefreshLock.objects.create(name=REFRESH_LOCK_NAME, acquired_at=timezone.now())
+
+        self.assertIsNone(refresh_snapshot())
+        self.assertFalse(LeaderboardSnapshot.objects.exists())
+
+    def test_lock_left_by_a_crashed_refresh_expires(self):
+        LeaderboardRefreshLock.objects.create(
+            name=REFRESH_LOCK_NAME,
+            acquired_at=timezone.now() - timezone.timedelta(seconds=REFRESH_LOCK_TIMEOUT + 1),
+        )
+
+        self.assertIsNotNone(refresh_snapshot())
+        self.assertFalse(LeaderboardRefreshLock.objects.exists())
+
+    def test_failed_refresh_leaves_no_partial_snapshot(self):
+        with mock.patch.object(LeaderboardEntry.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                refresh_snapshot(chunk_size=2)
+
+        self.assertFalse(LeaderboardSnapshot.objects.exists())
+        self.assertFalse(LeaderboardRefreshLock.objects.exists())
+
+
+@unittest.skipIf(fcntl is None, 'cross-process coalescing needs fcntl')
+class SingleFlightSweepTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.calls = SingleFlight('test', directory=self.directory, wait_timeout=1.0)
+
+    def age_files(self, seconds):
+        past = time.time() - seconds
+        for name in os.listdir(self.directory):
+            os.utime(os.path.join(self.directory, name), (past, past))
+
+    def test_sweep_removes_old_results_and_unheld_locks(self):
+        self.assertEqual(self.calls.do('question', lambda: 'answer'), ('answer', False))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+        self.assertEqual(self.calls.sweep(), 0)
+        self.age_files(10)
+        self.assertEqual(self.calls.sweep(), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_sweep_keeps_held_locks(self):
+        self.calls.do('question', lambda: 'answer')
+        self.age_files(10)
+        lock_path = next(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.lock')
+        )
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.assertEqual(self.calls.sweep(), 1)
+        self.assertTrue(os.path.exists(lock_path))
+
+    def test_leader_sweeps_when_due(self):
+        self.calls.sweep_interval = 0
+        self.calls.do('old question', lambda: 'answer')
+        self.age_files(10)
+        self.calls.do('new question', lambda: 'answer')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+@unittest.skipIf(fcntl is None, 'cross-process coalescing needs fcntl')
+class SingleFlightDirectoryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.parent = directory.name
+
+    def test_new_directory_is_private_and_results_are_json(self):
+        path = os.path.join(self.parent, 'calls')
+        calls = SingleFlight('test', directory=path)
+        self.assertEqual(calls.do('question', lambda: 'answer'), ('answer', False))
+
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o700)
+        result, = [name for name in os.listdir(path) if name.endswith('.result')]
+        with open(os.path.join(path, result)) as f:
+            self.assertEqual(json.load(f), 'answer')
+
+    def test_results_that_are_not_json_are_not_written(self):
+        calls = SingleFlight('test', directory=self.parent)
+        value = object()
+        self.assertIs(calls.do('question', lambda: value)[0], value)
+        self.assertFalse([name for name in os.listdir(self.parent) if name.endswith('.result')])
+
+    def test_shared_or_linked_directory_is_not_used(self):
+        shared = os.path.join(self.parent, 'shared')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        link = os.path.join(self.parent, 'link')
+        os.symlink(self.parent, link)
+
+        for path in (shared, link):
+            with self.subTest(path=path), mock.patch('builtins.print'):
+                calls = SingleFlight('test', directory=path)
+                self.assertEqual(calls.do('question', lambda: 'answer'), ('answer', False))
+                self.assertEqual(os.listdir(shared), [])
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def answer_cache(self, **options):
+        # Stores are shared per cache name, so each test gets its own
+        return AnswerCache(self.id(), {'OPTIONS': {'MAX_ENTRIES': 3, **options}})
+
+    def test_least_recently_used_entry_is_evicted_first(self):
+        answers = self.answer_cache()
+        for key in 'abc':
+            answers.set(key, key.upper())
+        answers.get('a')  # now more recent than b
+        answers.set('d', 'D')
+
+        self.assertIsNone(answers.get('b'))
+        self.assertEqual([answers.get(key) for key in 'acd'], ['A', 'C', 'D'])
+        self.assertEqual(answers.stats()['evictions'], 1)
+
+    def test_byte_budget_evicts_old_entries_and_skips_oversized_ones(self):
+        reply = 'x' * 400
+        size = len(pickle.dumps(reply, AnswerCache.pickle_protocol))
+        answers = self.answer_cache(MAX_BYTES=size * 2)
+        answers.set('a', reply)
+        answers.set('b', reply)
+        answers.set('c', reply)
+
+        self.assertFalse(answers.has_key('a'))
+        self.assertEqual(answers.stats()['bytes'], size * 2)
+
+        answers.set('huge', 'x' * size * 3)
+        self.assertFalse(answers.has_key('huge'))
+        self.assertEqual(answers.stats()['entries'], 2)
+
+    def test_entries_expire_after_their_timeout(self):
+        answers = self.answer_cache()
+        answers.set('a', 'A', timeout=60)
+        answers.set('b', 'B', timeout=None)
+        later = time.time() + 61
+
+        with mock.patch('core.answer_cache.time.time', return_value=later):
+            self.assertIsNone(answers.get('a'))
+            self.assertEqual(answers.get('b'), 'B')
+            self.assertTrue(answers.add('a', 'A2'))
+        self.assertEqual(answers.stats()['bytes'], sum(
+            len(pickle.dumps(value, AnswerCache.pickle_protocol)) for value in ('A2', 'B')
+        ))
+
+    def test_stats_count_hits_misses_and_contents(self):
+        answers = self.answer_cache()
+        answers.set('a', 'A')
+        answers.get('a')
+        answers.get('a')
+        answers.get('missing')
+
+        stats = answers.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['entries']), (2, 1, 0, 1))
+        answers.clear()
+        self.assertEqual((answers.stats()['entries'], answers.stats()['bytes']), (0, 0))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_half_open_trial_that_never_reports_back_expires(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()  # a new trial instead of staying shut for good
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+def make_guard(deadline=1.0, max_in_flight=1):
+    return Guard(
+        rate=100, burst=100, deadline=deadline, max_in_flight=max_in_flight,
+        failure_threshold=1, reset_timeout=60,
+    )
+
+
+class GuardTests(SimpleTestCase):
+    def test_call_past_its_deadline_keeps_its_slot_until_it_returns(self):
+        guard = make_guard(deadline=0.05)
+        with self.assertRaises(DeadlineExceeded):
+            guard.call(lambda: time.sleep(0.3))
+        with self.assertRaises(Overloaded):
+            guard.shedder.acquire()
+
+        time.sleep(0.4)
+        guard.shedder.acquire()
+        guard.shedder.release()
+
+
+class SlowStreamClient:
+    def stream(self, question, context=None):
+        yield 'first'
+        time.sleep(0.2)
+        yield 'second'
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChatbotStreamTests(SimpleTestCase):
+    def test_abandoned_half_open_stream_counts_as_a_failure(self):
+        guard = make_guard()
+        guard.breaker.state = CircuitBreaker.HALF_OPEN
+        guard.breaker._trial_started_at = time.monotonic() - 60
+
+        async def read_first_chunk_and_leave():
+            stream = core_views._stream_reply(SlowStreamClient(), 'what is shock?')
+            first = await stream.__anext__()
+            await stream.aclose()
+            return first
+
+        with mock.patch.object(core_views, 'chatbot_guard', guard):
+            self.assertIn('first', asyncio.run(read_first_chunk_and_leave()))
+
+        self.assertEqual(guard.breaker.state, CircuitBreaker.OPEN)
+        guard.shedder.acquire()  # the slot came back
+
+    def test_failed_content_lookup_falls_back_to_the_llm(self):
+        request = RequestFactory().post(
+            '/chatbot/stream/', {'message': 'what is shock?'}, content_type='application/json'
+        )
+        request.user = AnonymousUser()
+        client = mock.Mock()
+        client.stream.return_value = iter(['Shock is circulatory failure.'])
+
+        async def read_stream():
+            response = await core_views.chatbot_stream(request)
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        with mock.patch.object(core_views, 'lookup_platform_content', side_effect=EOFError('truncated index')), \
+                mock.patch.object(core_views, 'get_cached_answer', return_value=None), \
+                mock.patch.object(core_views, 'store_cached_answer'), \
+                mock.patch.object(core_views, 'get_llm_client', return_value=client), \
+                mock.patch.object(core_views, 'chatbot_guard', make_guard()), \
+                mock.patch('builtins.print'):
+            body = asyncio.run(read_stream())
+
+        client.stream.assert_called_once_with('what is shock?', None)
+        self.assertIn('Shock is circulatory failure.', body)
+        self.assertIn('event: done', body)
+
+
+RETRIEVAL_PASSAGES = [
+    Passage('case-choice:1', 'Tension pneumothorax: Perform needle decompression',
+            'Correct! Tension pneumothorax is life-threatening and needs immediate decompression.'),
+    Passage('anatomy:1', 'Heart', 'A muscular organ that pumps blood through the circulatory system.'),
+    Passage('anatomy:2', 'Femur', 'The longest bone of the body, connecting the hip to the knee.'),
+    Passage('quiz-question:1', 'What does insulin do?', 'Insulin lowers blood glucose by promoting uptake into cells.'),
+]
+
+
+@unittest.skipIf(np is None, 'retrieval needs numpy and scipy')
+@override_settings(CACHES=LOCMEM_CACHES)
+class RetrievalTests(TestCase):
+    def setUp(self):
+        index = RetrievalIndex.build(RETRIEVAL_PASSAGES)
+        patcher = mock.patch('core.retrieval.get_index', return_value=index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_case_content_is_only_context(self):
+        self.assertEqual(search('What is tension pneumothorax?')[0].passage.source, 'case-choice:1')
+
+        reply, context = lookup('What is tension pneumothorax?')
+
+        self.assertIsNone(reply)
+        self.assertIn('needle decompression', context)
+
+    def test_explanatory_content_answers_directly(self):
+        reply, context = lookup('What is the femur?')
+
+        self.assertEqual(reply, RETRIEVAL_PASSAGES[2].text)
+        self.assertIsNone(context)
+
+    def test_content_changes_mark_the_index_stale(self):
+        system = AnatomySystem.objects.create(name='Skeletal', description='Bones')
+        with self.captureOnCommitCallbacks(execute=True):
+            AnatomyStructure.objects.create(
+                system=system, name='Tibia', description='Shin bone', function='Bears weight', location='Leg',
+            )
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(RETRIEVAL_INDEX_PATH=os.path.join(directory, 'index.pkl')):
+            index = rebuild_if_stale()
+            self.assertEqual([p.title for p in index.passages], ['Tibia'])
+            self.assertIsNone(rebuild_if_stale())
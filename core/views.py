@@ -3,14 +3,28 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F
 from django.utils import timezone
-from django.http import JsonResponse
-from .models import StudentProfile, Achievement, Activity, StudySession
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from .models import StudentProfile, Achievement, Activity, StudySession, StudyDailyRollup, GamificationEvent
 from .forms import StudentRegistrationForm, StudentProfileForm, UserUpdateForm
+from .dashboard import get_summary as get_dashboard_summary, get_leaderboard as get_dashboard_leaderboard
+from .llm import get_client as get_llm_client, LLMConfigurationError
+from .answer_cache import answer_key, get_answer as get_cached_answer, store_answer as store_cached_answer
+from .singleflight import SingleFlight
+from .sse import sse_message
+from .retrieval import lookup as lookup_platform_content
+from .resilience import Guard, KeyedTokenBuckets, Rejected, RateLimited, DeadlineExceeded
+from .leaderboard import (
+    current_snapshot as current_leaderboard_snapshot,
+    get_page as get_leaderboard_page,
+    get_window as get_leaderboard_window,
+    get_podium as get_leaderboard_podium,
+)
 from cases.models import Case
 from django.contrib.auth.models import User
-import google.generativeai as genai
 from django.conf import settings 
 import json
 import asyncio
@@ -44,10 +58,9 @@ def register(request):
             # Add welcome XP
             try:
                 profile = user.studentprofile
-                profile.add_xp(50)
             except StudentProfile.DoesNotExist:
-                # profile = StudentProfile.objects.create(user=user)
-                profile.add_xp(50)
+                profile = StudentProfile.objects.create(user=user)
+            profile.add_xp(50, source='welcome')
             
             # Authenticate and login
             username = form.cleaned_data.get('username')
@@ -77,7 +90,7 @@ def profile_setup(request):
             user_form.save()
             profile_form.save()
             profile.is_profile_complete = True
-            profile.save()
+            profile.save(update_fields=['is_profile_complete', 'updated_at'])
             
             # Create profile completion activity
             Activity.objects.create(
@@ -87,7 +100,7 @@ def profile_setup(request):
                 description='Successfully completed your student profile',
                 xp_earned=25
             )
-            profile.add_xp(25)
+            profile.add_xp(25, source='profile')
             
             messages.success(request, 'Your profile has been set up successfully!')
             return redirect('dashboard')
@@ -109,55 +122,32 @@ def dashboard(request):
     except StudentProfile.DoesNotExist:
         profile = StudentProfile.objects.create(user=request.user)
     
-    # Update streak and create login activity
-    profile.update_streak()
+    summary = get_dashboard_summary(request.user, profile)
     
-    # Create daily login activity (only once per day)
-    today = timezone.now().date()
-    login_today = Activity.objects.filter(
-        user=request.user,
-        activity_type='login',
-        created_at__date=today
-    ).exists()
-    
-    if not login_today:
-        Activity.objects.create(
-            user=request.user,
-            activity_type='login',
-            title='Daily Login',
-            description=f'Logged in on {today.strftime("%B %d, %Y")}',
-            xp_earned=5
-        )
-        profile.add_xp(5)
-    
-    # Get recent activities
-    recent_activities = Activity.objects.filter(user=request.user)[:5]
-    
-    # Get recent achievements
-    recent_achievements = Achievement.objects.filter(user=request.user)[:3]
-    
-    # Get leaderboard (top 10 users by XP)
-    leaderboard = StudentProfile.objects.select_related('user').order_by('-total_xp')[:10]
-    
-    # Calculate user rank
-    user_rank = profile.get_rank()
-    
-    # Get study stats
-    today_sessions = StudySession.objects.filter(
-        user=request.user,
-        start_time__date=today
-    )
-    today_study_time = sum(session.duration_minutes for session in today_sessions)
+    # Update streak and create daily login activity (only once per day)
+    if not summary['active_today']:
+        if profile.update_streak():
+            today = summary['date']
+            Activity.objects.create(
+                user=request.user,
+                activity_type='login',
+                title='Daily Login',
+                description=f'Logged in on {today.strftime("%B %d, %Y")}',
+                xp_earned=5
+            )
+            profile.add_xp(5, source='daily_login')
+        summary = get_dashboard_summary(request.user, profile, refresh=True)
     
     context = {
         'profile': profile,
-        'recent_activities': recent_activities,
-        'recent_achievements': recent_achievements,
-        'leaderboard': leaderboard,
-        'user_rank': user_rank,
+        'recent_activities': summary['recent_activities'],
+        'recent_achievements': summary['recent_achievements'],
+        'leaderboard': get_dashboard_leaderboard(),
+        'user_rank': summary['user_rank'],
         'xp_to_next_level': profile.get_xp_to_next_level(),
         'level_progress': profile.get_level_progress(),
-        'today_study_time': today_study_time,
+        'today_study_time': summary['today_study_time'],
+        'heatmap': summary['heatmap'],
     }
     return render(request, 'core/dashboard.html', context)
 
@@ -185,7 +175,7 @@ def profile(request):
                 description='Successfully updated your profile information',
                 xp_earned=10
             )
-            profile.add_xp(10)
+            profile.add_xp(10, source='profile')
             
             messages.success(request, 'Your profile has been updated successfully!')
             return redirect('profile')
@@ -197,26 +187,46 @@ def profile(request):
     achievements = Achievement.objects.filter(user=request.user).order_by('-earned_at')
     
     # Get study statistics
-    total_sessions = StudySession.objects.filter(user=request.user).count()
-    total_study_time = sum(
-        session.duration_minutes for session in StudySession.objects.filter(user=request.user)
-    )
+    study_totals = StudyDailyRollup.totals(request.user.id)
     
     context = {
         'profile': profile,
         'profile_form': profile_form,
         'user_form': user_form,
         'achievements': achievements,
-        'total_sessions': total_sessions,
-        'total_study_time': total_study_time,
+        'total_sessions': study_totals['total_sessions'],
+        'total_study_time': study_totals['total_minutes'],
+        'week_study_time': study_totals['week_minutes'],
     }
     return render(request, 'core/profile.html', context)
 
+def _position_param(request, name):
+    """Read a keyset cursor (a snapshot position) from the query string"""
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
 @login_required
 def leaderboard(request):
-    """Leaderboard view"""
-    # Get all students ordered by XP
-    students = StudentProfile.objects.select_related('user').order_by('-total_xp')
+    """Leaderboard view served from the latest snapshot with keyset pagination"""
+    snapshot = current_leaderboard_snapshot()
+    
+    entries = None
+    around_me = request.GET.get('around') == 'me'
+    if snapshot is None:
+        # refresh_leaderboard hasn't finished its first run yet
+        around_me = False
+        entries = []
+    elif around_me:
+        entries = get_leaderboard_window(snapshot, request.user)
+    if entries is None:
+        around_me = False
+        entries = get_leaderboard_page(
+            snapshot,
+            after=_position_param(request, 'after'),
+            before=_position_param(request, 'before'),
+        )
     
     # Get current user's rank
     try:
@@ -226,7 +236,12 @@ def leaderboard(request):
         user_rank = profile.get_rank()
     
     context = {
-        'students': students,
+        'snapshot': snapshot,
+        'students': entries,
+        'podium': get_leaderboard_podium(snapshot, entries) if snapshot else [],
+        'around_me': around_me,
+        'prev_cursor': entries[0].position if entries and entries[0].position > 1 else None,
+        'next_cursor': entries[-1].position if entries and entries[-1].position < snapshot.total_entries else None,
         'user_rank': user_rank,
     }
     return render(request, 'core/leaderboard.html', context)
@@ -243,7 +258,9 @@ def start_study_session(request):
         for session in active_sessions:
             session.end_time = timezone.now()
             session.duration_minutes = int((session.end_time - session.start_time).total_seconds() / 60)
-            session.save()
+            with transaction.atomic():
+                session.save()
+                StudyDailyRollup.record(session)
         
         # Create new session
         session = StudySession.objects.create(user=request.user)
@@ -267,28 +284,33 @@ def end_study_session(request):
             )
             session.end_time = timezone.now()
             session.duration_minutes = int((session.end_time - session.start_time).total_seconds() / 60)
-            session.save()
-            
-            # Add study time to profile
-            try:
-                profile = request.user.studentprofile
-            except StudentProfile.DoesNotExist:
-                profile = StudentProfile.objects.create(user=request.user)
-            
-            profile.total_study_time += session.duration_minutes
-            profile.save()
-            
             # Award XP for study time (1 XP per 5 minutes)
             xp_earned = session.duration_minutes // 5
-            if xp_earned > 0:
-                profile.add_xp(xp_earned)
-                Activity.objects.create(
-                    user=request.user,
-                    activity_type='case_completed',
-                    title=f'Study Session Completed',
-                    description=f'Studied for {session.duration_minutes} minutes',
-                    xp_earned=xp_earned
+            session.xp_earned = xp_earned
+            
+            with transaction.atomic():
+                session.save()
+                StudyDailyRollup.record(session)
+                
+                # Add study time to profile
+                StudentProfile.objects.filter(user=request.user).update(
+                    total_study_time=F('total_study_time') + session.duration_minutes
                 )
+                
+                # Queue XP and activity for the gamification worker
+                if xp_earned > 0:
+                    GamificationEvent.publish(
+                        request.user,
+                        'study_session_ended',
+                        xp=xp_earned,
+                        source='study_session',
+                        activity={
+                            'activity_type': 'case_completed',
+                            'title': 'Study Session Completed',
+                            'description': f'Studied for {session.duration_minutes} minutes',
+                            'xp_earned': xp_earned,
+                        },
+                    )
             
             return JsonResponse({
                 'success': True,
@@ -301,100 +323,119 @@ def end_study_session(request):
     
     return JsonResponse({'success': False, 'message': 'Invalid request'})
 
+# Coalesces concurrent identical questions into one upstream call
+chatbot_calls = SingleFlight('chatbot', directory=settings.CHATBOT_SINGLEFLIGHT_DIR)
+
+# Fail fast when the LLM upstream is slow, failing or over its quota
+chatbot_guard = Guard(
+    rate=settings.CHATBOT_GLOBAL_RATE_PER_MINUTE / 60,
+    burst=settings.CHATBOT_GLOBAL_BURST,
+    deadline=settings.CHATBOT_DEADLINE,
+    max_in_flight=settings.CHATBOT_MAX_IN_FLIGHT,
+    failure_threshold=settings.CHATBOT_BREAKER_FAILURES,
+    reset_timeout=settings.CHATBOT_BREAKER_RESET,
+)
+chatbot_user_limits = KeyedTokenBuckets(
+    rate=settings.CHATBOT_USER_RATE_PER_MINUTE / 60,
+    capacity=settings.CHATBOT_USER_BURST,
+)
+
+def _chatbot_user_key(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.id}'
+    return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+def _chatbot_message(request):
+    """The question from either form data or a JSON body"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body).get('message', '')
+    return request.POST.get('message', '')
+
+def _lookup_platform_content(user_input):
+    """retrieval.lookup(), treating a failure (e.g. an unreadable index) as no match so the LLM answers"""
+    try:
+        return lookup_platform_content(user_input)
+    except Exception as e:
+        print(f"Platform content lookup failed: {str(e)}")
+        return None, None
+
 @csrf_exempt
 def chatbot(request):
     if request.method == 'POST':
         start_time = time.time()
         
         try:
-            # Handle both form data and JSON
-            if request.content_type == 'application/json':
-                data = json.loads(request.body)
-                user_input = data.get('message', '')
-            else:
-                user_input = request.POST.get('message', '')
+            user_input = _chatbot_message(request)
             
             if not user_input:
                 return JsonResponse({'error': 'No message provided'}, status=400)
             
-            # Configure Gemini
-            api_key = getattr(settings, 'GEMINI_API_KEY', None)
-            if not api_key:
+            # Repeated questions are answered from the cache without an API call
+            reply = get_cached_answer(user_input)
+            if reply is not None:
+                response_time = time.time() - start_time
+                print(f"Cached response time: {response_time * 1000:.1f} ms")
                 return JsonResponse({
-                    'error': 'GEMINI_API_KEY not found in settings'
-                }, status=500)
-            
-            genai.configure(api_key=api_key)
+                    'reply': reply,
+                    'response_time': f"{response_time:.2f}s",
+                    'cached': True,
+                })
             
-            # Use the fastest model for better response time
-            model = genai.GenerativeModel('gemini-1.5-flash')
+            # Questions our own cases, quizzes and anatomy content answer
+            # well need no API call; weaker matches ground the LLM's answer
+            reply, context = _lookup_platform_content(user_input)
+            if reply is not None:
+                response_time = time.time() - start_time
+                print(f"Platform content response time: {response_time * 1000:.1f} ms")
+                return JsonResponse({
+                    'reply': reply,
+                    'response_time': f"{response_time:.2f}s",
+                    'source': 'platform',
+                })
             
-            # Optimize the prompt to be more concise
-            prompt = f"Medical assistant: Answer this medical education question in 2-3 sentences: {user_input}"
+            if not chatbot_user_limits.consume(_chatbot_user_key(request)):
+                return JsonResponse({'reply': RateLimited.message}, status=429)
             
-            # Configure generation settings for faster response
-            generation_config = {
-                "temperature": 0.3,  # Lower temperature for faster, more focused responses
-                "max_output_tokens": 500,  # Limit response length
-                "top_k": 20,
-                "top_p": 0.8,
-            }
+            # Shared, already configured client (built once per process)
+            try:
+                client = get_llm_client()
+            except LLMConfigurationError as e:
+                return JsonResponse({'error': str(e)}, status=500)
+            setup_time = time.time() - start_time
             
-            # Generate response with timeout handling
+            # Generate response with timeout handling; identical questions
+            # already in flight (here or in another worker) share one call
             try:
-                response = model.generate_content(
-                    prompt,
-                    generation_config=generation_config,
-                    safety_settings=[
-                        {
-                            "category": "HARM_CATEGORY_HARASSMENT",
-                            "threshold": "BLOCK_ONLY_HIGH"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_HATE_SPEECH",
-                            "threshold": "BLOCK_ONLY_HIGH"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                            "threshold": "BLOCK_ONLY_HIGH"
-                        },
-                        {
-                            "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                            "threshold": "BLOCK_ONLY_HIGH"
-                        }
-                    ]
+                reply, shared = chatbot_calls.do(
+                    answer_key(user_input),
+                    lambda: chatbot_guard.call(lambda: client.generate(user_input, context)),
                 )
                 
                 # Check if response was blocked
-                if not response.text:
+                if not reply:
                     return JsonResponse({
                         'reply': 'I apologize, but I cannot provide a response to that question. Please try rephrasing your medical question.'
                     })
                 
-                reply = response.text.strip()
+                store_cached_answer(user_input, reply)
                 
                 # Log response time for debugging
                 response_time = time.time() - start_time
-                print(f"Response time: {response_time:.2f} seconds")
+                print(
+                    f"Response time: {response_time:.2f} seconds (setup {setup_time * 1000:.1f} ms"
+                    f"{', shared call' if shared else ''}; {chatbot_calls.stats()['saved']} calls saved)"
+                )
                 
                 return JsonResponse({
                     'reply': reply,
                     'response_time': f"{response_time:.2f}s"
                 })
                 
-            except Exception as api_error:
-                # Handle API-specific errors
-                error_msg = str(api_error)
-                if "quota" in error_msg.lower():
-                    return JsonResponse({
-                        'reply': 'Service temporarily unavailable due to high demand. Please try again in a moment.'
-                    })
-                elif "timeout" in error_msg.lower():
-                    return JsonResponse({
-                        'reply': 'Response took too long. Please try a shorter question.'
-                    })
-                else:
-                    raise api_error
+            except Rejected as rejection:
+                # Rate limited, shed, circuit open or past the deadline: fail fast
+                response_time = time.time() - start_time
+                print(f"Rejected after {response_time:.2f} seconds: {type(rejection).__name__}")
+                return JsonResponse({'reply': rejection.message}, status=503)
             
         except Exception as e:
             response_time = time.time() - start_time
@@ -405,4 +446,106 @@ def chatbot(request):
                 'response_time': f"{response_time:.2f}s"
             }, status=500)
     
-    return JsonResponse({'error': 'Invalid request method'}, status=405)
\ No newline at end of file
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+async def chatbot_stream(request):
+    """Async chatbot variant that streams the reply as Server-Sent Events"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    try:
+        user_input = _chatbot_message(request)
+    except ValueError:
+        user_input = ''
+    if not user_input:
+        return JsonResponse({'error': 'No message provided'}, status=400)
+    
+    reply = get_cached_answer(user_input)
+    context = None
+    if reply is None:
+        # Loading the index and scoring block, so keep them off the event loop
+        reply, context = await sync_to_async(_lookup_platform_content, thread_sensitive=False)(user_input)
+    if reply is not None:
+        stream = _stream_cached(reply)
+    else:
+        user_key = await sync_to_async(_chatbot_user_key)(request)
+        if not chatbot_user_limits.consume(user_key):
+            return JsonResponse({'error': RateLimited.message}, status=429)
+        try:
+            client = get_llm_client()
+        except LLMConfigurationError as e:
+            return JsonResponse({'error': str(e)}, status=500)
+        stream = _stream_reply(client, user_input, context)
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let nginx pass chunks straight through
+    return response
+
+async def _stream_cached(reply):
+    yield sse_message({'text': reply})
+    yield sse_message({'response_time': '0.00s', 'cached': True}, event='done')
+
+async def _stream_reply(client, user_input, context=None):
+    start_time = time.time()
+    
+    # The SDK stream is blocking, so each chunk is pulled in a worker thread
+    next_chunk = sync_to_async(next, thread_sensitive=False)
+    parts = []
+    first_chunk_time = None
+    try:
+        # Same protections as chatbot(); the deadline applies to every chunk
+        chatbot_guard.shedder.acquire()
+        pending = None
+        try:
+            chatbot_guard.admit()
+            completed = False
+            try:
+                chunks = client.stream(user_input, context)
+                while True:
+                    pending = asyncio.ensure_future(next_chunk(chunks, None))
+                    try:
+                        # shield() so giving up doesn't cancel the future we hand the slot to
+                        text = await asyncio.wait_for(asyncio.shield(pending), chatbot_guard.deadline)
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceeded()
+                    if text is None:
+                        break
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time() - start_time
+                    parts.append(text)
+                    yield sse_message({'text': text})
+                completed = True
+            finally:
+                # Also runs when the client goes away (GeneratorExit, CancelledError),
+                # so a half-open trial always reports back; an unfinished stream is a failure
+                if completed:
+                    chatbot_guard.breaker.record_success()
+                else:
+                    chatbot_guard.breaker.record_failure()
+        finally:
+            if pending is not None and not pending.done():
+                # The chunk's thread is still running; it keeps the slot until it returns
+                pending.add_done_callback(lambda _: chatbot_guard.shedder.release())
+            else:
+                chatbot_guard.shedder.release()
+    except Rejected as rejection:
+        response_time = time.time() - start_time
+        print(f"Stream rejected after {response_time:.2f} seconds: {type(rejection).__name__}")
+        yield sse_message({'error': rejection.message}, event='error')
+        return
+    except Exception as e:
+        response_time = time.time() - start_time
+        print(f"Stream error after {response_time:.2f} seconds: {str(e)}")
+        yield sse_message({'error': f"Medical assistant error: {str(e)}"}, event='error')
+        return
+    
+    reply = ''.join(parts).strip()
+    if reply:
+        store_cached_answer(user_input, reply)
+    else:
+        yield sse_message({'text': 'I apologize, but I cannot provide a response to that question. Please try rephrasing your medical question.'})
+    
+    response_time = time.time() - start_time
+    print(f"Stream time: {response_time:.2f} seconds (first chunk {(first_chunk_time or response_time):.2f}s)")
+    yield sse_message({'response_time': f"{response_time:.2f}s"}, event='done')
@@ -0,0 +1,16 @@
+"""
+ASGI config for mediscope project.
+
+This is the app to deploy: uvicorn mediscope.asgi:application (see README).
+The streaming chatbot and the live notification stream only stream under
+ASGI; under WSGI Django buffers the chatbot reply and the notification badge
+polls.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mediscope.settings')
+
+application = get_asgi_application()
@@ -6,11 +6,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views 
-from core.views import chatbot
+from core.views import chatbot, chatbot_stream
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('chatbot/', chatbot, name='chatbot'),
+    path('chatbot/stream/', chatbot_stream, name='chatbot_stream'),
     path('', include('core.urls')),
     path('cases/', include('cases.urls')),
     path('quizzes/', include('quizzes.urls')),
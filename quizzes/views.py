@@ -4,8 +4,9 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from .models import Quiz, QuizAttempt, QuizAnswer, Question
-from core.models import StudentProfile, Activity
+from core.models import GamificationEvent
 import json
 import random
 from core.models import TimedChallengeAttempt
@@ -53,54 +54,52 @@ def take_quiz(request, quiz_id):
         answers_data = json.loads(request.POST.get('answers', '{}'))
         time_taken = int(request.POST.get('time_taken', 0))
         
-        # Create quiz attempt
-        attempt = QuizAttempt.objects.create(
-            user=request.user,
-            quiz=quiz,
-            time_taken=time_taken,
-            max_score=sum(q.points for q in questions)
-        )
+        with transaction.atomic():
+            # Create quiz attempt
+            attempt = QuizAttempt.objects.create(
+                user=request.user,
+                quiz=quiz,
+                time_taken=time_taken,
+                max_score=sum(q.points for q in questions)
+            )
         
-        score = 0
-        for question in questions:
-            question_id = str(question.id)
-            if question_id in answers_data:
-                selected_choice_id = answers_data[question_id]['choice_id']
-                selected_choice = question.choices.get(id=selected_choice_id)
+            score = 0
+            for question in questions:
+                question_id = str(question.id)
+                if question_id in answers_data:
+                    selected_choice_id = answers_data[question_id]['choice_id']
+                    selected_choice = question.choices.get(id=selected_choice_id)
                 
-                is_correct = selected_choice.is_correct
-                if is_correct:
-                    score += question.points
+                    is_correct = selected_choice.is_correct
+                    if is_correct:
+                        score += question.points
                 
-                QuizAnswer.objects.create(
-                    attempt=attempt,
-                    question=question,
-                    selected_choice=selected_choice,
-                    is_correct=is_correct,
-                    time_taken=answers_data[question_id].get('time_taken', 0)
-                )
+                    QuizAnswer.objects.create(
+                        attempt=attempt,
+                        question=question,
+                        selected_choice=selected_choice,
+                        is_correct=is_correct,
+                        time_taken=answers_data[question_id].get('time_taken', 0)
+                    )
         
-        # Update attempt with final score
-        attempt.score = score
-        attempt.xp_earned = int((score / attempt.max_score) * quiz.xp_reward) if attempt.max_score > 0 else 0
-        attempt.save()
+            # Update attempt with final score
+            attempt.score = score
+            attempt.xp_earned = int((score / attempt.max_score) * quiz.xp_reward) if attempt.max_score > 0 else 0
+            attempt.save()
         
-        # Update student profile
-        try:
-            profile = request.user.studentprofile
-        except StudentProfile.DoesNotExist:
-            profile = StudentProfile.objects.create(user=request.user)
-        
-        profile.add_xp(attempt.xp_earned)
-        
-        # Record activity
-        Activity.objects.create(
-            user=request.user,
-            activity_type='quiz_taken',
-            title=f'Completed Quiz: {quiz.title}',
-            description=f'Scored {attempt.percentage}% on {quiz.title}',
-            xp_earned=attempt.xp_earned
-        )
+            # Queue XP and activity for the gamification worker
+            GamificationEvent.publish(
+                request.user,
+                'quiz_completed',
+                xp=attempt.xp_earned,
+                source='quiz',
+                activity={
+                    'activity_type': 'quiz_taken',
+                    'title': f'Completed Quiz: {quiz.title}',
+                    'description': f'Scored {attempt.percentage}% on {quiz.title}',
+                    'xp_earned': attempt.xp_earned,
+                },
+            )
         
         messages.success(request, f'Quiz completed! You scored {attempt.percentage}% and earned {attempt.xp_earned} XP!')
         return redirect('quizzes:quiz_result', attempt_id=attempt.id)
@@ -162,32 +161,29 @@ def submit_timed_results(request):
         # Calculate XP (10 XP per correct answer)
         xp_earned = score * 10
         
-        # Update student profile
-        try:
-            profile = request.user.studentprofile
-        except StudentProfile.DoesNotExist:
-            profile = StudentProfile.objects.create(user=request.user)
-        
-        profile.add_xp(xp_earned)
-        profile.save()
-        
-        # Record timed challenge attempt
-        TimedChallengeAttempt.objects.create(
-            user=request.user,
-            score=score,
-            total_questions=total_questions,
-            time_taken=time_taken,
-            xp_earned=xp_earned
-        )
-        
-        # Record activity
-        Activity.objects.create(
-            user=request.user,
-            activity_type='timed_challenge',
-            title='Completed Timed Challenge',
-            description=f'Scored {score}/{total_questions} in timed challenge',
-            xp_earned=xp_earned
-        )
+        with transaction.atomic():
+            # Record timed challenge attempt
+            TimedChallengeAttempt.objects.create(
+                user=request.user,
+                score=score,
+                total_questions=total_questions,
+                time_taken=time_taken,
+                xp_earned=xp_earned
+            )
+            
+            # Queue XP and activity for the gamification worker
+            GamificationEvent.publish(
+                request.user,
+                'timed_challenge',
+                xp=xp_earned,
+                source='timed_challenge',
+                activity={
+                    'activity_type': 'timed_challenge',
+                    'title': 'Completed Timed Challenge',
+                    'description': f'Scored {score}/{total_questions} in timed challenge',
+                    'xp_earned': xp_earned,
+                },
+            )
         
         return JsonResponse({
             'success': True,
@@ -32,6 +32,7 @@ django.setup()
 
 # Now import Django models
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from core.models import StudentProfile, Achievement, Activity, StudySession
 from cases.models import Case, CaseStep, Choice
 
@@ -818,6 +819,10 @@ def main():
         # Update profiles
         update_user_profiles()
         
+        # Record seeded XP in the ledger, rebuild the rank index and study rollups
+        call_command('reconcile_xp', fix=True)
+        call_command('backfill_study_rollups')
+        
         # Print summary
         print_summary()
         